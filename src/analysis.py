@@ -1,14 +1,15 @@
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-from matplotlib.widgets import Cursor
-from matplotlib.ticker import MaxNLocator, LinearLocator
-import pandas as pd
 import numpy as np
 from datetime import datetime
 
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, List, Dict, Optional
+
+# pandas and matplotlib are imported by the functions that use them, so the
+# CLI menu and the API load neither until a frame or a figure is needed.
+if TYPE_CHECKING:
+    import pandas as pd
 
 import src.database as db
+from src.downsample import downsample, downsample_series
 
 # Data Gathering #
 def get_pir_datas():
@@ -33,7 +34,7 @@ def get_idx_datas():
 
     return idx_datas
 
-def get_all_datas() -> Dict[str, pd.Series]:
+def get_all_datas() -> Dict[str, 'pd.Series']:
 
     datas = {
         'Food': db.get_series('global food index'),
@@ -45,7 +46,106 @@ def get_all_datas() -> Dict[str, pd.Series]:
 
     return datas
 
+# label: (metric, country, aggregation rule)
+ANALYSIS_SERIES = {
+    'Food': ('global food index', None, 'mean'),
+    'Energy': ('global energy index', None, 'mean'),
+    'All Commodities': ('global all commodities index', None, 'ffill'),
+    'US': ('policy interest rate', 'US', 'mean'),
+    'UK': ('policy interest rate', 'UK', 'mean'),
+}
+
+def get_aligned_datas(series: Dict[str, tuple] = ANALYSIS_SERIES, freq: str = 'MS') -> 'pd.DataFrame':
+    """
+    Load the series (one query per source table) and align them on a common
+    `freq` index.
+    `series` maps a column label to (metric, country, rule), see `align`.
+    Columns whose rule matches a stored rollup (db.ROLLUPS) are read from it
+    rather than resampled here.
+    """
+    import pandas as pd
+
+    labels = list(series.keys())
+    rolled = [label for label in labels if db.ROLLUPS.get(freq) == series[label][2]]
+    raw = [label for label in labels if label not in rolled]
+
+    parts = []
+    if rolled:
+        frame = db.get_frame([series[label][:2] for label in rolled], freq=freq)
+        frame.columns = rolled
+        parts.append(frame)
+    if raw:
+        frame = db.get_frame([series[label][:2] for label in raw])
+        frame.columns = raw
+        parts.append(align(frame, {label: series[label][2] for label in raw}, freq))
+
+    aligned = pd.concat(parts, axis=1).sort_index()
+    if len(aligned):
+        aligned = aligned.reindex(pd.date_range(aligned.index[0], aligned.index[-1], freq=freq))
+    return aligned[labels]
+
+def resolve_series(labels: List[str], rule: str = 'mean') -> Dict[str, tuple]:
+    """
+    Map labels to (metric, country, rule) for `get_aligned_datas`. A label is
+    an ANALYSIS_SERIES name, a country code (its policy interest rate), a
+    global metric name, or 'metric:country'.
+    """
+    series = {}
+    for label in labels:
+        if label in ANALYSIS_SERIES:
+            series[label] = ANALYSIS_SERIES[label]
+        elif ':' in label:
+            metric, country = label.rsplit(':', 1)
+            db.get_country_id(country)
+            db.get_metric_id(metric)
+            series[label] = (metric, country, rule)
+        else:
+            try:
+                db.get_country_id(label)
+                series[label] = ('policy interest rate', label, rule)
+            except db.UnknownNameError:
+                db.get_metric_id(label)
+                series[label] = (label, None, rule)
+    return series
+
 # Data Handling #
+def _until_last_valid(filled: 'pd.DataFrame', raw: 'pd.DataFrame') -> 'pd.DataFrame':
+    # forward filling must not run past each column's last observation
+    return filled.where(raw.bfill().notna())
+
+def align(frame: 'pd.DataFrame', rules: Dict[str, str], freq: str = 'MS') -> 'pd.DataFrame':
+    """
+    Resample a wide frame of raw observations to `freq`, column by rule:
+      'mean'  - forward fill to daily, then average each period
+                (e.g. daily policy rates to monthly means)
+      'last'  - last observation in each period
+      'ffill' - carry the latest observation forward
+                (e.g. quarterly index to monthly)
+    Columns sharing a rule are resampled together.
+    """
+    import pandas as pd
+
+    unknown = set(rules.values()) - {'mean', 'last', 'ffill'}
+    if unknown:
+        raise ValueError(f'unknown aggregation rules: {unknown}')
+
+    parts = []
+    for rule in ('mean', 'last', 'ffill'):
+        cols = [col for col in frame.columns if rules.get(col, 'mean') == rule]
+        if not cols:
+            continue
+        sub = frame[cols]
+        if rule == 'mean':
+            daily = sub.resample('D').last()
+            parts.append(_until_last_valid(daily.ffill(), daily).resample(freq).mean())
+        elif rule == 'last':
+            parts.append(sub.resample(freq).last())
+        else:
+            periodic = sub.resample(freq).last()
+            parts.append(_until_last_valid(periodic.ffill(), periodic))
+
+    return pd.concat(parts, axis=1)[list(frame.columns)]
+
 def data_to_lines(datas: List[List[tuple]]):
     lines = []
     for data in datas:
@@ -57,16 +157,399 @@ def data_to_lines(datas: List[List[tuple]]):
         lines.append(line)
     return lines
 
+# Rolling Correlation #
+# Rolling Pearson correlation from cumulative sums: every window is
+# O(n) whatever its length, and every rate x index pair is computed at once.
+# Series are centred first so the sums stay small (no cancellation).
+STATS = 6 # n, sum x, sum y, sum x^2, sum y^2, sum xy
+
+def _to_frame(datas) -> 'pd.DataFrame':
+    import pandas as pd
+
+    return datas if isinstance(datas, pd.DataFrame) else pd.DataFrame(datas)
+
+def _pair_stats(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Per-row contributions for every pair: x is (T, R), y is (T, I).
+    Returns (STATS, T, R, I). A pair only counts where both values exist.
+    """
+    x = x[:, :, None]
+    y = y[:, None, :]
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x = np.where(valid, x, 0.0)
+    y = np.where(valid, y, 0.0)
+    return np.stack([valid.astype('float64'), x, y, x * x, y * y, x * y])
+
+def _corr_from_sums(sums: np.ndarray, min_periods: int) -> np.ndarray:
+    n, sx, sy, sxx, syy, sxy = sums
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / n
+        var_x = sxx - sx * sx / n
+        var_y = syy - sy * sy / n
+        corr = cov / np.sqrt(var_x * var_y)
+    # a (near) constant window has no defined correlation
+    eps = 1e-12
+    flat = (var_x <= eps * np.maximum(sxx, 1.0)) | (var_y <= eps * np.maximum(syy, 1.0))
+    corr[(n < min_periods) | flat] = np.nan
+    return np.clip(corr, -1.0, 1.0)
+
+def rolling_corr_array(x: np.ndarray, y: np.ndarray, windows: List[int],
+                       min_periods: Optional[int] = None) -> np.ndarray:
+    """
+    Rolling correlation of every column of x (T, R) against every column
+    of y (T, I) for each window. Returns (len(windows), T, R, I); windows
+    with fewer than `min_periods` complete pairs (default: the window) are NaN.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    x = x - np.nanmean(x, axis=0)
+    y = y - np.nanmean(y, axis=0)
+
+    stats = _pair_stats(x, y)
+    # leading zero row so any window sum is cum[end] - cum[start]
+    cum = np.zeros((STATS, len(x) + 1) + stats.shape[2:])
+    np.cumsum(stats, axis=1, out=cum[:, 1:])
+
+    out = np.empty((len(windows), len(x)) + stats.shape[2:])
+    ends = np.arange(1, len(x) + 1)
+    for k, window in enumerate(windows):
+        # the first windows are partial, and count once min_periods is met
+        sums = cum[:, 1:] - cum[:, np.maximum(ends - window, 0)]
+        out[k] = _corr_from_sums(sums, min_periods or window)
+    return out
+
+def rolling_corrs(datas, rates: List[str], idxs: List[str], windows: List[int],
+                  min_periods: Optional[int] = None) -> 'pd.DataFrame':
+    """
+    Rolling correlation for every rate x index pair and window, indexed by
+    date with (window, rate, index) columns. `.stack(...)` gives long form.
+    """
+    import pandas as pd
+
+    frame = _to_frame(datas)
+    corr = rolling_corr_array(frame[rates].to_numpy(), frame[idxs].to_numpy(),
+                              windows, min_periods)
+    # (window, T, rate, index) -> (T, window, rate, index)
+    values = corr.transpose(1, 0, 2, 3).reshape(len(frame), -1)
+    columns = pd.MultiIndex.from_product([windows, rates, idxs],
+                                         names=['window', 'rate', 'index'])
+    return pd.DataFrame(values, index=frame.index, columns=columns)
+
+class RollingCorr:
+    """
+    Streaming rolling correlations: `append` one new row of rates and
+    indices and get the latest correlation for every window and pair in
+    O(1) with respect to the history length.
+    """
+    def __init__(self, windows: List[int], x_center, y_center, min_periods: Optional[int] = None):
+        self.windows = list(windows)
+        self.min_periods = min_periods
+        self.x_center = np.asarray(x_center, dtype='float64')
+        self.y_center = np.asarray(y_center, dtype='float64')
+        shape = (STATS, len(self.x_center), len(self.y_center))
+        # ring buffer of the last max(windows) + 1 row contributions
+        self.buffer = np.zeros((max(self.windows) + 1,) + shape)
+        self.count = 0
+        self.sums = np.zeros((len(self.windows),) + shape)
+        self.since_refresh = 0
+
+    @classmethod
+    def from_history(cls, x: np.ndarray, y: np.ndarray, windows: List[int],
+                     min_periods: Optional[int] = None) -> 'RollingCorr':
+        x = np.asarray(x, dtype='float64')
+        y = np.asarray(y, dtype='float64')
+        state = cls(windows, np.nanmean(x, axis=0), np.nanmean(y, axis=0), min_periods)
+        for x_row, y_row in zip(x[-len(state.buffer):], y[-len(state.buffer):]):
+            state._push(x_row, y_row)
+        state._refresh()
+        return state
+
+    def _row(self, age: int) -> np.ndarray:
+        # contribution appended `age` rows ago (0 = newest)
+        return self.buffer[(self.count - 1 - age) % len(self.buffer)]
+
+    def _push(self, x_row, y_row) -> np.ndarray:
+        x_row = np.asarray(x_row, dtype='float64')[None] - self.x_center
+        y_row = np.asarray(y_row, dtype='float64')[None] - self.y_center
+        row = _pair_stats(x_row, y_row)[:, 0]
+        self.buffer[self.count % len(self.buffer)] = row
+        self.count += 1
+        return row
+
+    def _refresh(self):
+        # exact sums from the buffer, stops add/subtract drift building up
+        for k, window in enumerate(self.windows):
+            ages = range(min(window, self.count))
+            self.sums[k] = sum((self._row(age) for age in ages), np.zeros(self.sums.shape[1:]))
+        self.since_refresh = 0
+
+    def append(self, x_row, y_row) -> np.ndarray:
+        row = self._push(x_row, y_row)
+        for k, window in enumerate(self.windows):
+            self.sums[k] += row
+            if self.count > window:
+                self.sums[k] -= self._row(window)
+
+        self.since_refresh += 1
+        if self.since_refresh >= len(self.buffer):
+            self._refresh()
+        return self.latest()
+
+    def latest(self) -> np.ndarray:
+        """Current correlation, shaped (window, rate, index)."""
+        return np.stack([
+            _corr_from_sums(self.sums[k], self.min_periods or window)
+            for k, window in enumerate(self.windows)
+        ])
+
+# Lead/Lag #
+# Correlation of each rate with each index shifted by every lag in
+# [-max_lag, max_lag]: corr(rate[t], index[t + lag]), so a positive lag
+# means the index follows the rate by `lag` periods. Every sum the Pearson
+# formula needs (pair counts included, so gaps are handled exactly) is a
+# cross-correlation of two columns, computed for all lags and pairs at once
+# with one FFT per column: O(T log T) instead of one pass per lag.
+
+def _next_pow2(n: int) -> int:
+    return 1 << max(n - 1, 0).bit_length()
+
+def _xcorr(a: np.ndarray, b: np.ndarray, max_lag: int, size: int) -> np.ndarray:
+    """
+    sum_t a[t] * b[t + lag] for every lag in [-max_lag, max_lag], for every
+    column of a (T, R) against every column of b (T, I): (2 * max_lag + 1, R, I).
+    """
+    fa = np.fft.rfft(a, size, axis=0)
+    fb = np.fft.rfft(b, size, axis=0)
+    full = np.fft.irfft(np.conj(fa)[:, :, None] * fb[:, None, :], size, axis=0)
+    # negative lags wrap to the end
+    return np.concatenate([full[size - max_lag:], full[:max_lag + 1]])
+
+def cross_corr_array(x: np.ndarray, y: np.ndarray, max_lag: int,
+                     min_periods: int = 3) -> np.ndarray:
+    """
+    Lagged correlation of every column of x (T, R) against every column of
+    y (T, I). Returns (2 * max_lag + 1, R, I), lag -max_lag first; lags with
+    fewer than `min_periods` overlapping pairs are NaN.
+    """
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    max_lag = min(max_lag, len(x) - 1)
+    x = x - np.nanmean(x, axis=0)
+    y = y - np.nanmean(y, axis=0)
+    vx = (~np.isnan(x)).astype('float64')
+    vy = (~np.isnan(y)).astype('float64')
+    x = np.nan_to_num(x)
+    y = np.nan_to_num(y)
+
+    # zero padded past T + max_lag, so no lag wraps onto another
+    size = _next_pow2(len(x) + max_lag)
+    sums = np.stack([
+        np.rint(_xcorr(vx, vy, max_lag, size)),
+        _xcorr(x, vy, max_lag, size),
+        _xcorr(vx, y, max_lag, size),
+        _xcorr(x * x, vy, max_lag, size),
+        _xcorr(vx, y * y, max_lag, size),
+        _xcorr(x, y, max_lag, size),
+    ])
+    return _corr_from_sums(sums, min_periods)
+
+def cross_corrs(datas, rates: List[str], idxs: List[str], max_lag: int = 24,
+                min_periods: int = 3) -> 'pd.DataFrame':
+    """Lagged correlations indexed by lag, with (rate, index) columns."""
+    import pandas as pd
+
+    frame = _to_frame(datas)
+    corr = cross_corr_array(frame[rates].to_numpy(), frame[idxs].to_numpy(), max_lag, min_periods)
+    lags = np.arange(-(len(corr) // 2), len(corr) // 2 + 1)
+    columns = pd.MultiIndex.from_product([rates, idxs], names=['rate', 'index'])
+    return pd.DataFrame(corr.reshape(len(lags), -1), index=pd.Index(lags, name='lag'), columns=columns)
+
+def _best(corr: np.ndarray, lags: np.ndarray):
+    # strongest correlation (either sign) along axis 0; NaN where none is defined
+    strength = np.where(np.isnan(corr), -np.inf, np.abs(corr))
+    pick = np.argmax(strength, axis=0)
+    best = np.take_along_axis(corr, pick[None], axis=0)[0]
+    lag = np.where(np.isnan(best), np.nan, lags[pick])
+    return lag, best
+
+def best_lags(datas, rates: List[str], idxs: List[str], max_lag: int = 24,
+              min_periods: int = 3) -> 'pd.DataFrame':
+    """The lag with the strongest correlation for every pair, and that correlation."""
+    import pandas as pd
+
+    corrs = cross_corrs(datas, rates, idxs, max_lag, min_periods)
+    lag, corr = _best(corrs.to_numpy(), corrs.index.to_numpy())
+    return pd.DataFrame({'lag': lag, 'corr': corr}, index=corrs.columns)
+
+def rolling_best_lag(datas, rates: List[str], idxs: List[str], window: int = 60,
+                     max_lag: int = 12, min_periods: Optional[int] = None) -> 'pd.DataFrame':
+    """
+    Best lag over time: at each date, the lag in [-max_lag, max_lag] whose
+    correlation over the trailing `window` pairs is strongest. Pairs are
+    dated by their later observation, so nothing after the date is used.
+    Columns are (stat, rate, index) with stat 'lag' or 'corr'.
+    Each lag is a cumulative-sum rolling correlation (see rolling_corr_array).
+    """
+    import pandas as pd
+
+    frame = _to_frame(datas)
+    x = frame[rates].to_numpy('float64')
+    y = frame[idxs].to_numpy('float64')
+    T = len(frame)
+
+    def shift(z: np.ndarray, periods: int) -> np.ndarray:
+        out = np.full_like(z, np.nan)
+        if periods < T:
+            out[periods:] = z[:T - periods]
+        return out
+
+    lags = np.arange(-max_lag, max_lag + 1)
+    corr = np.stack([
+        # lag >= 0: (rate[s - lag], index[s]); lag < 0: (rate[s], index[s + lag])
+        rolling_corr_array(shift(x, lag), y, [window], min_periods)[0] if lag >= 0 else
+        rolling_corr_array(x, shift(y, -lag), [window], min_periods)[0]
+        for lag in lags
+    ])
+    lag, best = _best(corr, lags)
+
+    columns = pd.MultiIndex.from_product([['lag', 'corr'], rates, idxs], names=['stat', 'rate', 'index'])
+    return pd.DataFrame(np.concatenate([lag.reshape(T, -1), best.reshape(T, -1)], axis=1),
+                        index=frame.index, columns=columns)
+
+# Regime Statistics #
+# Per-regime statistics for every rate x index pair, for any number of
+# (possibly overlapping) date intervals at once. Each interval becomes a
+# pair of positions on the date index (searchsorted on its bounds), and
+# every statistic is a difference of cumulative sums at those positions,
+# so the cost is O(T + K) per pair for K intervals - no per-regime slicing.
+
+REGIME_STATS = ['n', 'corr', 'beta', 'rate_vol', 'index_vol', 'mean_rolling_corr']
+
+def regime_intervals(regimes) -> 'pd.DataFrame':
+    """
+    Normalise regimes to a start/end/label frame. Accepts a DataFrame with
+    those columns or (start, end, label, ...) tuples as used for shading
+    (anything after the label, e.g. a colour, is ignored).
+    """
+    import pandas as pd
+
+    if isinstance(regimes, pd.DataFrame):
+        table = regimes[['start', 'end', 'label']].copy()
+    else:
+        table = pd.DataFrame([tuple(regime[:3]) for regime in regimes],
+                             columns=['start', 'end', 'label'])
+    table['start'] = pd.to_datetime(table['start'])
+    table['end'] = pd.to_datetime(table['end'])
+    return table.reset_index(drop=True)
+
+def _interval_sums(cum: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    # sums over rows [lo, hi) of every interval; cum has a leading zero row on axis 1
+    return cum[:, hi] - cum[:, lo]
+
+def regime_stats(datas, rates: List[str], idxs: List[str], regimes,
+                 window: int = 36, min_periods: int = 3) -> 'pd.DataFrame':
+    """
+    Statistics of every rate x index pair within each regime (both bounds
+    inclusive), one row per (regime, rate, index):
+      n                 - periods where both series have a value
+      corr              - Pearson correlation of the levels
+      beta              - slope of the index on the rate (cov / var rate)
+      rate_vol          - std of the rate's period-on-period changes
+      index_vol         - std of the index's period-on-period changes
+      mean_rolling_corr - mean `window`-period rolling correlation
+    Regimes with fewer than `min_periods` complete pairs get NaN statistics.
+    """
+    import pandas as pd
+
+    frame = _to_frame(datas)
+    table = regime_intervals(regimes)
+    dates = frame.index.to_numpy()
+    # interval -> row positions [lo, hi)
+    lo = np.searchsorted(dates, table['start'].to_numpy(), 'left')
+    hi = np.maximum(np.searchsorted(dates, table['end'].to_numpy(), 'right'), lo)
+
+    x = frame[rates].to_numpy('float64')
+    y = frame[idxs].to_numpy('float64')
+    x = x - np.nanmean(x, axis=0)
+    y = y - np.nanmean(y, axis=0)
+    T, R, I = len(frame), len(rates), len(idxs)
+
+    # levels: (STATS, K, R, I)
+    stats = _pair_stats(x, y)
+    cum = np.zeros((STATS, T + 1, R, I))
+    np.cumsum(stats, axis=1, out=cum[:, 1:])
+    sums = _interval_sums(cum, lo, hi)
+    n, sx, sy, sxx, syy, sxy = sums
+    corr = _corr_from_sums(sums, min_periods)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = (sxy - sx * sy / n) / (sxx - sx * sx / n)
+    beta[np.isnan(corr)] = np.nan
+
+    # changes: row t holds value[t] - value[t - 1], so a regime's changes
+    # are rows lo + 1 .. hi - 1
+    def change_vol(z: np.ndarray) -> np.ndarray:
+        change = np.diff(z, axis=0, prepend=np.nan)
+        valid = ~np.isnan(change)
+        change = np.where(valid, change, 0.0)
+        cum = np.zeros((3, T + 1, z.shape[1]))
+        np.cumsum(np.stack([valid.astype('float64'), change, change * change]), axis=1, out=cum[:, 1:])
+        m, s, ss = _interval_sums(cum, np.minimum(lo + 1, hi), hi)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            var = (ss - s * s / m) / (m - 1)
+        var[m < max(min_periods - 1, 2)] = np.nan
+        return np.sqrt(np.maximum(var, 0.0))
+
+    rate_vol = np.broadcast_to(change_vol(x)[:, :, None], corr.shape)
+    index_vol = np.broadcast_to(change_vol(y)[:, None, :], corr.shape)
+
+    # rolling correlation: mean of the defined values in each regime
+    rolling = rolling_corr_array(x, y, [window])[0]
+    defined = ~np.isnan(rolling)
+    cum = np.zeros((2, T + 1, R, I))
+    np.cumsum(np.stack([defined.astype('float64'), np.where(defined, rolling, 0.0)]),
+              axis=1, out=cum[:, 1:])
+    count, total = _interval_sums(cum, lo, hi)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_rolling = np.where(count > 0, total / count, np.nan)
+
+    values = np.stack([n, corr, beta, rate_vol, index_vol, mean_rolling], axis=-1)
+    K = len(table)
+    index = pd.MultiIndex.from_arrays([
+        np.repeat(table['label'].to_numpy(), R * I),
+        np.tile(np.repeat(np.asarray(rates, dtype=object), I), K),
+        np.tile(np.asarray(idxs, dtype=object), K * R),
+    ], names=['regime', 'rate', 'index'])
+    result = pd.DataFrame(values.reshape(K * R * I, len(REGIME_STATS)), index=index, columns=REGIME_STATS)
+    result['n'] = result['n'].astype('int64')
+    result.insert(0, 'start', np.repeat(table['start'].to_numpy(), R * I))
+    result.insert(1, 'end', np.repeat(table['end'].to_numpy(), R * I))
+    return result
+
 # Plotting #
-def plot_data(data: List[tuple], title, y_axis, y_unit):
-    dates = []
-    values = []
-    for d in data:
-        dates.append(datetime.strptime(d[0],'%Y-%m-%d'))
-        values.append(d[1])
+# Long series are decimated to about one point per pixel of the axes
+# (see src.downsample) before they are drawn.
+def _pixels(ax) -> int:
+    return max(int(ax.get_window_extent().width), 3)
+
+def _rows_to_arrays(data: List[tuple]):
+    # (date string, value) rows as datetime64 and float arrays
+    if not data:
+        return np.array([], dtype='datetime64[D]'), np.array([], dtype='float64')
+    dates, values = zip(*data)
+    return np.array(dates, dtype='datetime64[D]'), np.array(values, dtype='float64')
+
+def _decimate(ax, s: 'pd.Series') -> 'pd.Series':
+    return downsample_series(s, _pixels(ax))
+
+def plot_data(data: List[tuple], title, y_axis, y_unit, points: Optional[int] = None):
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    from matplotlib.ticker import MaxNLocator
+
+    dates, values = _rows_to_arrays(data)
 
     fig, ax = plt.subplots()
-    ax.plot(dates, values)
+    ax.plot(*downsample(dates, values, points or _pixels(ax)))
     ax.grid(True)
 
     # Major tick per year, Minor tick per month
@@ -88,22 +571,16 @@ def plot_data(data: List[tuple], title, y_axis, y_unit):
     plt.title(title)
     plt.show()
 
-def plot_multi_data(datas: List[List[tuple]], title, y_axis, y_unit):
-    
-    lines = []
-    for data in datas:
-        line = []
-        for row in data:
-            date = datetime.strptime(row[0],'%Y-%m-%d')
-            value = row[1]
-            line.append((date,value))
-        lines.append(line)
+def plot_multi_data(datas: List[List[tuple]], title, y_axis, y_unit, points: Optional[int] = None):
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    from matplotlib.ticker import MaxNLocator
+
+    lines = [_rows_to_arrays(data) for data in datas]
 
     fig, ax = plt.subplots(figsize=(10,6))
-    for line in lines:
-        dates = [point[0] for point in line]
-        values = [point[1] for point in line]
-        ax.plot(dates, values)
+    for dates, values in lines:
+        ax.plot(*downsample(dates, values, points or _pixels(ax)))
     ax.grid(True)
 
     # Major tick per year, Minor tick per month
@@ -112,7 +589,7 @@ def plot_multi_data(datas: List[List[tuple]], title, y_axis, y_unit):
     ax.xaxis.set_minor_locator(mdates.MonthLocator(interval=2))
 
     # Minor ticks evenly spaced
-    all_values = [point[1] for line in lines for point in line]
+    all_values = np.concatenate([values for dates, values in lines])
     y_min = np.min(all_values)
     y_max = np.max(all_values)
     ax.set_ylim(y_min, y_max)
@@ -129,7 +606,8 @@ def plot_multi_data(datas: List[List[tuple]], title, y_axis, y_unit):
 
 def plot_interest_against_index(pir_datas: List[List[tuple]], 
                                 idx_datas: List[List[tuple]]):
-    
+    import matplotlib.pyplot as plt
+
     pir_lines = data_to_lines(pir_datas)
     idx_lines = data_to_lines(idx_datas)
 
@@ -154,12 +632,22 @@ def plot_interest_against_index(pir_datas: List[List[tuple]],
 
     plt.show()
 
-def plot_datas(datas: Dict[str,pd.Series], 
-            pir_cols: List[str], idx_cols: List[str],
-            v_shading: Optional[List[tuple]] = None):
+def style_datas(ax1, ax2):
+    import matplotlib.dates as mdates
 
-    fig, ax1 = plt.subplots(figsize=(10,6))
-    ax2 = ax1.twinx()
+    ax1.set_xlabel('Year')
+    ax1.set_ylabel('Interest Rate (%)', color='tab:blue', fontweight='bold')
+    ax2.set_ylabel('Index Values', color='tab:red', fontweight='bold')
+    ax1.grid(True, which='major', axis='both', alpha=0.3)
+    ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
+    ax1.tick_params(axis='x', labelrotation=45)
+
+def draw_datas(ax1, ax2, datas: Dict[str,'pd.Series'],
+               pir_cols: List[str], idx_cols: List[str],
+               v_shading: Optional[List[tuple]] = None) -> list:
+    # returns the artists drawn, so a reused figure can remove them
+    import pandas as pd
+    import matplotlib.pyplot as plt
 
     idx_colors = plt.cm.Reds(np.linspace(0.4, 0.9, len(idx_cols)))
     pir_colors = plt.cm.Blues(np.linspace(0.9, 0.4, len(pir_cols)))
@@ -167,11 +655,13 @@ def plot_datas(datas: Dict[str,pd.Series],
     elements = []
 
     for i, col in enumerate(idx_cols):
-        ln = ax2.plot(datas[col].index, datas[col], label=col+' Index', color=idx_colors[i])
+        s = _decimate(ax2, datas[col])
+        ln = ax2.plot(s.index, s, label=col+' Index', color=idx_colors[i])
         elements += ln   
 
     for i, col in enumerate(pir_cols):
-        ln = ax1.plot(datas[col].index, datas[col], label=col+' Interest Rate', color=pir_colors[i])
+        s = _decimate(ax1, datas[col])
+        ln = ax1.plot(s.index, s, label=col+' Interest Rate', color=pir_colors[i])
         elements += ln
 
     if v_shading:
@@ -180,21 +670,31 @@ def plot_datas(datas: Dict[str,pd.Series],
                         color='gray', alpha=0.2, label=label)
             elements.append(patch)
 
-    ax1.set_xlabel('Year')
-    ax1.set_ylabel('Interest Rate (%)', color='tab:blue', fontweight='bold')
-    ax2.set_ylabel('Index Values', color='tab:red', fontweight='bold')
-    plt.title('Policy Interest Rates vs Indices',fontsize=14)
+    ax1.set_title('Policy Interest Rates vs Indices',fontsize=14)
 
     labs = [l.get_label() for l in elements]
     ax1.legend(elements, labs, loc='upper left', frameon=True, fontsize='small')
+    return elements
 
-    ax1.grid(True, which='major', axis='both', alpha=0.3)
-    ax1.xaxis.set_major_formatter(mdates.DateFormatter('%Y'))
-    plt.setp(ax1.get_xticklabels(), rotation=45)
+def plot_datas(datas: Dict[str,'pd.Series'], 
+            pir_cols: List[str], idx_cols: List[str],
+            v_shading: Optional[List[tuple]] = None,
+            path: Optional[str] = None, show: bool = True):
 
-    plt.tight_layout()
-    plt.savefig('imgs/policy_interest_rates_vs_indices.png')
-    plt.show()
+    import matplotlib.pyplot as plt
+
+    fig, ax1 = plt.subplots(figsize=(10,6))
+    ax2 = ax1.twinx()
+    style_datas(ax1, ax2)
+    draw_datas(ax1, ax2, datas, pir_cols, idx_cols, v_shading)
+
+    fig.tight_layout()
+    if path:
+        fig.savefig(path)
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
 
 def cli_plot_data():
     print('##### Plot Data #####')
@@ -240,70 +740,104 @@ def cli_plot_data():
 
     print('##### Done #####')
 
-def plot_rolling_corr(datas: Dict[str, pd.Series], window: int, pir: str, idx: str):
-    rolling_corr = datas[pir].rolling(window=window).corr(datas[idx])
-
-    fig, ax = plt.subplots(figsize=(10,4))
-    ax.plot(rolling_corr,color='purple')
-    ax.set_title(f"{window}-Month Rolling Correlation: {pir} Rates vs {idx} Index")
+def style_rolling_corr(ax):
     ax.set_ylim([-1.1,1.1])
     ax.axhline(0, color='black', linestyle='--')
 
-    plt.show()
+def style_rolling_corrs(ax):
+    import matplotlib.dates as mdates
 
-def plot_rolling_corrs(datas: Dict[str, pd.Series], window: int, pir: str, idxs: List[str],
-                        v_shading: Optional[List[tuple]] = None):
-    fig, ax = plt.subplots(figsize=(12,5))
+    style_rolling_corr(ax)
+    ax.set_ylabel("Pearson Coefficient")
+    ax.set_xlabel('Year')
+    ax.xaxis.set_major_locator(mdates.YearLocator(base=2))
+    ax.grid(True,alpha=0.2)
 
-    colors = plt.cm.viridis(np.linspace(0, 0.8, len(idxs)))
+def draw_rolling_corr(ax, rolling_corr: 'pd.Series', window: int, pir: str, idx: str) -> list:
+    lines = ax.plot(_decimate(ax, rolling_corr),color='purple')
+    ax.set_title(f"{window}-Month Rolling Correlation: {pir} Rates vs {idx} Index")
+    return lines
+
+def draw_rolling_corrs(ax, corrs: Dict[str, 'pd.Series'], window: int, pir: str,
+                       v_shading: Optional[List[tuple]] = None,
+                       bands: Optional[Dict[str, tuple]] = None) -> list:
+    # `corrs` maps index name to its rolling correlation with `pir`,
+    # `bands` index name to (lower, upper) confidence bounds
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
+    colors = plt.cm.viridis(np.linspace(0, 0.8, len(corrs)))
 
     handles = []
+    fills = []
 
-    for i, idx in enumerate(idxs):
-        rolling_corr = datas[pir].rolling(window=window).corr(datas[idx])
-        line, = ax.plot(rolling_corr, color=colors[i], label=f"{idx}",linewidth=1.5,alpha=0.9)
+    for i, (idx, rolling_corr) in enumerate(corrs.items()):
+        line, = ax.plot(_decimate(ax, rolling_corr), color=colors[i], label=f"{idx}",linewidth=1.5,alpha=0.9)
         handles.append(line)
+        if bands and idx in bands:
+            lower, upper = bands[idx]
+            fills.append(ax.fill_between(lower.index, lower, upper, color=colors[i], alpha=0.15, linewidth=0))
 
     if v_shading:
-        added_labels = set()
         for start, end, label, color in v_shading:
             patch = ax.axvspan(pd.to_datetime(start), pd.to_datetime(end),
                                color=color, alpha=0.15,label=label)
             handles.append(patch)
 
-    ax.set_ylim([-1.1,1.1])
-    ax.axhline(0, color='black', linestyle='--')
-
     ax.set_title(f"{window}-Month Rolling Correlation: {pir} Rates vs Multiple Indices")
-    ax.set_ylabel("Pearson Coefficient")
-    ax.set_xlabel('Year')
-    ax.xaxis.set_major_locator(mdates.YearLocator(base=2))
-    ax.grid(True,alpha=0.2)
-
     ax.legend(handles=handles,loc='upper left', bbox_to_anchor=(1,1), fontsize='small')
+    return handles + fills
 
-    plt.tight_layout()
-    plt.savefig(f"imgs/{window}-month_rolling_correlation_{pir}_rates_vs_multiple_indices.png")
-    plt.show()
+def plot_rolling_corr(datas: Dict[str, 'pd.Series'], window: int, pir: str, idx: str,
+                      path: Optional[str] = None, show: bool = True):
+    import matplotlib.pyplot as plt
 
+    rolling_corr = rolling_corrs(datas, [pir], [idx], [window])[(window, pir, idx)]
 
-# Analysis #
-def analysis():
-    datas = get_all_datas()
+    fig, ax = plt.subplots(figsize=(10,4))
+    style_rolling_corr(ax)
+    draw_rolling_corr(ax, rolling_corr, window, pir, idx)
 
-    # Downsample to Monthly data points
-    for col in ['UK','US']:
-        # Ensure index is datetime object
-        datas[col].index = pd.to_datetime(datas[col].index)
+    if path:
+        fig.savefig(path)
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
 
-        #Forward fill incase of missing values
-        daily_series = datas[col].resample('D').ffill()
+def plot_rolling_corrs(datas: Dict[str, 'pd.Series'], window: int, pir: str, idxs: List[str],
+                        v_shading: Optional[List[tuple]] = None,
+                        path: Optional[str] = None, show: bool = True,
+                        bands: Optional['pd.DataFrame'] = None):
+    # `bands`: confidence bands from src.bootstrap, shaded around each line
+    import matplotlib.pyplot as plt
 
-        # Resample to Month Start
-        datas[col] = daily_series.resample('MS').mean()
+    fig, ax = plt.subplots(figsize=(12,5))
 
-    # Forward sample All Commodities (from quaterly to monthly)
-    datas['All Commodities'] = datas['All Commodities'].resample('MS').ffill()
+    corrs = rolling_corrs(datas, [pir], idxs, [window])
+    if bands is not None:
+        bands = {idx: (bands[('lower', window, pir, idx)], bands[('upper', window, pir, idx)]) for idx in idxs}
+    style_rolling_corrs(ax)
+    draw_rolling_corrs(ax, {idx: corrs[(window, pir, idx)] for idx in idxs}, window, pir, v_shading, bands)
+
+    fig.tight_layout()
+    if path:
+        fig.savefig(path)
+    if show:
+        plt.show()
+    else:
+        plt.close(fig)
+
+
+# Analysis #
+def analysis(workers: Optional[int] = 1, tables: bool = False):
+    # `workers`: processes computing the bootstrap bands; 1 computes them in
+    # this process, None uses every CPU. `tables` also prints the statistics
+    # per regime and the lead/lag of every pair.
+    # One query for every series, aligned to Month Start:
+    # UK/US daily rates averaged per month, All Commodities forward filled
+    # from quarterly to monthly.
+    datas = get_aligned_datas(ANALYSIS_SERIES, freq='MS')
 
     # Vertical Shading for recessions.
     recessions = [
@@ -315,7 +849,8 @@ def analysis():
         datas = datas, 
         pir_cols = ['US'], 
         idx_cols = ['Food', 'All Commodities', 'Energy'],
-        v_shading= recessions
+        v_shading= recessions,
+        path = 'imgs/policy_interest_rates_vs_indices.png'
     )
 
     # Regimes
@@ -328,7 +863,23 @@ def analysis():
         ('2022-01-01', '2025-01-01',  'Post-Pandemic', 'purple'),
     ]
 
-    plot_rolling_corrs(datas, 36, 'US', ['Food', 'All Commodities', 'Energy'], patches)
+    # 90% block-bootstrap bands, cached until the data changes
+    from src.bootstrap import bootstrap_bands
+    bands = bootstrap_bands(ANALYSIS_SERIES, ['US'], ['Food', 'All Commodities', 'Energy'], [36],
+                            workers=workers)
+
+    plot_rolling_corrs(datas, 36, 'US', ['Food', 'All Commodities', 'Energy'], patches,
+                       path = 'imgs/36-month_rolling_correlation_US_rates_vs_multiple_indices.png',
+                       bands = bands)
+
+    # Statistics per regime and recession
+    if tables:
+        stats = regime_stats(datas, ['US', 'UK'], ['Food', 'All Commodities', 'Energy'],
+                             patches + recessions, window=36)
+        print(stats.round({stat: 3 for stat in REGIME_STATS}).to_string())
+
+        # Lead/lag: months by which each index follows each policy rate
+        print(best_lags(datas, ['US', 'UK'], ['Food', 'All Commodities', 'Energy'], max_lag=24).round(3).to_string())
 
 
 if __name__ == "__main__":
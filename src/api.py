@@ -1,12 +1,240 @@
-from fastapi import FastAPI
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from datetime import date
+from typing import Callable, Iterator, List, Optional, Tuple
+import numpy as np
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 import src.database as db
+import src.analysis as analysis
+import src.formats as formats
+import src.instrument as instrument
+from src.downsample import downsample
+from src.formats import NDJSON
 
-app = FastAPI()
+# Serialized series responses, keyed on the request and the series' data
+# version, so a hit neither queries SQLite nor re-encodes JSON. Headers that
+# depend on the data (a page's next cursor) are kept with the body.
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+# Streamed bodies bigger than this are not kept.
+CACHE_ENTRY_MAX_BYTES = 4 * 1024 * 1024
+
+_responses: 'OrderedDict[str, Tuple[bytes, dict]]' = OrderedDict()
+_responses_bytes = 0
+_responses_lock = threading.Lock()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # close the per-thread database connections
+    db.close_connections()
+
+class RequestMetrics:
+    """
+    ASGI middleware observing each request's latency, up to the last body
+    byte sent, into a histogram per route template and status. Passes
+    straight through while instrumentation is off.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not instrument.ENABLED:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_timed(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body'):
+                route = scope.get('route')
+                instrument.observe('api_request_seconds', time.perf_counter() - start,
+                                   route=getattr(route, 'path', 'unmatched'),
+                                   method=scope['method'], status=status[0])
+
+        await self.app(scope, receive, send_timed)
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestMetrics)
+
+@app.exception_handler(db.UnknownNameError)
+def unknown_name(request: Request, exc: db.UnknownNameError):
+    return JSONResponse(status_code=404, content={'detail': str(exc)})
+
+@app.exception_handler(formats.NotAcceptable)
+def not_acceptable(request: Request, exc: formats.NotAcceptable):
+    return JSONResponse(status_code=406, content={'detail': str(exc)})
+
+def _cache_get(key: str) -> Optional[Tuple[bytes, dict]]:
+    with _responses_lock:
+        entry = _responses.get(key)
+        if entry is not None:
+            _responses.move_to_end(key)
+        return entry
+
+def _cache_put(key: str, body: bytes, headers: dict):
+    global _responses_bytes
+    with _responses_lock:
+        if key in _responses:
+            return
+        _responses[key] = (body, headers)
+        _responses_bytes += len(body)
+        # evict least recently used
+        while _responses_bytes > CACHE_MAX_BYTES and len(_responses) > 1:
+            _, (old, _) = _responses.popitem(last=False)
+            _responses_bytes -= len(old)
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since and last_modified:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _encode(chunks: Iterator[List[tuple]], media_type: str) -> Iterator[bytes]:
+    # a JSON list of [date, value] rows, or one row per line for NDJSON
+    if media_type == NDJSON:
+        for rows in chunks:
+            yield ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows).encode()
+        return
+
+    yield b'['
+    first = True
+    for rows in chunks:
+        body = json.dumps(rows, separators=(',', ':'))[1:-1]
+        yield (body if first else ',' + body).encode()
+        first = False
+    yield b']'
+
+async def _stream(key: str, pieces: Iterator[bytes], headers: dict):
+    # Stream straight from the database; keep a copy for the LRU only
+    # while the body stays small.
+    parts = []
+    size = 0
+    async for piece in iterate_in_threadpool(pieces):
+        if parts is not None:
+            parts.append(piece)
+            size += len(piece)
+            if size > CACHE_ENTRY_MAX_BYTES:
+                parts = None
+        yield piece
+    if parts is not None:
+        _cache_put(key, b''.join(parts), headers)
+
+async def versioned_response(request: Request, inputs: List[tuple], render: Callable,
+                             media_type: str, data_headers: Optional[Callable] = None) -> Response:
+    """
+    Response built from the series in `inputs` ((metric_id, country_id) pairs),
+    with a strong ETag and Last-Modified taken from their data versions.
+    Conditional requests get a 304 without reading any data; otherwise the
+    body comes from the LRU or `render(media_type)`, which returns bytes
+    (cached) or an iterator of bytes (streamed). `data_headers()` adds headers
+    read from the data; it runs with `render` and is cached with the body.
+    """
+    versions = await run_in_threadpool(db.get_data_versions)
+    states = [versions.get(series, (0, None)) for series in inputs]
+    key = f'{request.url.path}?{request.url.query}|{media_type}'
+    etag = '"' + hashlib.sha1(f'{key}|{states}'.encode()).hexdigest() + '"'
+
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept'}
+    last_modified = None
+    for version, updated_at in states:
+        if updated_at:
+            modified = datetime.fromisoformat(updated_at)
+            if modified.tzinfo is None:
+                modified = modified.replace(tzinfo=timezone.utc)
+            last_modified = max(last_modified or modified, modified)
+    if last_modified:
+        headers['Last-Modified'] = format_datetime(last_modified, usegmt=True)
+
+    if _not_modified(request, etag, last_modified):
+        return Response(status_code=304, headers=headers)
+
+    entry = _cache_get(etag)
+    if entry is not None:
+        body, extra = entry
+        return Response(content=body, media_type=media_type, headers=dict(headers, **extra))
+
+    extra = await run_in_threadpool(data_headers) if data_headers else {}
+    headers.update(extra)
+    body = await run_in_threadpool(render, media_type)
+    if not isinstance(body, bytes):
+        return StreamingResponse(_stream(etag, body, extra), media_type=media_type, headers=headers)
+    _cache_put(etag, body, extra)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+async def series_response(request: Request, metric_id, country_id, chunks: Callable,
+                          arrays: Callable, data_headers: Optional[Callable] = None) -> Response:
+    """
+    One stored series, in the negotiated format (Accept or ?format=):
+    JSON/NDJSON are streamed from `chunks()`, an iterator of row lists, and
+    the columnar formats are encoded from `arrays()`, a (dates, values) pair.
+    """
+    media_type = formats.negotiate(request.headers.get('accept'), request.query_params.get('format'))
+
+    def render(media_type):
+        if media_type in formats.COLUMNAR:
+            return formats.encode(media_type, *arrays())
+        return _encode(chunks(), media_type)
+
+    return await versioned_response(request, [(metric_id, country_id)], render, media_type, data_headers)
+
+def _rows(dates: np.ndarray, values: np.ndarray) -> List[tuple]:
+    return list(zip(np.datetime_as_string(dates.astype('datetime64[D]'), unit='D').tolist(),
+                    values.tolist()))
+
+async def range_response(request: Request, metric_id, country_id,
+                         start: Optional[date], end: Optional[date],
+                         limit: Optional[int], cursor: Optional[date],
+                         points: Optional[int] = None) -> Response:
+    start, end, cursor = [d.isoformat() if d else None for d in (start, end, cursor)]
+
+    def page_headers():
+        # read on a cache miss only: a 304 or LRU hit touches no data
+        if limit is None:
+            return {}
+        next_cursor = db.get_next_cursor(metric_id, country_id, start, end, limit, cursor)
+        if not next_cursor:
+            return {}
+        return {'X-Next-Cursor': next_cursor,
+                'Link': f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'}
+
+    if points is not None:
+        # a preview: the page decimated to about `points` points
+        def arrays():
+            return downsample(*db.get_arrays(metric_id, country_id, start, end, limit, cursor), points)
+        return await series_response(request, metric_id, country_id,
+            lambda: iter([_rows(*arrays())]), arrays, page_headers)
+
+    return await series_response(request, metric_id, country_id,
+        lambda: db.iter_data(metric_id, country_id, start, end, limit, cursor),
+        lambda: db.get_arrays(metric_id, country_id, start, end, limit, cursor),
+        page_headers)
 
 @app.get("/")
 def home():
     return {'message': 'Finance Data API, visit /docs.'}
 
+@app.get("/metrics/prometheus", include_in_schema=False)
+def prometheus_metrics():
+    return Response(content=instrument.render(), media_type='text/plain; version=0.0.4')
+
 @app.get("/countries")
 def countries():
     data = db.select('country_name', 'countries')
@@ -28,31 +256,93 @@ def metrics():
     return metrics
 
 @app.get("/data/global/{metric}")
-def get_global_metric_data(metric: str):
+async def get_global_metric_data(metric: str, request: Request,
+                                 start: Optional[date] = None, end: Optional[date] = None,
+                                 limit: Optional[int] = Query(None, ge=1),
+                                 cursor: Optional[date] = None,
+                                 points: Optional[int] = Query(None, ge=3),
+                                 format: Optional[str] = None):
     metric_id = db.get_metric_id(metric)
 
-    data = db.get_data_global_metric(metric_id=metric_id)
-
-    return data
+    return await range_response(request, metric_id, None, start, end, limit, cursor, points)
 
 @app.get("/data/{country}/{metric}")
-def get_country_metric_data(country: str, metric: str):
+async def get_country_metric_data(country: str, metric: str, request: Request,
+                                  start: Optional[date] = None, end: Optional[date] = None,
+                                  limit: Optional[int] = Query(None, ge=1),
+                                  cursor: Optional[date] = None,
+                                  points: Optional[int] = Query(None, ge=3),
+                                  format: Optional[str] = None):
     country_id = db.get_country_id(country)
     metric_id = db.get_metric_id(metric)
 
-    data = db.get_data_country_metric(
-        country_id=country_id, 
-        metric_id=metric_id)
-    
-    return data
+    return await range_response(request, metric_id, country_id, start, end, limit, cursor, points)
 
 @app.get("/data/{country}/{metric}/latest")
-def get_country_metric_data_latest(country: str, metric: str):
+async def get_country_metric_data_latest(country: str, metric: str, request: Request,
+                                         format: Optional[str] = None):
     country_id = db.get_country_id(country)
     metric_id = db.get_metric_id(metric)
 
-    data = db.get_data_country_metric_latest(
-        country_id=country_id, 
-        metric_id=metric_id)
-    
-    return data
+    def latest_arrays():
+        dates, values = db.get_arrays(metric_id, country_id)
+        return dates[-1:], values[-1:]
+
+    return await series_response(request, metric_id, country_id,
+        lambda: iter([db.get_data_country_metric_latest(
+            country_id=country_id, 
+            metric_id=metric_id)]),
+        latest_arrays)
+
+# Analytics #
+# Computed on the server and memoized in the response cache: the ETag is
+# keyed on the versions of every input series, so results are recomputed
+# only after new data for one of them is ingested.
+# pandas offset aliases the analytics resample to; anything else is a 422
+FREQS = ('D', 'W', 'MS', 'ME', 'QS', 'QE', 'YS', 'YE')
+FREQ = Query('MS', pattern=f"^({'|'.join(FREQS)})$", description=f"one of {', '.join(FREQS)}")
+
+def _inputs(series: dict) -> List[tuple]:
+    return [(db.get_metric_id(metric), db.get_country_id(country or 'NULL'))
+            for metric, country, rule in series.values()]
+
+@app.get("/analytics/rolling-corr")
+async def analytics_rolling_corr(request: Request, rate: str, index: str,
+                                 window: int = Query(36, ge=2), freq: str = FREQ,
+                                 format: Optional[str] = None):
+    series = analysis.resolve_series([rate, index])
+    media_type = formats.negotiate(request.headers.get('accept'), format)
+
+    def render(media_type):
+        datas = analysis.get_aligned_datas(series, freq)
+        corr = analysis.rolling_corrs(datas, [rate], [index], [window])[(window, rate, index)].dropna()
+        dates, values = corr.index.to_numpy(), corr.to_numpy()
+        if media_type in formats.COLUMNAR:
+            return formats.encode(media_type, dates, values)
+        rows = list(zip(np.datetime_as_string(dates, unit='D').tolist(), values.tolist()))
+        return b''.join(_encode(iter([rows]), media_type))
+
+    return await versioned_response(request, _inputs(series), render, media_type)
+
+@app.get("/analytics/aligned")
+async def analytics_aligned(request: Request,
+                            series: str = Query(..., description='comma separated, e.g. US,UK,Energy'),
+                            freq: str = FREQ, format: Optional[str] = None):
+    labels = [label.strip() for label in series.split(',') if label.strip()]
+    resolved = analysis.resolve_series(labels)
+    media_type = formats.negotiate(request.headers.get('accept'), format)
+    if media_type not in (formats.JSON, formats.CSV):
+        raise formats.NotAcceptable('aligned series are available as JSON or CSV')
+
+    def render(media_type):
+        datas = analysis.get_aligned_datas(resolved, freq)
+        if media_type == formats.CSV:
+            return datas.to_csv(index_label='date', date_format='%Y-%m-%d').encode()
+        values = datas.to_numpy()
+        return json.dumps({
+            'columns': list(datas.columns),
+            'index': np.datetime_as_string(datas.index.to_numpy(), unit='D').tolist(),
+            'data': np.where(np.isnan(values), None, values).tolist(),
+        }, separators=(',', ':')).encode()
+
+    return await versioned_response(request, _inputs(resolved), render, media_type)
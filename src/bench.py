@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import src.database as db
+import src.series_cache as series_cache
+import src.storage as storage
+import src.synthetic as synthetic
+
+# Benchmarks over a synthetic database (src.synthetic). Each benchmark is
+# timed `repeat` times after one warmup run; results are written as JSON
+# and can be compared with an earlier run to catch regressions:
+#
+#   python -m src.bench --scale medium --output bench_results.json
+#   python -m src.bench --scale medium --baseline bench_results.json
+#   python -m src.bench --scale large --backend parquet --only scan
+#
+# A benchmark regresses when its median is more than `tolerance` slower
+# than the baseline's; the run then exits with status 1.
+
+DB_PATH = 'bench.db'
+CACHE_DIR = 'bench_series_cache'
+PARQUET_DIR = 'bench.parquet'
+REPEAT = 5
+TOLERANCE = 0.25
+INSERT_ROWS = 10_000
+
+def timeit(fn: Callable, setup: Optional[Callable] = None, repeat: int = REPEAT) -> Dict[str, float]:
+    # setup runs before every timed call and is not timed
+    times = []
+    for i in range(repeat + 1):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if i:
+            times.append(elapsed)
+    return {
+        'runs': repeat,
+        'min': min(times),
+        'median': float(np.median(times)),
+        'mean': float(np.mean(times)),
+        'max': max(times),
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Benchmarks
+def benchmarks() -> Dict[str, tuple]:
+    """name: (fn, setup) for every benchmark, against the current database."""
+    import src.analysis as analysis
+    import src.api as api
+    from fastapi.testclient import TestClient
+
+    client = TestClient(api.app)
+    us_id = db.get_country_id('US')
+    rate_id = db.get_metric_id('policy interest rate')
+
+    # a series of its own for the write benchmarks
+    db.add_metric('bench insert', '')
+    dates = pd.bdate_range('1990-01-01', periods=INSERT_ROWS).strftime('%Y-%m-%d').tolist()
+    values = synthetic.random_walk(np.random.default_rng(0), INSERT_ROWS)
+    records = [{'date': d, 'value': v} for d, v in zip(dates, values.tolist())]
+
+    def clear_insert_series():
+        db.delete_data('US', 'bench insert')
+
+    def revise_last_point():
+        records[-1]['value'] += 1
+
+    frame = db.get_frame([(metric, country) for metric, country, rule in analysis.ANALYSIS_SERIES.values()])
+    frame.columns = list(analysis.ANALYSIS_SERIES)
+    rules = {label: rule for label, (metric, country, rule) in analysis.ANALYSIS_SERIES.items()}
+    datas = analysis.get_aligned_datas(analysis.ANALYSIS_SERIES, 'MS')
+    # one synthetic metric across every country, and every stored series
+    codes = [code for code, name in db.get_countires()]
+    cross_section = [('synthetic metric 000', code) for code in codes]
+    every_series = [(db.get_metric_name(metric_id), db.get_country_code(country_id) if country_id else None)
+                    for metric_id, country_id in db.get_store().series()]
+
+    etag = client.get('/data/US/policy interest rate').headers['etag']
+
+    def get(url: str, **headers):
+        response = client.get(url, headers=headers)
+        assert response.status_code in (200, 304), (url, response.status_code)
+        return response
+
+    return {
+        'insert_data/new': (lambda: db.insert_data('US', 'bench insert', records), clear_insert_series),
+        'insert_data/unchanged': (lambda: db.insert_data('US', 'bench insert', records), None),
+        'insert_data/revised_last': (lambda: db.insert_data('US', 'bench insert', records), revise_last_point),
+        'get_series/cold': (lambda: db.get_series('policy interest rate', 'US'), series_cache.clear),
+        'get_series/warm': (lambda: db.get_series('policy interest rate', 'US'), None),
+        'get_series/rollup_MS': (lambda: db.get_series('policy interest rate', 'US', freq='MS'), None),
+        'get_data_country_metric': (lambda: db.get_data_country_metric(us_id, rate_id), None),
+        'get_data_country_metric_latest': (lambda: db.get_data_country_metric_latest(us_id, rate_id), None),
+        'scan/cross_section': (lambda: db.get_frame(cross_section), None),
+        'scan/cross_section_MS': (lambda: db.get_frame(cross_section, 'MS'), None),
+        'scan/full_history': (lambda: db.get_frame(every_series), None),
+        'analysis/align_raw': (lambda: analysis.align(frame, rules, 'MS'), None),
+        'analysis/get_aligned_datas': (lambda: analysis.get_aligned_datas(analysis.ANALYSIS_SERIES, 'MS'), None),
+        'analysis/rolling_corrs': (lambda: analysis.rolling_corrs(datas, ['US', 'UK'],
+                                   ['Food', 'Energy', 'All Commodities'], [12, 24, 36, 60]), None),
+        'api/series_cold': (lambda: get('/data/US/policy interest rate'), api._responses.clear),
+        'api/series_cached': (lambda: get('/data/US/policy interest rate'), None),
+        'api/series_not_modified': (lambda: get('/data/US/policy interest rate', **{'If-None-Match': etag}), None),
+        'api/series_points': (lambda: get('/data/US/policy interest rate?points=1000'), api._responses.clear),
+        'api/series_csv': (lambda: get('/data/US/policy interest rate?format=csv'), api._responses.clear),
+        'api/latest': (lambda: get('/data/US/policy interest rate/latest'), api._responses.clear),
+        'api/rolling_corr': (lambda: get('/analytics/rolling-corr?rate=US&index=Energy'), api._responses.clear),
+    }
+
+def run(scale: str = 'small', repeat: int = REPEAT, only: Optional[List[str]] = None,
+        reuse: bool = False, backend: str = 'sqlite', verbose: bool = True) -> Dict:
+    db.DB_PATH = DB_PATH
+    db.PARQUET_DIR = PARQUET_DIR
+    series_cache.CACHE_DIR = CACHE_DIR
+    if reuse and os.path.exists(DB_PATH):
+        counts = None
+        db.BACKEND = 'sqlite'
+        if backend != 'sqlite' and not os.path.exists(PARQUET_DIR):
+            db.migrate('sqlite', backend)
+        db.BACKEND = backend
+    else:
+        countries, metrics = synthetic.SCALES[scale]
+        db.BACKEND = backend
+        counts = synthetic.generate(DB_PATH, countries, metrics, verbose=verbose)
+
+    results = {}
+    for name, (fn, setup) in benchmarks().items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        results[name] = timeit(fn, setup, repeat)
+        if verbose:
+            print(f"{results[name]['median'] * 1000:10.3f} ms  {name}")
+
+    return {
+        'meta': {
+            'scale': scale,
+            'backend': backend,
+            'counts': counts,
+            'repeat': repeat,
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+        },
+        'results': results,
+    }
+
+def compare(results: Dict, baseline: Dict, tolerance: float = TOLERANCE) -> List[str]:
+    """Print median ratios against `baseline`; return the regressed benchmark names."""
+    regressions = []
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            continue
+        ratio = result['median'] / baseline['results'][name]['median']
+        regressed = ratio > 1 + tolerance
+        if regressed:
+            regressions.append(name)
+        print(f"{ratio:7.2f}x  {name}{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the database, analysis and API.')
+    parser.add_argument('--scale', choices=list(synthetic.SCALES), default='small')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--only', default=None, help='comma separated name prefixes, e.g. api,get_series')
+    parser.add_argument('--reuse', action='store_true', help='keep an existing bench.db')
+    parser.add_argument('--backend', choices=list(storage.BACKENDS), default='sqlite')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', default=None)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(sys.argv[1:])
+
+    # read first, the baseline may be the file about to be written
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = run(args.scale, args.repeat, args.only.split(',') if args.only else None, args.reuse,
+                  args.backend)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'----- Results written to {args.output} -----')
+
+    if baseline and compare(results, baseline, args.tolerance):
+        sys.exit(1)
@@ -0,0 +1,224 @@
+import os
+import glob
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import TYPE_CHECKING, Dict, Optional, Sequence, Tuple
+
+import src.database as db
+import src.files as files
+from src.analysis import STATS, ANALYSIS_SERIES, _pair_stats, _corr_from_sums, _to_frame, \
+    get_aligned_datas
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Block-bootstrap confidence bands for rolling correlations.
+#
+# Every window is resampled on its own: a resample is ceil(window / block)
+# blocks of consecutive periods drawn from inside the window, so the band
+# at a date only reflects the data in that date's window and short-range
+# autocorrelation is kept. All series are resampled together (the same
+# blocks for every pair), with the same block offsets at every date.
+#
+# A block's sums are differences of the cumulative pair sums also used by
+# rolling_corr_array, so a resample costs O(blocks) per date. The cumulative
+# sums sit in shared memory for the process pool; workers get its name, not
+# a pickled copy. Random streams come from (seed, window), so results don't
+# depend on the number of workers.
+
+CACHE_DIR = 'bootstrap_cache'
+RESAMPLES = 1000
+BATCH = 250 # resamples gathered at once
+SEED = 0
+
+def default_block(window: int) -> int:
+    return max(1, round(window ** (1 / 3)))
+
+def _offsets(rng: np.random.Generator, resamples: int, window: int, block: int):
+    # block starts relative to the window start, and the block lengths
+    blocks = -(-window // block)
+    lengths = np.full(blocks, block)
+    lengths[-1] = window - block * (blocks - 1)
+    starts = rng.integers(0, window - lengths + 1, size=(resamples, blocks))
+    return starts, lengths
+
+def _quantiles(values: np.ndarray, quantiles: Tuple[float, ...]) -> np.ndarray:
+    # np.nanquantile over axis 0 (linear interpolation) without its per-column
+    # fallback: sort once, NaN last, and interpolate within each column's count
+    values = np.sort(values, axis=0)
+    n = (~np.isnan(values)).sum(axis=0)
+    out = []
+    for q in quantiles:
+        pos = q * np.maximum(n - 1, 0)
+        lo = np.floor(pos).astype('int64')
+        hi = np.minimum(lo + 1, np.maximum(n - 1, 0))
+        below = np.take_along_axis(values, lo[None], axis=0)[0]
+        above = np.take_along_axis(values, hi[None], axis=0)[0]
+        out.append(np.where(n > 0, below + (above - below) * (pos - lo), np.nan))
+    return np.stack(out)
+
+def _bands(cum: np.ndarray, window: int, block: int, resamples: int, quantiles: Tuple[float, float],
+           min_periods: int, seed: int, rates: slice) -> np.ndarray:
+    """
+    Bootstrap quantiles for windows ending at window - 1 .. T - 1, for the
+    rates in `rates`: (2, T - window + 1, R', I).
+    """
+    T = cum.shape[1] - 1
+    cum = cum[:, :, rates]
+    shape = cum.shape[2:]
+    first = np.arange(T - window + 1) # window start per date
+    rng = np.random.default_rng([seed, window])
+    starts, lengths = _offsets(rng, resamples, window, block)
+
+    # sums of every block of each length, by start: (starts, STATS * R' * I)
+    # so a resample's blocks are whole-row gathers
+    rows = np.moveaxis(cum, 1, 0).reshape(T + 1, -1)
+    blocks = {length: rows[length:] - rows[:-length] for length in set(lengths.tolist())}
+
+    corr = np.empty((resamples, len(first)) + shape)
+    for b in range(0, resamples, BATCH):
+        batch = starts[b:b + BATCH]
+        sums = np.zeros((len(batch), len(first), rows.shape[1]))
+        for j, length in enumerate(lengths):
+            sums += blocks[length].take(first[None, :] + batch[:, j:j + 1], axis=0)
+        sums = np.moveaxis(sums.reshape(sums.shape[:2] + (STATS,) + shape), 2, 0)
+        corr[b:b + BATCH] = _corr_from_sums(sums, min_periods)
+
+    bands = _quantiles(corr, quantiles)
+    # no band where the window itself has too few pairs
+    n = cum[0, window:] - cum[0, :-window]
+    bands[:, n < min_periods] = np.nan
+    return bands
+
+def _bands_shared(name: str, shape: tuple, *args) -> np.ndarray:
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        cum = np.ndarray(shape, dtype='float64', buffer=shm.buf)
+        return _bands(cum, *args)
+    finally:
+        del cum
+        shm.close()
+
+def block_bootstrap_bands(datas, rates: Sequence[str], idxs: Sequence[str], windows: Sequence[int],
+                          resamples: int = RESAMPLES, block: Optional[int] = None,
+                          level: float = 0.9, min_periods: Optional[int] = None,
+                          seed: int = SEED, workers: Optional[int] = None) -> 'pd.DataFrame':
+    """
+    `level` confidence bands of the rolling correlation of every rate x
+    index pair, for each window. Columns are (bound, window, rate, index)
+    with bound 'lower' or 'upper', so `bands['lower']` lines up with
+    rolling_corrs. `block` defaults to window ** (1 / 3); workers=1 (or 0)
+    runs in this process, None uses every CPU.
+    """
+    import pandas as pd
+
+    rates, idxs, windows = list(rates), list(idxs), list(windows)
+    frame = _to_frame(datas)
+    x = frame[rates].to_numpy('float64')
+    y = frame[idxs].to_numpy('float64')
+    x = x - np.nanmean(x, axis=0)
+    y = y - np.nanmean(y, axis=0)
+    T = len(frame)
+
+    stats = _pair_stats(x, y)
+    cum = np.zeros((STATS, T + 1) + stats.shape[2:])
+    np.cumsum(stats, axis=1, out=cum[:, 1:])
+    quantiles = ((1 - level) / 2, 1 - (1 - level) / 2)
+
+    # task: (window, rates slice)
+    tasks = [(window, slice(r, r + 1)) for window in windows if window <= T for r in range(len(rates))]
+    def args(window, rates_slice):
+        return (window, block or default_block(window), resamples, quantiles,
+                min_periods or window, seed, rates_slice)
+
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(tasks) <= 1:
+        results = [_bands(cum, *args(*task)) for task in tasks]
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=cum.nbytes)
+        try:
+            np.ndarray(cum.shape, dtype='float64', buffer=shm.buf)[:] = cum
+            with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+                futures = [pool.submit(_bands_shared, shm.name, cum.shape, *args(*task)) for task in tasks]
+                results = [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    out = np.full((2, len(windows), T, len(rates), len(idxs)), np.nan)
+    for (window, rates_slice), bands in zip(tasks, results):
+        out[:, windows.index(window), window - 1:, rates_slice] = bands
+    # (bound, window, T, rate, index) -> (T, bound, window, rate, index)
+    values = out.transpose(2, 0, 1, 3, 4).reshape(T, -1)
+    columns = pd.MultiIndex.from_product([['lower', 'upper'], windows, rates, idxs],
+                                         names=['bound', 'window', 'rate', 'index'])
+    return pd.DataFrame(values, index=frame.index, columns=columns)
+
+# Cache
+# Bands for stored series are kept on disk, keyed on the parameters and the
+# data version of every input series: new data for any of them means a miss.
+# Versions restart at 1 when the database is recreated, so the key also holds
+# when each version was written, and database.run() clears the directory.
+def _cache_paths(params: str, versions: str) -> Tuple[str, str]:
+    prefix = os.path.join(CACHE_DIR, hashlib.sha1(params.encode()).hexdigest()[:16])
+    return prefix, f'{prefix}_{hashlib.sha1(versions.encode()).hexdigest()[:16]}.pkl'
+
+def bootstrap_bands(series: Optional[Dict[str, tuple]] = None, rates: Sequence[str] = ('US', 'UK'),
+                    idxs: Sequence[str] = ('Food', 'All Commodities', 'Energy'), windows: Sequence[int] = (36,),
+                    freq: str = 'MS', resamples: int = RESAMPLES, block: Optional[int] = None,
+                    level: float = 0.9, seed: int = SEED, workers: Optional[int] = None) -> 'pd.DataFrame':
+    """
+    block_bootstrap_bands over stored series (see get_aligned_datas;
+    ANALYSIS_SERIES by default), cached per data version.
+    """
+    import pandas as pd
+
+    series = ANALYSIS_SERIES if series is None else series
+    rates, idxs, windows = list(rates), list(idxs), list(windows)
+
+    inputs = [(db.get_metric_id(metric), db.get_country_id(country or 'NULL'))
+              for metric, country, rule in series.values()]
+    versions = db.get_data_versions()
+    params = repr((sorted(series.items()), rates, idxs, windows, freq, resamples, block, level, seed))
+    prefix, path = _cache_paths(params, repr([versions.get(key, (0, None)) for key in inputs]))
+    try:
+        return pd.read_pickle(path)
+    except (FileNotFoundError, EOFError):
+        pass
+
+    bands = block_bootstrap_bands(get_aligned_datas(series, freq), rates, idxs, windows,
+                                  resamples, block, level, seed=seed, workers=workers)
+
+    # older versions of the same bands are dead
+    for old in glob.glob(f'{prefix}_*.pkl'):
+        if old != path:
+            files.remove(old)
+    with files.atomic_write(path) as f:
+        bands.to_pickle(f)
+    return bands
+
+def clear():
+    for path in glob.glob(os.path.join(CACHE_DIR, '*.pkl')):
+        files.remove(path)
+
+
+if __name__ == '__main__':
+    import time
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Bootstrap bands for every rate x index pair and window.')
+    parser.add_argument('--windows', default='12,24,36,60')
+    parser.add_argument('--resamples', type=int, default=RESAMPLES)
+    parser.add_argument('--level', type=float, default=0.9)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    rates = [label for label, (metric, country, rule) in ANALYSIS_SERIES.items()
+             if metric == 'policy interest rate']
+    idxs = [label for label in ANALYSIS_SERIES if label not in rates]
+    start = time.perf_counter()
+    bands = bootstrap_bands(ANALYSIS_SERIES, rates, idxs, [int(w) for w in args.windows.split(',')],
+                            resamples=args.resamples, level=args.level, workers=args.workers)
+    print(f'----- Bands for {bands.shape[1] // 2} series in {time.perf_counter() - start:.2f}s -----')
@@ -1,87 +1,292 @@
+import os
+import time
+import threading
 import requests
+import numpy as np
+import pandas as pd
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup as bs
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from typing import BinaryIO, Callable, List, Dict, Optional, Iterator, Tuple, TypeVar
 
-from src.database import get_country_id, get_metric_id, insert_data
+from src.database import get_country_id, get_metric_id, bulk_insert_data, \
+    get_watermark, update_watermark, get_data_version
+import src.instrument as instrument
+import src.response_cache as response_cache
+
+BOE = 'Bank of England'
+FRED = 'Federal Reserve Bank of St.Louis'
+
+# Point these at a local stub server (src.stub_server) to run offline.
+BOE_URL = os.environ.get('BOE_URL', 'https://www.bankofengland.co.uk/boeapps/database/fromshowcolumns.asp')
+FRED_URL = os.environ.get('FRED_URL', 'https://fred.stlouisfed.org/graph/fredgraph.csv')
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Fetching
+TIMEOUT = (5, 30) # connect, read (seconds)
+RETRIES = 3
+BACKOFF = 0.5 # seconds, doubled after every failed attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_WORKERS = 8
+MAX_PER_HOST = 4
+CHUNK_SIZE = 50_000 # rows parsed and written per batch
+
+_host_limits: Dict[str, threading.Semaphore] = {}
+_host_limits_lock = threading.Lock()
+
+T = TypeVar('T')
 
 # Util
-def extract_data(text):
-    data = []
-    lines = text.splitlines()
-    # check for header
-    l1 = lines[0].strip().lower()
-    start = 1 if 'date' in l1 or 'value' in l1 else 0
-    for line in lines[start:]:
-        item = line.strip().split(',')
-        data.append({'date': item[0].strip(), 'value': item[1].strip()})
-    return data
+def extract_data(stream, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[np.ndarray, np.ma.MaskedArray]]:
+    """
+    Parse a date,value CSV from a file-like stream in chunks of `chunk_size`
+    rows. Yields datetime64[D] dates and float64 values, with missing values
+    (FRED's '.') masked. Header and malformed rows are dropped.
+    """
+    try:
+        reader = pd.read_csv(stream, header=None, usecols=[0, 1], names=['date', 'value'],
+                             dtype=str, chunksize=chunk_size)
+        for chunk in reader:
+            dates = pd.to_datetime(chunk['date'].str.strip(), format='%Y-%m-%d', errors='coerce')
+            rows = dates.notna().to_numpy()
+            values = pd.to_numeric(chunk['value'].str.strip(), errors='coerce').to_numpy('float64')
+            yield dates.to_numpy('datetime64[D]')[rows], np.ma.masked_invalid(values[rows])
+    except pd.errors.EmptyDataError:
+        return
 
-def collect_boe_data():
+def extract_boe_data(html) -> Iterator[Tuple[np.ndarray, np.ma.MaskedArray]]:
+    soup = bs(html, 'html.parser')
+    rows = soup.find('tbody').find_all('tr')
+
+    dates = []
+    values = []
+    for row in rows:
+        cells = row.find_all('td')
+        if len(cells) >= 2:
+            dates.append(cells[0].text.strip()) # 20 Jan 25
+            values.append(cells[1].text.strip())
+
+    dates = pd.to_datetime(dates, format='%d %b %y').to_numpy('datetime64[D]')
+    values = pd.to_numeric(pd.Series(values, dtype=str), errors='coerce').to_numpy('float64')
+    yield dates, np.ma.masked_invalid(values)
+
+def window_start(country_code, metric_name, source_name,
+                 default_start: str, overlap_days: int) -> datetime:
+    # Only fetch after the stored watermark, going back `overlap_days`
+    # so restated points are picked up again.
+    start = datetime.strptime(default_start, '%Y-%m-%d')
+    watermark = get_watermark(country_code, metric_name, source_name)
+    if watermark is None or watermark['last_date'] is None:
+        return start
+    last_date = datetime.strptime(watermark['last_date'], '%Y-%m-%d')
+    return max(start, last_date - timedelta(days=overlap_days))
+
+# HTTP
+def make_session(pool_size: int = MAX_WORKERS) -> requests.Session:
+    # one pooled session shared by every fetch (keep-alive per host)
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+@contextmanager
+def host_limit(host: str):
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.Semaphore(MAX_PER_HOST)
+        semaphore = _host_limits[host]
+    with semaphore:
+        yield
 
-    url = 'https://www.bankofengland.co.uk/boeapps/database/fromshowcolumns.asp?Travel=NIxAZxSUx&FromSeries=1&ToSeries=50&DAT=RNG&FNY=N&CSVF=TT&html.x=66&html.y=26&SeriesCodes=IUDBEDR&UsingCodes=Y&Filter=N&title=IUDBEDR&VPD=Y#'
+def fetch(session: requests.Session, url: str, params: Optional[Dict] = None,
+          timeout=TIMEOUT, retries: int = RETRIES, backoff: float = BACKOFF,
+          headers: Optional[Dict] = None,
+          consume: Callable[[requests.Response], T] = lambda response: response.content) -> T:
+    # `consume` reads the response (stream=True) and its result is returned.
+    # It runs under the host limit and inside the retry loop, so a body cut
+    # short is fetched again. A 304 (conditional `headers`) is passed to it
+    # as is.
+    host = urlparse(url).netloc
+    for attempt in range(retries + 1):
+        try:
+            with host_limit(host):
+                with session.get(url, params=params, timeout=timeout, stream=True,
+                                 headers=headers) as response:
+                    if response.status_code not in RETRY_STATUSES or attempt == retries:
+                        response.raise_for_status()
+                        return consume(response)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            if attempt == retries:
+                raise
+        time.sleep(backoff * 2 ** attempt)
+
+# Jobs
+# A job is one series: where to fetch it, how to parse it and where to store it.
+# Parsers read the raw payload from a binary stream, per source.
+PARSERS = {
+    BOE: lambda stream: extract_boe_data(stream.read()),
+    FRED: extract_data,
+}
+
+# params that follow today's date, left out when matching a request to the
+# validators of the last one (see response_cache.conditional_headers)
+BOE_MOVING = ('TD', 'TM', 'TY')
+FRED_MOVING = ('coed', 'vintage_date', 'revision_date')
+
+def boe_jobs(url: str = BOE_URL) -> List[Dict]:
     today = datetime.now()
+    start = window_start('UK', 'policy interest rate', BOE, '2000-01-01', overlap_days=7)
     params = {
-        'FD': '1',
-        'FM': 'Jan',
-        'FY': '2000',
+        'Travel': 'NIxAZxSUx', 'FromSeries': '1', 'ToSeries': '50',
+        'DAT': 'RNG', 'FNY': 'N', 'CSVF': 'TT', 'html.x': '66', 'html.y': '26',
+        'SeriesCodes': 'IUDBEDR', 'UsingCodes': 'Y', 'Filter': 'N',
+        'title': 'IUDBEDR', 'VPD': 'Y',
+        'FD': start.strftime('%d'),
+        'FM': start.strftime('%b'),
+        'FY': start.strftime('%Y'),
         # get most up to date data
         'TD': today.strftime('%d'),
         'TM': today.strftime('%b'),
         'TY': today.strftime('%Y')
     }
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
-    response = requests.get(url, params=params, headers=headers)
-    response.raise_for_status()
+    return [{
+        'country': 'UK', 'metric': 'policy interest rate', 'source': BOE,
+        'url': url, 'params': params,
+        'moving': BOE_MOVING,
+        'parse': PARSERS[BOE],
+    }]
 
-    html = response.text
-    soup = bs(html, 'html.parser')
-    rows = soup.find('tbody').find_all('tr')
+def fred_jobs(url: str = FRED_URL) -> List[Dict]:
+    today = datetime.now().strftime('%Y-%m-%d')
+    # (series id, country, metric, frequency, first date, overlap days)
+    series = [
+        ('DFF', 'US', 'policy interest rate', 'Daily, 7-Day', '2000-01-01', 7),
+        ('PNRGINDEXM', 'NULL', 'global energy index', 'Monthly', '1992-01-01', 93),
+        ('PALLFNFINDEXQ', 'NULL', 'global all commodities index', 'Quarterly', '2003-01-01', 184),
+        ('PFOODINDEXM', 'NULL', 'global food index', 'Monthly', '1992-01-01', 93),
+    ]
 
-    data = []
-    for row in rows:
-        cells = row.find_all('td')
-        if len(cells) >= 2:
-            date_str = cells[0].text.strip() # 20 Jan 25
-            value_str = cells[1].text.strip()
+    jobs = []
+    for series_id, country, metric, frequency, first_date, overlap_days in series:
+        start = window_start(country, metric, FRED, first_date, overlap_days)
+        params = {
+            'id': series_id,
+            'cosd': start.strftime('%Y-%m-%d'),
+            'coed': today,
+            'fq': frequency,
+            'fam': 'avg',
+            'fml': 'a',
+            'transformation': 'lin',
+            'vintage_date': today,
+            'revision_date': today,
+        }
+        jobs.append({
+            'country': country, 'metric': metric, 'source': FRED,
+            'url': url, 'params': params,
+            'moving': FRED_MOVING,
+            'parse': PARSERS[FRED],
+        })
+    return jobs
 
-            date = datetime.strptime(date_str, '%d %b %y').strftime('%Y-%m-%d')
-            value = float(value_str)
+def _insert(job: Dict, stream: BinaryIO):
+    # parse and write the payload chunk by chunk
+    source = job['source']
+    chunks = job['parse'](stream)
+    while True:
+        with instrument.timer('collection_parse_seconds', source=source):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        with instrument.timer('collection_insert_seconds', source=source):
+            bulk_insert_data(job['country'], job['metric'], *chunk)
 
-            data.append({'date': date, 'value': value,})
+def _series_version(job: Dict) -> int:
+    return get_data_version(get_metric_id(job['metric']), get_country_id(job['country']))
 
-    insert_data('UK', 'policy interest rate', data)
+def collect_job(session: requests.Session, job: Dict):
+    # The body is saved to the response cache as it downloads, then parsed
+    # from there - unless the server answers 304 or the payload is the one
+    # already applied, when the series is left alone.
+    # fetch time runs to the end of the body, retries included.
+    source = job['source']
+    record = response_cache.load(job)
+    current = record is not None and record['version'] == _series_version(job)
 
-def collect_fred_data():
-    today = datetime.now().strftime('%Y-%m-%d')
-    policy_interest_url = f'https://fred.stlouisfed.org/graph/fredgraph.csv?bgcolor=%23ebf3fb&chart_type=line&drp=0&fo=open%20sans&graph_bgcolor=%23ffffff&height=450&mode=fred&recession_bars=on&txtcolor=%23444444&ts=12&tts=12&width=1320&nt=0&thu=0&trc=0&show_legend=yes&show_axis_titles=yes&show_tooltip=yes&id=DFF&scale=left&cosd=2000-01-01&coed={today}&line_color=%230073e6&link_values=false&line_style=solid&mark_type=none&mw=3&lw=3&ost=-99999&oet=99999&mma=0&fml=a&fq=Daily%2C%207-Day&fam=avg&fgst=lin&fgsnd=2020-02-01&line_index=1&transformation=lin&vintage_date={today}&revision_date={today}&nd=1954-07-01'
-    energy_index_url = f'https://fred.stlouisfed.org/graph/fredgraph.csv?bgcolor=%23ebf3fb&chart_type=line&drp=0&fo=open%20sans&graph_bgcolor=%23ffffff&height=450&mode=fred&recession_bars=off&txtcolor=%23444444&ts=12&tts=12&width=1078&nt=0&thu=0&trc=0&show_legend=yes&show_axis_titles=yes&show_tooltip=yes&id=PNRGINDEXM&scale=left&cosd=1992-01-01&coed=2025-06-01&line_color=%230073e6&link_values=false&line_style=solid&mark_type=none&mw=3&lw=3&ost=-99999&oet=99999&mma=0&fml=a&fq=Monthly&fam=avg&fgst=lin&fgsnd=2020-02-01&line_index=1&transformation=lin&vintage_date={today}&revision_date={today}&nd=2000-01-01'
-    all_commodities_index_url = f'https://fred.stlouisfed.org/graph/fredgraph.csv?bgcolor=%23ebf3fb&chart_type=line&drp=0&fo=open%20sans&graph_bgcolor=%23ffffff&height=450&mode=fred&recession_bars=off&txtcolor=%23444444&ts=12&tts=12&width=1078&nt=0&thu=0&trc=0&show_legend=yes&show_axis_titles=yes&show_tooltip=yes&id=PALLFNFINDEXQ&scale=left&cosd=2003-01-01&coed=2025-04-01&line_color=%230073e6&link_values=false&line_style=solid&mark_type=none&mw=3&lw=3&ost=-99999&oet=99999&mma=0&fml=a&fq=Quarterly&fam=avg&fgst=lin&fgsnd=2020-02-01&line_index=1&transformation=lin&vintage_date={today}&revision_date={today}&nd=2003-01-01'
-    food_index_url = f'https://fred.stlouisfed.org/graph/fredgraph.csv?bgcolor=%23ebf3fb&chart_type=line&drp=0&fo=open%20sans&graph_bgcolor=%23ffffff&height=450&mode=fred&recession_bars=off&txtcolor=%23444444&ts=12&tts=12&width=1078&nt=0&thu=0&trc=0&show_legend=yes&show_axis_titles=yes&show_tooltip=yes&id=PFOODINDEXM&scale=left&cosd=1992-01-01&coed=2025-06-01&line_color=%230073e6&link_values=false&line_style=solid&mark_type=none&mw=3&lw=3&ost=-99999&oet=99999&mma=0&fml=a&fq=Monthly&fam=avg&fgst=lin&fgsnd=2020-02-01&line_index=1&transformation=lin&vintage_date={today}&revision_date={today}&nd=200-01-01'
+    def download(response: requests.Response):
+        if response.status_code == 304:
+            return response, None
+        with instrument.timer('collection_download_seconds', source=source):
+            return response, response_cache.store_body(response.iter_content(response_cache.READ_SIZE))
+
+    headers = response_cache.conditional_headers(record, job['url'], job['params'], job.get('moving', ())) \
+        if current else {}
+    with instrument.timer('collection_fetch_seconds', source=source):
+        response, body = fetch(session, job['url'], job['params'], headers=headers, consume=download)
+    if body is None:
+        instrument.inc('collection_not_modified_total', source=source)
+        # nothing new, but the series is up to date as of now
+        update_watermark(job['country'], job['metric'], job['source'])
+        return
+    digest, size = body
+    instrument.inc('collection_bytes_total', size, source=source)
 
-    # US Interest Rates
-    response = requests.get(policy_interest_url)
-    insert_data('US','policy interest rate', extract_data(response.text))
+    if current and digest == record['digest']:
+        # same payload under new validators: keep them for the next request
+        instrument.inc('collection_unchanged_total', source=source)
+        update_watermark(job['country'], job['metric'], job['source'])
+        response_cache.save(job, response, digest, record['version'], applied=False, record=record)
+        return
 
-    # Global Energy Index
-    response = requests.get(energy_index_url)
-    insert_data('NULL','global energy index', extract_data(response.text))
+    with response_cache.open_object(digest) as stream:
+        _insert(job, stream)
+    update_watermark(job['country'], job['metric'], job['source'])
+    response_cache.save(job, response, digest, _series_version(job), applied=True, record=record)
 
-    # Global All Commodities Index
-    response = requests.get(all_commodities_index_url)
-    insert_data('NULL','global all commodities index', extract_data(response.text))
+def collect(jobs: List[Dict], session: Optional[requests.Session] = None,
+            max_workers: int = MAX_WORKERS):
+    # Each worker downloads, parses and writes its own series, so parsing
+    # and DB writes overlap with the downloads still in flight.
+    session = session or make_session(max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(collect_job, session, job) for job in jobs]
+        for future in as_completed(futures):
+            future.result()
+
+def collect_boe_data():
+    collect(boe_jobs())
+
+def collect_fred_data():
+    collect(fred_jobs())
 
-    # Global Food Index
-    response = requests.get(food_index_url)
-    insert_data('NULL','global food index', extract_data(response.text))
+def replay():
+    """
+    Rebuild every cached series from its logged payloads, in the order
+    they were first applied, without touching the network.
+    """
+    for record in response_cache.records():
+        job = dict(record, parse=PARSERS[record['source']])
+        for digest in response_cache.replay_log(record):
+            with response_cache.open_object(digest) as stream:
+                _insert(job, stream)
+        update_watermark(job['country'], job['metric'], job['source'])
+        response_cache.set_version(record, _series_version(job))
 
-def run():
+def run(offline: bool = False):
     print('----- Collecting Data: Running -----', end='\r')
-    collect_boe_data()
-    collect_fred_data() 
+    if offline:
+        replay()
+    else:
+        collect(boe_jobs() + fred_jobs())
     print('----- Collecting Data: Done -----')
 
 
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()
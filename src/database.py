@@ -1,61 +1,271 @@
 import os
+import sys
+import atexit
 import sqlite3
-import pandas as pd
-from typing import List, Dict, Optional
+import threading
+import weakref
+import numpy as np
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Iterator, List, Dict, Optional, Set
+
+# pandas is imported inside the functions that build frames, so readers of
+# raw rows and arrays (the API) never load it.
+if TYPE_CHECKING:
+    import pandas as pd
+
+import src.series_cache as series_cache
+import src.instrument as instrument
+import src.storage as storage
+from src.storage import _conflict_target
+
+DB_PATH = 'finance_data.db'
+# where data points and rollups are stored, see src.storage
+BACKEND = os.environ.get('FINANCE_BACKEND', 'sqlite')
+PARQUET_DIR = 'finance_data.parquet'
+
+# CONNECTIONS #
+# One long-lived connection per thread (FastAPI runs sync endpoints in a
+# threadpool). WAL lets readers carry on while the collector writes.
+PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA mmap_size=268435456',
+]
+
+_local = threading.local()
+_connections: Set[sqlite3.Connection] = set()
+_connections_lock = threading.Lock()
+_generation = 0
+
+class _Holder:
+    # a thread's connection; dropped with the thread's locals when it exits
+    __slots__ = ('conn', 'generation', 'versions', '__weakref__')
+
+    def __init__(self, conn: sqlite3.Connection, generation: int):
+        self.conn = conn
+        self.generation = generation
+        # (signature, data versions) as this connection last read them
+        self.versions = None
+
+def _open_connection():
+    # check_same_thread is off so close_connections() and the finalizer of
+    # a dead thread's holder can close it; a handle is still used by one thread.
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    instrument.inc('db_connections_opened_total')
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+def _release(conn: sqlite3.Connection):
+    with _connections_lock:
+        _connections.discard(conn)
+    try:
+        conn.close()
+    except sqlite3.ProgrammingError:
+        pass
 
 def connect():
-    return sqlite3.connect('finance_data.db')
+    holder = getattr(_local, 'holder', None)
+    if holder is None or holder.generation != _generation:
+        conn = _open_connection()
+        with _connections_lock:
+            _connections.add(conn)
+            holder = _Holder(conn, _generation)
+        # threadpool workers come and go: close the handle with its thread
+        weakref.finalize(holder, _release, conn)
+        _local.holder = holder
+    return holder.conn
+
+def close_connections():
+    global _generation
+    with _connections_lock:
+        connections = list(_connections)
+        _connections.clear()
+        # invalidate handles cached in other threads
+        _generation += 1
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.ProgrammingError:
+            pass
+    _local.holder = None
+
+atexit.register(close_connections)
+
+_store: Optional[storage.Store] = None
+
+def get_store() -> storage.Store:
+    global _store
+    if _store is None or (_store.name, getattr(_store, 'root', PARQUET_DIR)) != (BACKEND, PARQUET_DIR):
+        _store = storage.open_store(BACKEND, connect, PARQUET_DIR)
+    return _store
 
 # SETUP #
+# table: column definitions, in creation order
+TABLES = {
+    'countries': '''
+        country_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        country_code TEXT NOT NULL,
+        country_name TEXT NOT NULL,
+        currency_code TEXT NOT NULL
+    ''',
+    'metrics': '''
+        metric_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        metric_name TEXT NOT NULL,
+        unit TEXT
+    ''',
+    'sources': '''
+        source_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        country_id INTEGER,
+        metric_id INTEGER NOT NULL,
+        source_name TEXT NOT NULL,
+        source_url TEXT,
+        FOREIGN KEY(country_id) REFERENCES countries(country_id)
+        FOREIGN KEY(metric_id) REFERENCES metrics(metric_id)
+        UNIQUE(country_id, metric_id)
+    ''',
+    'data_points': '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        country_id INTEGER,
+        metric_id INTEGER NOT NULL,
+        date DATE NOT NULL,
+        value FLOAT NOT NULL,
+        FOREIGN KEY(country_id) REFERENCES countries(country_id)
+        FOREIGN KEY(metric_id) REFERENCES metrics(metric_id)
+        UNIQUE(country_id, metric_id, date)
+    ''',
+    'watermarks': '''
+        country_id INTEGER,
+        metric_id INTEGER NOT NULL,
+        source_name TEXT NOT NULL,
+        last_date DATE,
+        last_fetched TIMESTAMP NOT NULL,
+        FOREIGN KEY(country_id) REFERENCES countries(country_id)
+        FOREIGN KEY(metric_id) REFERENCES metrics(metric_id)
+        UNIQUE(country_id, metric_id, source_name)
+    ''',
+    # Bumped by every write that changes a series, so caches can key on it.
+    'data_versions': '''
+        country_id INTEGER,
+        metric_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        updated_at TIMESTAMP NOT NULL,
+        FOREIGN KEY(country_id) REFERENCES countries(country_id)
+        FOREIGN KEY(metric_id) REFERENCES metrics(metric_id)
+        UNIQUE(country_id, metric_id)
+    ''',
+    # See ROLLUPS. period is the resampled label (month/quarter start, month end).
+    'rollups': '''
+        country_id INTEGER,
+        metric_id INTEGER NOT NULL,
+        freq TEXT NOT NULL,
+        period DATE NOT NULL,
+        value FLOAT NOT NULL,
+        FOREIGN KEY(country_id) REFERENCES countries(country_id)
+        FOREIGN KEY(metric_id) REFERENCES metrics(metric_id)
+        UNIQUE(country_id, metric_id, freq, period)
+    ''',
+}
+
 def create_tables():
+    # Also brings a database from an older schema up to date (see upgrade).
     conn = connect()
     cur = conn.cursor()
 
+    for table, columns in TABLES.items():
+        cur.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+    _upgrade_tables(cur)
+
+    conn.commit()
+    create_indexes()
+    _backfill()
+
+def _rebuild(cur: sqlite3.Cursor, table: str):
+    # SQLite can't drop a NOT NULL: copy the rows into the current schema
+    columns = [row[1] for row in cur.execute(f'PRAGMA table_info({table})')]
+    cur.execute(f'CREATE TABLE {table}_new ({TABLES[table]})')
+    cur.execute(f'INSERT INTO {table}_new ({", ".join(columns)}) SELECT {", ".join(columns)} FROM {table}')
+    cur.execute(f'DROP TABLE {table}')
+    cur.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+def _upgrade_tables(cur: sqlite3.Cursor):
+    # Global series have no country: country_id is NULL. Databases built
+    # before this stored the string 'NULL' (in a NOT NULL sources column),
+    # and sources held metric names rather than ids.
+    not_null = {row[1]: row[3] for row in cur.execute('PRAGMA table_info(sources)')}
+    if not_null['country_id']:
+        _rebuild(cur, 'sources')
+    for table in ('sources', 'data_points', 'watermarks'):
+        cur.execute(f"UPDATE {table} SET country_id = NULL WHERE country_id = 'NULL'")
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS countries (
-            country_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            country_code TEXT NOT NULL,
-            country_name TEXT NOT NULL,
-            currency_code TEXT NOT NULL
-        )
+        UPDATE sources SET metric_id = (
+            SELECT metrics.metric_id FROM metrics WHERE metrics.metric_name = sources.metric_id)
+        WHERE typeof(metric_id) = 'text'
     ''')
 
+def _backfill():
+    # series stored before data versions and rollups existed get both
+    versions = get_data_versions()
+    missing = [key for key in get_store().series() if key not in versions]
+    if not missing:
+        return
+    with _write_transaction() as cur:
+        for metric_id, country_id in missing:
+            _update_rollups(country_id, metric_id)
+            _bump_data_version(cur, country_id, metric_id)
+
+def upgrade():
+    """Bring the database at DB_PATH up to the current schema, keeping its data."""
+    print('----- Database Upgrade: Running -----', end='\r')
+    invalidate_cache()
+    create_tables()
+    invalidate_cache()
+    print('----- Database Upgrade: Done -----')
+
+def create_indexes():
+    conn = connect()
+    cur = conn.cursor()
+
+    cur.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_countries_code
+        ON countries (country_code)
+    ''')
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS metrics (
-            metric_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            metric_name TEXT NOT NULL,
-            unit TEXT
-        )
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_metrics_name
+        ON metrics (metric_name)
     ''')
 
+    # Covering index for every series read (metric first, so global
+    # and per-country lookups share it).
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS sources (
-            source_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            country_id INTEGER NOT NULL,
-            metric_id INTEGER NOT NULL,
-            source_name TEXT NOT NULL,
-            source_url TEXT,
-            FOREIGN KEY(country_id) REFERENCES countries(country_id)
-            FOREIGN KEY(metric_id) REFERENCES metrics(metric_id)
-            UNIQUE(country_id, metric_id)
-        )
+        CREATE INDEX IF NOT EXISTS idx_data_points_series
+        ON data_points (metric_id, country_id, date, value)
     ''')
 
+    # UNIQUE(...) treats NULLs as distinct, so global series need their own
+    # unique index to keep one point per date (and to upsert against).
+    cur.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_data_points_global
+        ON data_points (metric_id, date) WHERE country_id IS NULL
+    ''')
+    cur.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_watermarks_global
+        ON watermarks (metric_id, source_name) WHERE country_id IS NULL
+    ''')
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS data_points (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            country_id INTEGER,
-            metric_id INTEGER NOT NULL,
-            date DATE NOT NULL,
-            value FLOAT NOT NULL,
-            FOREIGN KEY(country_id) REFERENCES countries(country_id)
-            FOREIGN KEY(metric_id) REFERENCES metrics(metric_id)
-            UNIQUE(country_id, metric_id, date)
-        )
+        CREATE INDEX IF NOT EXISTS idx_rollups_series
+        ON rollups (metric_id, country_id, freq, period, value)
+    ''')
+    cur.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_data_versions_global
+        ON data_versions (metric_id) WHERE country_id IS NULL
     ''')
 
     conn.commit()
-    conn.close()
 
 # INSTERT #
 def add_country(country_code, country_name, currency_code):
@@ -66,7 +276,7 @@ def add_country(country_code, country_name, currency_code):
         VALUES (?, ?, ?)    
     ''', (country_code, country_name, currency_code))
     conn.commit()
-    conn.close()
+    invalidate_cache()
 
 def add_countries():
     add_country('UK', 'United Kingdom', 'GBP')
@@ -82,7 +292,7 @@ def add_metric(metric_name, unit):
     ''', (metric_name, unit))
 
     conn.commit()
-    conn.close()
+    invalidate_cache()
 
 def add_metrics():
     add_metric('policy interest rate', '%')
@@ -90,9 +300,10 @@ def add_metrics():
     add_metric('global all commodities index', '')
     add_metric('global food index', '')
 
-def add_source(country_code, metric_id, source_name, source_url):
+def add_source(country_code, metric_name, source_name, source_url):
 
     country_id = get_country_id(country_code)
+    metric_id = get_metric_id(metric_name)
     conn = connect()
     cur = conn.cursor()
 
@@ -102,7 +313,7 @@ def add_source(country_code, metric_id, source_name, source_url):
     ''', (country_id, metric_id, source_name, source_url,))
 
     conn.commit()
-    conn.close()
+    invalidate_cache()
 
 def add_sources():
     add_source('UK', 'policy interest rate', 'Bank of England', 'https://www.bankofengland.co.uk/boeapps/database/')
@@ -111,95 +322,348 @@ def add_sources():
     add_source('NULL', 'global all commodities index', 'Federal Reserve Bank of St.Louis', 'https://fred.stlouisfed.org/series/DFF')
     add_source('NULL', 'global food index', 'Federal Reserve Bank of St.Louis', 'https://fred.stlouisfed.org/series/DFF')
 
-def insert_data(country_code, metric_name, data: List[Dict]):
+@contextmanager
+def _write_transaction(store: Optional[storage.Store] = None) -> Iterator[sqlite3.Cursor]:
+    """
+    BEGIN IMMEDIATE on the thread's connection, committed if the block
+    succeeds and rolled back if it raises. Writes to `store` (the current
+    one by default) made in the block go with it: see storage.
+    """
+    conn = connect()
+    with (store or get_store()).transaction():
+        cur = conn.cursor()
+        try:
+            # take the write lock up front: writers read the series before
+            # changing it, and a deferred read-then-write can't wait out others
+            cur.execute('BEGIN IMMEDIATE')
+            yield cur
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def _bump_data_version(cur: sqlite3.Cursor, country_id, metric_id):
+    cur.execute(f'''
+        INSERT INTO data_versions (country_id, metric_id, version, updated_at)
+        VALUES (?, ?, 1, ?)
+        ON CONFLICT{_conflict_target(country_id)}
+        DO UPDATE SET version = version + 1, updated_at = excluded.updated_at
+    ''', (country_id, metric_id, datetime.now(timezone.utc).isoformat(timespec='seconds')))
+
+def insert_data(country_code, metric_name, data: List[Dict]) -> Dict[str, int]:
+    dates = [record['date'] for record in data]
+    values = [record['value'] for record in data]
+    return bulk_insert_data(country_code, metric_name, dates, values)
+
+def _to_columns(dates, values=None):
+    # DataFrame with date/value columns, or a Series/DataFrame on a date index
+    # (if pandas isn't loaded, the input can't be either)
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(dates, pd.DataFrame):
+        if 'date' in dates.columns:
+            values = dates['value'].to_numpy()
+            dates = dates['date'].to_numpy()
+        else:
+            values = dates.iloc[:, 0].to_numpy()
+            dates = dates.index.to_numpy()
+    elif pd is not None and isinstance(dates, pd.Series):
+        values = dates.to_numpy()
+        dates = dates.index.to_numpy()
+
+    if np.ma.isMaskedArray(values):
+        values = values.astype('float64').filled(np.nan)
+    dates = np.asarray(dates)
+    values = np.asarray(values, dtype='float64')
+    if len(dates) != len(values):
+        raise ValueError(f'{len(dates)} dates but {len(values)} values')
+
+    if np.issubdtype(dates.dtype, np.datetime64):
+        dates = np.datetime_as_string(dates.astype('datetime64[D]'))
+    else:
+        dates = dates.astype(str)
+
+    # value is NOT NULL, missing points are skipped
+    keep = ~np.isnan(values)
+    return dates[keep], values[keep]
+
+@instrument.timed('db_write_seconds')
+def bulk_insert_data(country_code, metric_name, dates, values=None) -> Dict[str, int]:
+    """
+    Upsert a whole series in one transaction. `dates` may be an array of
+    date strings/datetime64 (with `values` alongside), a Series on a date
+    index, or a DataFrame with date and value columns.
+    Revised values overwrite stored ones. Returns inserted/updated/unchanged counts.
+    """
+    dates, values = _to_columns(dates, values)
+
+    country_id = get_country_id(country_code)
+    metric_id = get_metric_id(metric_name)
 
+    with _write_transaction() as cur:
+        staged, existing, unchanged, first_changed = get_store().upsert(metric_id, country_id, dates, values)
+
+        if unchanged < staged:
+            _update_rollups(country_id, metric_id, first_changed)
+            _bump_data_version(cur, country_id, metric_id)
+    instrument.inc('db_rows_written_total', staged - unchanged)
+
+    return {
+        'inserted': staged - existing,
+        'updated': existing - unchanged,
+        'unchanged': unchanged,
+    }
+
+# ROLLUPS #
+# Pre-aggregated copies of every series, kept in step by the ingest path:
+#   'MS' - monthly mean of the daily forward-filled series (as analysis uses)
+#   'ME' - month-end (last) value
+#   'QS' - quarterly mean of the daily forward-filled series
+ROLLUPS = {'MS': 'mean', 'ME': 'last', 'QS': 'mean'}
+
+def _rollup(s: 'pd.Series', freq: str) -> 'pd.Series':
+    if ROLLUPS[freq] == 'last':
+        return s.resample(freq).last().dropna()
+    return s.resample('D').last().ffill().resample(freq).mean().dropna()
+
+def _update_rollups(country_id, metric_id, since: Optional[str] = None):
+    """
+    Recompute the rollup periods from the one holding `since` onwards.
+    Forward fill can carry a changed point into later periods, so those are
+    redone too, as is the period of the point before it (now filled up to
+    `since`); earlier periods are left alone.
+    """
+    import pandas as pd
+
+    store = get_store()
+    first_period = None
+    if since is not None:
+        previous = store.before(metric_id, country_id, since)
+        # quarter start covers the month as well for every rollup
+        first_period = pd.Timestamp(previous or since).to_period('Q').start_time
+
+    # plus the last point before it, to forward fill from
+    start = None
+    if first_period is not None:
+        start = store.before(metric_id, country_id, first_period.strftime('%Y-%m-%d')) \
+            or first_period.strftime('%Y-%m-%d')
+    rows = store.rows(metric_id, country_id, start=start)
+    s = pd.Series([value for date, value in rows],
+                  index=pd.to_datetime([date for date, value in rows], format='%Y-%m-%d'),
+                  dtype='float64')
+
+    for freq in ROLLUPS:
+        rolled = _rollup(s, freq) if len(s) else s
+        if first_period is not None:
+            start = first_period if freq != 'ME' else first_period + pd.offsets.MonthEnd(0)
+            rolled = rolled[rolled.index >= start]
+            start = start.strftime('%Y-%m-%d')
+        else:
+            start = ''
+        store.write_rollup(metric_id, country_id, freq, start,
+                           rolled.index.strftime('%Y-%m-%d').tolist(), rolled.tolist())
+
+@instrument.timed('db_write_seconds')
+def rebuild_rollups():
+    # fill rollups for every stored series (e.g. a database from before them)
+    with _write_transaction() as cur:
+        for metric_id, country_id in get_store().series():
+            _update_rollups(country_id, metric_id)
+            _bump_data_version(cur, country_id, metric_id)
+
+@instrument.timed('db_write_seconds')
+def delete_data(country_code, metric_name):
+    # drop a whole series, its rollups with it
     country_id = get_country_id(country_code)
     metric_id = get_metric_id(metric_name)
 
+    with _write_transaction() as cur:
+        get_store().delete(metric_id, country_id)
+        _bump_data_version(cur, country_id, metric_id)
+
+@instrument.timed('db_write_seconds')
+def update_watermark(country_code, metric_name, source_name):
+    # latest stored date for the series, plus the time of this fetch
+    country_id = get_country_id(country_code)
+    metric_id = get_metric_id(metric_name)
+
+    latest = get_store().latest(metric_id, country_id)
+    last_date = latest[0][0] if latest else None
+
     conn = connect()
     cur = conn.cursor()
 
-    for record in data:
-        cur.execute('''
-            INSERT OR IGNORE INTO data_points (country_id, metric_id, date, value)
-            VALUES (?, ?, ?, ?)
-        ''', 
-        (country_id, metric_id, record['date'], record['value']))
+    cur.execute(f'''
+        INSERT INTO watermarks (country_id, metric_id, source_name, last_date, last_fetched)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT{_conflict_target(country_id, 'source_name')}
+        DO UPDATE SET last_date = excluded.last_date, last_fetched = excluded.last_fetched
+    ''', (country_id, metric_id, source_name, last_date, datetime.now().isoformat(timespec='seconds')))
 
     conn.commit()
-    conn.close()
 
-# GET #
-def get_country_id(country_code):
-
-    if country_code == 'NULL':
-        return 'NULL'
+# DIMENSION CACHE #
+# country/metric ids <-> names, loaded in bulk on first use and dropped
+# whenever add_country/add_metric/add_source change those tables.
+class UnknownNameError(LookupError):
+    pass
+
+_dimensions: Optional[Dict[str, Dict]] = None
+_dimensions_lock = threading.Lock()
+
+def _load_dimensions() -> Dict[str, Dict]:
+    cur = connect().cursor()
+    cur.execute('SELECT country_code, country_id FROM countries')
+    countries = cur.fetchall()
+    cur.execute('SELECT metric_name, metric_id FROM metrics')
+    metrics = cur.fetchall()
+    return {
+        'country_ids': dict(countries),
+        'country_codes': {id: code for code, id in countries},
+        'metric_ids': dict(metrics),
+        'metric_names': {id: name for name, id in metrics},
+    }
+
+def _lookup(table: str, key, label: str):
+    global _dimensions
+    dimensions = _dimensions
+    if dimensions is None or key not in dimensions[table]:
+        # miss: another process may have added it, reload once
+        with _dimensions_lock:
+            _dimensions = dimensions = _load_dimensions()
+    if key not in dimensions[table]:
+        raise UnknownNameError(f'unknown {label}: {key!r}')
+    return dimensions[table][key]
+
+def invalidate_cache():
+    global _dimensions
+    with _dimensions_lock:
+        _dimensions = None
 
+# GET #
+def get_data_version(metric_id, country_id=None) -> int:
+    # 0 until the series is first written
     conn = connect()
     cur = conn.cursor()
 
     cur.execute('''
-        SELECT country_id FROM countries
-        WHERE country_code = ?
-    ''', (country_code,))
+        SELECT version FROM data_versions
+        WHERE metric_id = ? AND country_id IS ?
+    ''', (metric_id, country_id))
+
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+def _versions_signature(conn: sqlite3.Connection) -> tuple:
+    # PRAGMA data_version moves whenever another connection (or process)
+    # commits, total_changes whenever this one writes; neither reads a table
+    return conn.execute('PRAGMA data_version').fetchone()[0], conn.total_changes
+
+@instrument.timed('db_query_seconds')
+def get_data_versions() -> Dict[tuple, tuple]:
+    """
+    {(metric_id, country_id): (version, updated_at)} for every series,
+    held in memory per connection and reloaded only after a commit.
+    """
+    conn = connect()
+    holder = _local.holder
+    signature = _versions_signature(conn)
+    if holder.versions is not None and holder.versions[0] == signature:
+        return holder.versions[1]
 
-    id = cur.fetchone()[0]
-    conn.close()
-    return id
+    cur = conn.cursor()
+    cur.execute('SELECT metric_id, country_id, version, updated_at FROM data_versions')
+    versions = {(metric_id, country_id): (version, updated_at)
+                for metric_id, country_id, version, updated_at in cur.fetchall()}
+    holder.versions = (signature, versions)
+    return versions
+
+@instrument.timed('db_query_seconds')
+def get_watermark(country_code, metric_name, source_name) -> Optional[Dict]:
+    country_id = get_country_id(country_code)
+    metric_id = get_metric_id(metric_name)
 
-def get_metric_id(metric_name):
     conn = connect()
     cur = conn.cursor()
 
     cur.execute('''
-        SELECT metric_id FROM metrics
-        WHERE metric_name = ?
-    ''', (metric_name,))
+        SELECT last_date, last_fetched FROM watermarks
+        WHERE country_id IS ? AND metric_id = ? AND source_name = ?
+    ''', (country_id, metric_id, source_name))
 
-    id = cur.fetchone()[0]
-    conn.close()
-    return id
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return {'last_date': row[0], 'last_fetched': row[1]}
 
-def get_data_country_metric(country_id: str, metric_id: str):
-    conn = connect()
-    cur = conn.cursor()
+def get_country_id(country_code):
 
-    cur.execute('''
-    SELECT date, value FROM data_points
-    WHERE country_id = ? AND metric_id = ?
-    ''', (country_id, metric_id))
+    # global series
+    if country_code == 'NULL':
+        return None
 
-    data = cur.fetchall()
-    conn.close()
-    return data
+    return _lookup('country_ids', country_code, 'country code')
 
-def get_data_country_metric_latest(country_id: str, metric_id: str):
-    conn = connect()
-    cur = conn.cursor()
+def get_metric_id(metric_name):
+    return _lookup('metric_ids', metric_name, 'metric')
 
-    cur.execute('''
-    SELECT date, value FROM  data_points
-    WHERE country_id = ? AND metric_id = ?
-    ORDER BY date DESC LIMIT 1
-    ''', (country_id, metric_id))
+def get_country_code(country_id):
+    if country_id is None:
+        return 'NULL'
+    return _lookup('country_codes', country_id, 'country id')
 
-    data = cur.fetchall()
-    conn.close()
-    return data
+def get_metric_name(metric_id):
+    return _lookup('metric_names', metric_id, 'metric id')
 
-def get_data_global_metric(metric_id: str):
-    conn = connect()
-    cur = conn.cursor()
+def get_country_ids(country_codes: List[str]) -> List:
+    return [get_country_id(code) for code in country_codes]
 
-    cur.execute('''
-    SELECT date, value FROM  data_points
-    WHERE metric_id = ?
-    ''', (metric_id,))
+def get_metric_ids(metric_names: List[str]) -> List[int]:
+    return [get_metric_id(name) for name in metric_names]
 
-    data = cur.fetchall()
-    conn.close()
-    return data
+@instrument.timed('db_query_seconds', rows='db_rows_returned_total')
+def get_data_country_metric(country_id: str, metric_id: str):
+    return get_store().rows(metric_id, country_id)
+
+@instrument.timed('db_query_seconds', rows='db_rows_returned_total')
+def get_data_country_metric_latest(country_id: str, metric_id: str):
+    return get_store().latest(metric_id, country_id)
 
+@instrument.timed('db_query_seconds', rows='db_rows_returned_total')
+def get_data_global_metric(metric_id: str):
+    return get_store().rows(metric_id, None)
+
+def iter_data(metric_id, country_id=None, start: Optional[str] = None, end: Optional[str] = None,
+              limit: Optional[int] = None, after: Optional[str] = None,
+              chunk_size: int = 5000):
+    """
+    Yield a series' (date, value) rows in date order, `chunk_size` at a time,
+    between `start` and `end` (inclusive) and strictly after the `after` cursor,
+    stopping after `limit` rows. Each chunk is its own keyset query, so nothing
+    is held open between chunks and memory stays flat.
+    """
+    store = get_store()
+    remaining = limit
+    while remaining is None or remaining > 0:
+        n = chunk_size if remaining is None else min(chunk_size, remaining)
+        with instrument.timer('db_query_seconds', function='iter_data'):
+            rows = store.rows(metric_id, country_id, start, end, after, n)
+        instrument.inc('db_rows_returned_total', len(rows), function='iter_data')
+        if rows:
+            yield rows
+        if len(rows) < n:
+            return
+        after = rows[-1][0]
+        if remaining is not None:
+            remaining -= len(rows)
+
+@instrument.timed('db_query_seconds')
+def get_next_cursor(metric_id, country_id=None, start: Optional[str] = None, end: Optional[str] = None,
+                    limit: int = 1, after: Optional[str] = None) -> Optional[str]:
+    # date of the last row of this page, if any rows come after it
+    rows = get_store().rows(metric_id, country_id, start, end, after, 2, limit - 1)
+    return rows[0][0] if len(rows) == 2 else None
+
+@instrument.timed('db_query_seconds', rows='db_rows_returned_total')
 def get_countires():
     conn = connect()
     cur = conn.cursor()
@@ -211,9 +675,9 @@ def get_countires():
     cur.execute(query)
 
     data = cur.fetchall()
-    conn.close()
     return data
 
+@instrument.timed('db_query_seconds', rows='db_rows_returned_total')
 def get_metrics():
     conn = connect()
     cur = conn.cursor()
@@ -225,9 +689,9 @@ def get_metrics():
     cur.execute(query)
 
     data = cur.fetchall()
-    conn.close()
     return data
 
+@instrument.timed('db_query_seconds')
 def get_metric_unit(metric_name):
     conn = connect()
     cur = conn.cursor()
@@ -240,33 +704,195 @@ def get_metric_unit(metric_name):
     cur.execute(query, values)
 
     data = cur.fetchall()
-    conn.close()
     return data
 
 # Series #
-def get_series(metric_name: str, country_name: Optional[str] = None) -> pd.Series:
+def get_series(metric_name: str, country_name: Optional[str] = None,
+               freq: Optional[str] = None) -> 'pd.Series':
     
     metric_id = get_metric_id(metric_name)
-    
-    data = []    
-    if country_name != None:
-        country_id = get_country_id(country_name)
-        data = get_data_country_metric(country_id, metric_id)
-    else:
-        data = get_data_global_metric(metric_id)
-
-    s = pd.Series(
-        data=[value for date, value in data],
-        index=pd.to_datetime([date for date, value in data])
-    )
-
-    return s
+    country_id = get_country_id(country_name) if country_name != None else None
+    if freq is not None:
+        return get_rollup(metric_id, country_id, freq)
+    return get_series_by_id(metric_id, country_id)
+
+def _check_freq(freq: str):
+    if freq not in ROLLUPS:
+        raise ValueError(f'no rollup for freq {freq!r}, use one of {list(ROLLUPS)}')
+
+@instrument.timed('db_query_seconds', rows='db_rows_returned_total')
+def get_rollup(metric_id, country_id=None, freq: str = 'MS') -> 'pd.Series':
+    import pandas as pd
+
+    _check_freq(freq)
+    dates, values = get_store().rollup(metric_id, country_id, freq)
+    # a copy: the arrays may be a read-only cached or memory-mapped file
+    return pd.Series(data=values, index=pd.DatetimeIndex(dates, copy=True), copy=True)
+
+@instrument.timed('db_query_seconds', rows='db_rows_returned_total')
+def get_series_by_id(metric_id, country_id=None) -> 'pd.Series':
+    import pandas as pd
+
+    dates, values = get_series_arrays(metric_id, country_id)
+    # a copy: the arrays may be a read-only cached or memory-mapped file
+    return pd.Series(data=values, index=pd.DatetimeIndex(dates, copy=True), copy=True)
+
+@instrument.timed('db_query_seconds')
+def get_series_arrays(metric_id, country_id=None):
+    # memory-mapped copy, valid while the series' data version is unchanged
+    version = get_data_version(metric_id, country_id)
+    arrays = series_cache.load_arrays(metric_id, country_id, version)
+    if arrays is not None:
+        instrument.inc('series_cache_hits_total')
+        return arrays
+    instrument.inc('series_cache_misses_total')
+
+    dates, values = get_store().arrays(metric_id, country_id)
+    series_cache.store(metric_id, country_id, version, dates, values)
+
+    return dates, values
+
+def get_arrays(metric_id, country_id=None, start: Optional[str] = None, end: Optional[str] = None,
+               limit: Optional[int] = None, after: Optional[str] = None):
+    """
+    Same selection as iter_data, as (datetime64[ns] dates, float64 values)
+    slices of the cached series arrays - no per-row Python objects.
+    """
+    dates, values = get_series_arrays(metric_id, country_id)
+
+    lo = np.searchsorted(dates, np.datetime64(start), 'left') if start else 0
+    if after:
+        lo = max(lo, np.searchsorted(dates, np.datetime64(after), 'right'))
+    hi = np.searchsorted(dates, np.datetime64(end), 'right') if end else len(dates)
+    if limit is not None:
+        hi = min(hi, lo + limit)
+    hi = max(hi, lo)
+    return dates[lo:hi], values[lo:hi]
+
+@instrument.timed('db_query_seconds', rows='db_rows_returned_total')
+def get_frame(series: List[tuple], freq: Optional[str] = None) -> 'pd.DataFrame':
+    """
+    Load several series in one query as a wide DataFrame on the union of
+    their dates. `series` is a list of (metric_name, country_code) pairs,
+    with country_code None for global series; columns are keyed the same way.
+    With `freq`, the series' rollups (see ROLLUPS) are loaded instead.
+    """
+    import pandas as pd
+
+    keys = [(metric_name, country_code) for metric_name, country_code in series]
+    ids = [(get_metric_id(metric_name), get_country_id(country_code or 'NULL'))
+           for metric_name, country_code in keys]
+    if not keys:
+        return pd.DataFrame(columns=pd.MultiIndex.from_tuples([], names=['metric', 'country']))
+
+    if freq is not None:
+        _check_freq(freq)
+    pos, dates, values = get_store().frame(ids, freq)
+    # pivot: one row per distinct date, one column per key
+    index, row = np.unique(dates, return_inverse=True)
+    wide = np.full((len(index), len(keys)), np.nan)
+    wide[row, pos] = values
+
+    return pd.DataFrame(wide, index=pd.DatetimeIndex(index),
+                        columns=pd.MultiIndex.from_tuples(keys, names=['metric', 'country']))
+
+# Query plans #
+# tables read whole by design: the dimension listings and the version map
+LISTED_TABLES = {'countries', 'metrics', 'data_versions'}
+
+def check_query_plans() -> Dict[str, List[str]]:
+    """
+    Run the series lookups and the collector's bookkeeping against the
+    current database, EXPLAIN QUERY PLAN every statement they issue and raise
+    if any of them scans a whole table outside LISTED_TABLES.
+    Returns the plan of each statement.
+    """
+    conn = connect()
+    metric_name = get_metrics()[0][0]
+    country_code = get_countires()[0][0]
+    metric_id = get_metric_id(metric_name)
+    country_id = get_country_id(country_code)
+    invalidate_cache()
+
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        get_countires()
+        get_metrics()
+        get_data_country_metric(country_id, metric_id)
+        get_data_country_metric_latest(country_id, metric_id)
+        get_data_global_metric(metric_id)
+        get_frame([(metric_name, None), (metric_name, country_code)])
+        get_frame([(metric_name, None)], freq='MS')
+        get_rollup(metric_id, country_id, 'MS')
+        list(iter_data(metric_id, country_id, '2000-01-01', '2020-01-01', limit=10, after='2001-01-01'))
+        get_next_cursor(metric_id, None, limit=10)
+        get_data_version(metric_id, country_id)
+        get_data_versions()
+        get_watermark(country_code, metric_name, 'check')
+        update_watermark(country_code, metric_name, 'check')
+    finally:
+        conn.set_trace_callback(None)
+        conn.execute("DELETE FROM watermarks WHERE source_name = 'check'")
+        conn.commit()
+
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    plans = {}
+    scans = []
+    for statement in statements:
+        if statement.strip().split(None, 1)[0].upper() not in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE'):
+            continue
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + statement)]
+        plans[statement] = plan
+        # scanning a VALUES list or CTE is fine, scanning a table is not
+        scans += [step for step in plan if step.startswith('SCAN')
+                  and step.split()[1] in tables - LISTED_TABLES]
+    if scans:
+        raise AssertionError(f'full table scans: {scans}')
+    return plans
+
+# Migration #
+def migrate(source: str, target: str) -> Dict[str, int]:
+    """
+    Copy every series (points and rollups) from the `source` backend into
+    `target`, replacing what `target` held for them, and switch BACKEND to
+    `target`. Data versions are shared, so cached copies stay valid.
+    """
+    global BACKEND
+    if source == target:
+        raise ValueError(f'source and target are both {source!r}')
+    reader = storage.open_store(source, connect, PARQUET_DIR)
+    writer = storage.open_store(target, connect, PARQUET_DIR)
+
+    counts = {'series': 0, 'points': 0}
+    with _write_transaction(writer):
+        for metric_id, country_id in writer.series():
+            writer.delete(metric_id, country_id)
+        for metric_id, country_id in reader.series():
+            dates, values = reader.arrays(metric_id, country_id)
+            writer.upsert(metric_id, country_id, np.datetime_as_string(dates, unit='D'), values)
+            for freq in ROLLUPS:
+                periods, rolled = reader.rollup(metric_id, country_id, freq)
+                writer.write_rollup(metric_id, country_id, freq, '',
+                                    np.datetime_as_string(periods, unit='D').tolist(), rolled.tolist())
+            counts['series'] += 1
+            counts['points'] += len(values)
+    BACKEND = target
+    return counts
 
 
 def run():
     # Remove old database
-    if os.path.exists('finance_data.db'):
-        os.remove('finance_data.db')
+    close_connections()
+    invalidate_cache()
+    series_cache.clear()
+    # imported here: bootstrap imports this module
+    import src.bootstrap as bootstrap
+    bootstrap.clear()
+    get_store().clear()
+    for path in (DB_PATH, DB_PATH + '-wal', DB_PATH + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
 
     print('----- Database Setup: Running -----', end='\r')
     # create
@@ -279,4 +905,7 @@ def run():
 
 
 if __name__ == '__main__':
-    run()
\ No newline at end of file
+    if sys.argv[1:] == ['upgrade']:
+        upgrade()
+    else:
+        run()
\ No newline at end of file
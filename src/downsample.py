@@ -0,0 +1,92 @@
+import numpy as np
+from typing import TYPE_CHECKING, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Decimation for drawing and previewing long series. Both methods pick
+# points of the original series (no new values are made up) and keep its
+# first and last point:
+#   'lttb'   - Largest-Triangle-Three-Buckets: one point per bucket, the one
+#              forming the largest triangle with its neighbours' picks
+#   'minmax' - the lowest and highest point of each bucket, so every spike
+#              survives (up to n points from (n - 2) / 2 buckets)
+# NaN points are dropped before decimating.
+
+METHODS = ('lttb', 'minmax')
+
+def _as_float(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype('datetime64[ns]').astype('int64').astype('float64')
+    return x.astype('float64')
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    x = _as_float(x)
+    y = np.asarray(y, dtype='float64')
+    size = len(y)
+    if n >= size or n < 3:
+        return np.arange(size)
+
+    # n - 2 buckets between the fixed first and last point
+    edges = (np.arange(n - 1) * ((size - 2) / (n - 2))).astype(np.int64) + 1
+    edges[-1] = size - 1
+    counts = np.diff(edges)
+    # each bucket is scored against the mean of the bucket after it
+    avg_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / counts, x[-1])[1:]
+    avg_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / counts, y[-1])[1:]
+
+    picked = np.empty(n, dtype=np.int64)
+    picked[0], picked[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i]) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (avg_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+def minmax_indices(y: np.ndarray, n: int) -> np.ndarray:
+    y = np.asarray(y, dtype='float64')
+    size = len(y)
+    if n >= size:
+        return np.arange(size)
+    # two points per bucket, besides the first and last
+    buckets = (n - 2) // 2
+    if buckets < 1:
+        return np.array([0, size - 1])
+
+    starts = np.linspace(0, size, buckets + 1).astype(np.int64)[:-1]
+    counts = np.diff(np.append(starts, size))
+    picked = [[0, size - 1]]
+    for reduce in (np.minimum, np.maximum):
+        # first point of each bucket equal to the bucket's min (max)
+        hits = np.flatnonzero(y == np.repeat(reduce.reduceat(y, starts), counts))
+        picked.append(hits[np.searchsorted(hits, starts)])
+    return np.unique(np.concatenate(picked))
+
+def downsample(x: np.ndarray, y: np.ndarray, n: int, method: str = 'lttb') -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce (x, y) to about `n` points. `x` is numeric or datetime64 and
+    sorted; series already within `n` points come back unchanged.
+    """
+    if method not in METHODS:
+        raise ValueError(f'unknown downsample method: {method!r}, use one of {list(METHODS)}')
+    x = np.asarray(x)
+    y = np.asarray(y, dtype='float64')
+    if len(y) <= n:
+        return x, y
+
+    keep = ~np.isnan(y)
+    x, y = x[keep], y[keep]
+    picked = lttb_indices(x, y, n) if method == 'lttb' else minmax_indices(y, n)
+    return x[picked], y[picked]
+
+def downsample_series(s: 'pd.Series', n: int, method: str = 'lttb') -> 'pd.Series':
+    import pandas as pd
+
+    if len(s) <= n:
+        return s
+    x, y = downsample(s.index.to_numpy(), s.to_numpy('float64'), n, method)
+    return pd.Series(y, index=pd.Index(x, name=s.index.name), name=s.name)
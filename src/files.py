@@ -0,0 +1,60 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import IO, Iterator, Tuple
+
+# File writes shared by the on-disk caches and stores: every file is written
+# under a temporary name beside its target and renamed over it, so readers
+# never see a partial file, and the temporary file never outlives a failed
+# write. Leftovers of killed processes end in TMP_SUFFIX (see remove_stale).
+
+TMP_SUFFIX = '.tmp'
+
+def remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+@contextmanager
+def temporary(path: str, mode: str = 'wb') -> Iterator[Tuple[IO, str]]:
+    """
+    Open a temporary file beside `path` (unique to this process and thread)
+    and yield it with its name. The block may rename it into place; whatever
+    is left is removed on the way out, whether or not the block raised.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}{TMP_SUFFIX}'
+    try:
+        with open(tmp, mode) as f:
+            yield f, tmp
+    finally:
+        remove(tmp)
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'wb') -> Iterator[IO]:
+    """Yield a file that replaces `path` once the block completes."""
+    with temporary(path, mode) as (f, tmp):
+        yield f
+        f.close()
+        os.replace(tmp, path)
+
+def remove_stale(directory: str, older_than: float) -> int:
+    """
+    Remove temporary files under `directory` not modified for `older_than`
+    seconds (writers killed mid-write). Returns how many were removed.
+    """
+    removed = 0
+    cutoff = time.time() - older_than
+    for root, dirs, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stale = name.endswith(TMP_SUFFIX) and os.stat(path).st_mtime < cutoff
+            except FileNotFoundError:
+                continue
+            if stale:
+                removed += remove(path)
+    return removed
@@ -0,0 +1,117 @@
+import io
+import numpy as np
+from typing import Optional
+
+# Columnar encodings for the series endpoints. Each one is built from the
+# date/value arrays directly, with no per-row Python objects.
+
+JSON = 'application/json'
+NDJSON = 'application/x-ndjson'
+ARROW = 'application/vnd.apache.arrow.stream'
+PARQUET = 'application/vnd.apache.parquet'
+CSV = 'text/csv'
+MSGPACK = 'application/msgpack'
+
+# ?format= shorthands and accepted aliases
+FORMATS = {
+    'json': JSON,
+    'ndjson': NDJSON,
+    'arrow': ARROW,
+    'parquet': PARQUET,
+    'csv': CSV,
+    'msgpack': MSGPACK,
+}
+ALIASES = {
+    'application/vnd.apache.arrow.file': ARROW,
+    'application/x-parquet': PARQUET,
+    'application/x-msgpack': MSGPACK,
+    'application/*': JSON,
+    '*/*': JSON,
+}
+COLUMNAR = {ARROW, PARQUET, CSV, MSGPACK}
+
+class NotAcceptable(Exception):
+    pass
+
+def negotiate(accept: Optional[str], format: Optional[str] = None) -> str:
+    """
+    Pick the media type for a response: an explicit `format` wins, otherwise
+    the highest-q supported type in the Accept header, otherwise JSON.
+    """
+    if format:
+        if format not in FORMATS:
+            raise NotAcceptable(f'unknown format: {format!r}, use one of {sorted(FORMATS)}')
+        return FORMATS[format]
+
+    offers = []
+    for i, part in enumerate((accept or '').split(',')):
+        media_type, *params = [p.strip() for p in part.split(';')]
+        q = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        media_type = ALIASES.get(media_type.lower(), media_type.lower())
+        if q > 0 and (media_type in FORMATS.values()):
+            offers.append((-q, i, media_type))
+    return min(offers)[2] if offers else JSON
+
+def encode(media_type: str, dates: np.ndarray, values: np.ndarray) -> bytes:
+    dates = np.asarray(dates).astype('datetime64[D]')
+    values = np.asarray(values, dtype='float64')
+    if media_type == ARROW:
+        return _arrow(dates, values)
+    if media_type == PARQUET:
+        return _parquet(dates, values)
+    if media_type == CSV:
+        return _csv(dates, values)
+    if media_type == MSGPACK:
+        return _msgpack(dates, values)
+    raise NotAcceptable(f'{media_type} is not a columnar format')
+
+def _table(dates, values):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise NotAcceptable('Arrow and Parquet output need pyarrow installed')
+    return pa.table({'date': pa.array(dates), 'value': pa.array(values)})
+
+def _arrow(dates, values) -> bytes:
+    import pyarrow as pa
+    table = _table(dates, values)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _parquet(dates, values) -> bytes:
+    table = _table(dates, values)
+    import pyarrow.parquet as pq
+    sink = io.BytesIO()
+    pq.write_table(table, sink)
+    return sink.getvalue()
+
+def _csv(dates, values) -> bytes:
+    # vectorized string building: one join over the whole column
+    dates = np.datetime_as_string(dates, unit='D')
+    # shortest repr that reads back to the same float64, as JSON writes it
+    values = values.astype(str)
+    rows = np.char.add(np.char.add(dates, ','), values)
+    return ('date,value\n' + '\n'.join(rows.tolist()) + ('\n' if len(rows) else '')).encode()
+
+def _msgpack(dates, values) -> bytes:
+    """
+    {'length': n, 'date': <int64 days since 1970-01-01, little endian>,
+     'value': <float64, little endian>} - load each with np.frombuffer.
+    """
+    try:
+        import msgpack
+    except ImportError:
+        raise NotAcceptable('msgpack output needs msgpack installed')
+    return msgpack.packb({
+        'length': len(dates),
+        'date': dates.astype('<i8').tobytes(),
+        'value': values.astype('<f8').tobytes(),
+    })
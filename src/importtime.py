@@ -0,0 +1,64 @@
+import os
+import sys
+import subprocess
+from typing import Dict, List, Tuple
+
+# Import-time regression check for the entry points, using
+# `python -X importtime`. Each module is imported in a fresh interpreter;
+# the check fails if it pulls in a heavy dependency it should load lazily,
+# or if its cumulative import time (best of `repeat`) is over budget.
+#
+#   python -m src.importtime
+#
+# Budgets are loose on purpose: the forbidden imports are the real test,
+# the budgets catch a new heavy dependency that isn't listed yet.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPEAT = 3
+
+# module: (modules it must not import, budget in ms)
+CHECKS = {
+    'src.api': (['pandas', 'matplotlib', 'pyarrow'], 1000),
+    'src.database': (['pandas', 'matplotlib'], 250),
+    'src.analysis': (['pandas', 'matplotlib'], 300),
+    'src.downsample': (['pandas'], 200),
+}
+
+def measure(module: str) -> Tuple[float, Dict[str, float]]:
+    """Cumulative import time of `module` in ms, and every module it imported (ms each)."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'importing {module} failed:\n{result.stderr}')
+
+    imported = {}
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imported[name.strip()] = int(cumulative) / 1000
+    return imported.get(module, 0.0), imported
+
+def check(checks: Dict[str, tuple] = CHECKS, repeat: int = REPEAT) -> List[str]:
+    failures = []
+    for module, (forbidden, budget) in checks.items():
+        runs = [measure(module) for _ in range(repeat)]
+        total = min(total for total, _ in runs)
+        imported = runs[0][1]
+
+        loaded = [name for name in forbidden if name in imported]
+        status = 'ok'
+        if loaded:
+            status = f'imports {", ".join(loaded)}'
+            failures.append(f'{module} {status}')
+        elif total > budget:
+            status = f'over budget ({budget} ms)'
+            failures.append(f'{module} {status}')
+        print(f'{total:8.1f} ms  {module:<16} {status}')
+    return failures
+
+
+if __name__ == '__main__':
+    if check():
+        sys.exit(1)
@@ -0,0 +1,201 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Dict, List, Optional, Tuple
+
+# Counters and latency histograms for the database, collection and API,
+# rendered in the Prometheus text format (GET /metrics/prometheus).
+#
+# Off unless FINANCE_METRICS=1 or enable() is called. While off, timer()
+# hands back a shared no-op context and timed() functions make one flag
+# check before calling straight through.
+#
+# profiled() writes cProfile stats, or a Chrome trace (chrome://tracing,
+# Perfetto) of the instrumented spans, for one block of code:
+#   python -m src.instrument run.prof run
+#   python -m src.instrument analysis.json analysis
+
+ENABLED = os.environ.get('FINANCE_METRICS', '') not in ('', '0')
+
+# histogram upper bounds, seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, tuple], float] = {}
+# per key: a count per bucket (the last one +Inf), then sum, then count
+_histograms: Dict[Tuple[str, tuple], List[float]] = {}
+# trace events, only while profiled() writes a trace
+_spans: Optional[List[Dict]] = None
+_NULL = nullcontext()
+
+def enable(on: bool = True):
+    global ENABLED
+    ENABLED = on
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def _key(name: str, labels: Dict) -> Tuple[str, tuple]:
+    return name, tuple(sorted(labels.items()))
+
+def inc(name: str, value: float = 1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(name: str, value: float, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * (len(BUCKETS) + 3)
+        histogram[bisect_left(BUCKETS, value)] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+class _Timer:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name: str, labels: Dict):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        observe(self.name, elapsed, **self.labels)
+        spans = _spans
+        if spans is not None:
+            spans.append({
+                'name': self.labels.get('function') or self.labels.get('route') or self.name,
+                'cat': self.name, 'ph': 'X',
+                'ts': self.start * 1e6, 'dur': elapsed * 1e6,
+                'pid': os.getpid(), 'tid': threading.get_ident(),
+                'args': self.labels,
+            })
+
+def timer(name: str, **labels):
+    """Context manager observing its block's duration into histogram `name`."""
+    return _Timer(name, labels) if ENABLED else _NULL
+
+def timed(name: str, rows: Optional[str] = None, **labels):
+    """
+    Decorator timing every call into histogram `name`, labelled with the
+    function name. With `rows`, len() of the result is added to that counter.
+    """
+    def decorator(fn):
+        fn_labels = dict(labels, function=fn.__name__)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with _Timer(name, fn_labels):
+                result = fn(*args, **kwargs)
+            if rows:
+                try:
+                    inc(rows, len(result), **fn_labels)
+                except TypeError:
+                    pass
+            return result
+        return wrapper
+    return decorator
+
+# Exposition
+def _labels(labels: tuple, extra: Tuple = ()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+def render() -> str:
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: list(value) for key, value in _histograms.items()}
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f'# TYPE {name} counter')
+        for (key_name, labels), value in sorted(counters.items()):
+            if key_name == name:
+                lines.append(f'{name}{_labels(labels)} {value:g}')
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f'# TYPE {name} histogram')
+        for (key_name, labels), histogram in sorted(histograms.items()):
+            if key_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), histogram[:-2]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative:g}')
+            lines.append(f'{name}_sum{_labels(labels)} {histogram[-2]:.9g}')
+            lines.append(f'{name}_count{_labels(labels)} {histogram[-1]:g}')
+    return '\n'.join(lines) + '\n'
+
+# Profiling
+@contextmanager
+def profiled(path: str):
+    """
+    Profile the block: cProfile stats to `path` (load with pstats or
+    snakeviz), or a Chrome trace of the instrumented spans if `path` ends
+    in .json. Instrumentation is switched on for the block when tracing.
+    """
+    global _spans
+    if path.endswith('.json'):
+        was_enabled = ENABLED
+        enable()
+        _spans = []
+        try:
+            yield
+        finally:
+            spans, _spans = _spans, None
+            enable(was_enabled)
+            with open(path, 'w') as f:
+                json.dump({'traceEvents': spans, 'displayTimeUnit': 'ms'}, f)
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[2] not in ('run', 'analysis'):
+        sys.exit('usage: python -m src.instrument <output .prof|.json> run|analysis')
+    path, target = sys.argv[1:]
+
+    if target == 'run':
+        import src.database
+        import src.collection
+        with profiled(path):
+            src.database.run()
+            src.collection.run()
+    else:
+        # headless, so plt.show() doesn't block the profile
+        import matplotlib
+        matplotlib.use('Agg')
+        import src.analysis
+        with profiled(path):
+            src.analysis.analysis()
+    print(f'----- Profile written to {path} -----')
@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import argparse
+import matplotlib
+from matplotlib.figure import Figure
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import List, Dict, Optional, Tuple
+
+import src.analysis as analysis
+
+# Headless batch rendering of the analysis charts.
+#
+# A chart is described by a spec dict (like collection's jobs):
+#   {'kind': 'rolling_corr',  'name': ..., 'corr': Series, 'window', 'pir', 'idx'}
+#   {'kind': 'rolling_corrs', 'name': ..., 'corrs': {idx: Series}, 'window', 'pir', 'v_shading',
+#    'bands': {idx: (lower, upper)}}
+#   {'kind': 'datas',         'name': ..., 'datas': DataFrame, 'pir_cols', 'idx_cols', 'v_shading'}
+# Specs are rendered in a process pool on the Agg backend. Each worker builds
+# one figure per kind, styled once, and reuses it: only the data artists are
+# removed and redrawn between charts.
+#
+#   python -m src.render [out_dir] --format png,svg --windows 12,24,36,60
+
+OUT_DIR = 'imgs'
+FORMATS = ('png',)
+WINDOWS = [12, 24, 36, 60]
+DPI = 100
+
+def _rolling_corr_template():
+    fig = Figure(figsize=(10,4))
+    ax = fig.subplots()
+    analysis.style_rolling_corr(ax)
+    return fig, (ax,)
+
+def _rolling_corrs_template():
+    fig = Figure(figsize=(12,5))
+    ax = fig.subplots()
+    analysis.style_rolling_corrs(ax)
+    return fig, (ax,)
+
+def _datas_template():
+    fig = Figure(figsize=(10,6))
+    ax1 = fig.subplots()
+    ax2 = ax1.twinx()
+    analysis.style_datas(ax1, ax2)
+    return fig, (ax1, ax2)
+
+def _draw_rolling_corr(axes, spec):
+    return analysis.draw_rolling_corr(*axes, spec['corr'], spec['window'], spec['pir'], spec['idx'])
+
+def _draw_rolling_corrs(axes, spec):
+    return analysis.draw_rolling_corrs(*axes, spec['corrs'], spec['window'], spec['pir'],
+                                       spec.get('v_shading'), spec.get('bands'))
+
+def _draw_datas(axes, spec):
+    return analysis.draw_datas(*axes, spec['datas'], spec['pir_cols'], spec['idx_cols'],
+                               spec.get('v_shading'))
+
+# kind: (template, draw, tight layout)
+KINDS = {
+    'rolling_corr': (_rolling_corr_template, _draw_rolling_corr, False),
+    'rolling_corrs': (_rolling_corrs_template, _draw_rolling_corrs, True),
+    'datas': (_datas_template, _draw_datas, True),
+}
+
+# per worker process: kind -> (fig, axes)
+_templates: Dict[str, Tuple[Figure, tuple]] = {}
+
+def _init_worker():
+    matplotlib.use('Agg')
+
+def _template(kind: str):
+    if kind not in _templates:
+        _templates[kind] = KINDS[kind][0]()
+    return _templates[kind]
+
+def _reset(axes, artists):
+    for artist in artists:
+        artist.remove()
+    for ax in axes:
+        legend = ax.get_legend()
+        if legend is not None:
+            legend.remove()
+        # forget the removed data's limits
+        ax.relim()
+        ax.autoscale_view()
+
+def render_spec(spec: Dict, out_dir: str = OUT_DIR, formats=FORMATS, dpi: int = DPI) -> Dict:
+    """
+    Draw one spec on this process's template for its kind and save it as
+    <out_dir>/<name>.<format> for each format. Returns the paths and timing.
+    """
+    start = time.perf_counter()
+    kind = spec['kind']
+    if kind not in KINDS:
+        raise ValueError(f'unknown chart kind: {kind!r}, use one of {list(KINDS)}')
+    fig, axes = _template(kind)
+    _, draw, tight = KINDS[kind]
+
+    artists = draw(axes, spec)
+    try:
+        if tight:
+            fig.tight_layout()
+        paths = []
+        for format in formats:
+            path = os.path.join(out_dir, f"{spec['name']}.{format}")
+            fig.savefig(path, format=format, dpi=dpi)
+            paths.append(path)
+    finally:
+        _reset(axes, artists)
+
+    return {
+        'name': spec['name'],
+        'kind': kind,
+        'paths': paths,
+        'seconds': time.perf_counter() - start,
+        'pid': os.getpid(),
+    }
+
+def render(specs: List[Dict], out_dir: str = OUT_DIR, formats=FORMATS, dpi: int = DPI,
+           max_workers: Optional[int] = None, verbose: bool = True) -> List[Dict]:
+    """
+    Render every spec in a process pool and return their timings, in spec
+    order. Specs are handed out in chunks so each worker reuses its templates
+    across many charts.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(specs) // (max_workers * 4))
+
+    start = time.perf_counter()
+    timings = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as pool:
+        for timing in pool.map(render_spec, specs, repeat(out_dir), repeat(formats),
+                               repeat(dpi), chunksize=chunksize):
+            timings.append(timing)
+            if verbose:
+                print(f"{timing['seconds'] * 1000:8.1f} ms  {', '.join(timing['paths'])}")
+    if verbose:
+        total = time.perf_counter() - start
+        print(f'----- Rendered {len(timings)} charts in {total:.2f}s '
+              f'({max_workers} workers) -----')
+    return timings
+
+# Specs
+def _file_name(text: str) -> str:
+    return text.replace(' ', '_')
+
+def rolling_corr_specs(datas, rates: List[str], idxs: List[str], windows: List[int] = WINDOWS) -> List[Dict]:
+    # one chart per rate x index x window, all correlations in one pass
+    corrs = analysis.rolling_corrs(datas, rates, idxs, windows)
+    return [{
+        'kind': 'rolling_corr',
+        'name': _file_name(f'{window}-month_rolling_correlation_{pir}_rates_vs_{idx}'),
+        'corr': corrs[(window, pir, idx)],
+        'window': window, 'pir': pir, 'idx': idx,
+    } for window in windows for pir in rates for idx in idxs]
+
+def rolling_corrs_specs(datas, rates: List[str], idxs: List[str], windows: List[int] = WINDOWS,
+                        v_shading: Optional[List[tuple]] = None) -> List[Dict]:
+    # one chart per rate x window with every index on it
+    corrs = analysis.rolling_corrs(datas, rates, idxs, windows)
+    return [{
+        'kind': 'rolling_corrs',
+        'name': _file_name(f'{window}-month_rolling_correlation_{pir}_rates_vs_multiple_indices'),
+        'corrs': {idx: corrs[(window, pir, idx)] for idx in idxs},
+        'window': window, 'pir': pir, 'v_shading': v_shading,
+    } for window in windows for pir in rates]
+
+def nightly_specs(windows: List[int] = WINDOWS) -> List[Dict]:
+    datas = analysis.get_aligned_datas(analysis.ANALYSIS_SERIES, freq='MS')
+    rates = [label for label, (metric, country, rule) in analysis.ANALYSIS_SERIES.items()
+             if metric == 'policy interest rate']
+    idxs = [label for label in analysis.ANALYSIS_SERIES if label not in rates]
+    return (rolling_corr_specs(datas, rates, idxs, windows)
+            + rolling_corrs_specs(datas, rates, idxs, windows)
+            + [{'kind': 'datas', 'name': 'policy_interest_rates_vs_indices',
+                'datas': datas, 'pir_cols': rates, 'idx_cols': idxs}])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Render the analysis charts headlessly.')
+    parser.add_argument('out_dir', nargs='?', default=OUT_DIR)
+    parser.add_argument('--format', default=','.join(FORMATS), help='comma separated, e.g. png,svg')
+    parser.add_argument('--windows', default=','.join(map(str, WINDOWS)))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--dpi', type=int, default=DPI)
+    args = parser.parse_args(sys.argv[1:])
+
+    render(nightly_specs([int(w) for w in args.windows.split(',')]), args.out_dir,
+           formats=args.format.split(','), dpi=args.dpi, max_workers=args.workers)
@@ -0,0 +1,173 @@
+import os
+import json
+import glob
+import hashlib
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import src.files as files
+
+# Raw collector responses, kept on disk so unchanged payloads are neither
+# parsed nor written, and the database can be rebuilt without the network.
+#   objects/<ab>/<sha256>  every distinct payload body, named by its hash
+#   series/<key>.json      per series (source, country, metric): the last
+#                          request with its ETag/Last-Modified, the hash of
+#                          the last payload applied, the data version that
+#                          left the series at, and every payload applied in
+#                          order (the replay log)
+# Nothing is deleted as it goes: prune() drops payloads no record refers to
+# any more, and temporary files of killed downloads.
+#
+#   python -m src.response_cache prune [--keep N]
+#
+# A record only vouches for the stored series while its data version is
+# unchanged; after anything else writes the series (or the database is
+# recreated) the next fetch is unconditional and parsed again.
+
+CACHE_DIR = 'response_cache'
+READ_SIZE = 64 * 1024
+STALE_SECONDS = 3600 # temporary files older than this are from dead writers
+
+def _record_path(source: str, country: str, metric: str) -> str:
+    key = hashlib.sha1(f'{source}|{country}|{metric}'.encode()).hexdigest()[:16]
+    return os.path.join(CACHE_DIR, 'series', f'{key}.json')
+
+def object_path(digest: str) -> str:
+    return os.path.join(CACHE_DIR, 'objects', digest[:2], digest)
+
+def _write_json(path: str, data: Dict):
+    with files.atomic_write(path, 'w') as f:
+        json.dump(data, f, indent=1)
+
+def load(job: Dict) -> Optional[Dict]:
+    try:
+        with open(_record_path(job['source'], job['country'], job['metric'])) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def records() -> List[Dict]:
+    found = []
+    for path in sorted(glob.glob(os.path.join(CACHE_DIR, 'series', '*.json'))):
+        with open(path) as f:
+            found.append(json.load(f))
+    return found
+
+def _request(url: str, params: Optional[Dict], moving: Iterable[str]) -> Tuple[str, Dict]:
+    moving = set(moving)
+    return url, {key: value for key, value in (params or {}).items() if key not in moving}
+
+def conditional_headers(record: Optional[Dict], url: str, params: Optional[Dict],
+                        moving: Iterable[str] = ()) -> Dict[str, str]:
+    # validators only hold for the request they came back from, up to the
+    # `moving` params (an end date of today): those change every day while
+    # the payload they select may not
+    if record is None or _request(record['url'], record['params'], moving) != _request(url, params, moving):
+        return {}
+    headers = {}
+    if record.get('etag'):
+        headers['If-None-Match'] = record['etag']
+    if record.get('last_modified'):
+        headers['If-Modified-Since'] = record['last_modified']
+    return headers
+
+def store_body(chunks: Iterable[bytes]) -> Tuple[str, int]:
+    """
+    Copy a response body into the object store as its chunks download,
+    hashing on the way. Returns its sha256 and size; identical bodies share
+    one file.
+    """
+    sha = hashlib.sha256()
+    size = 0
+    # named by its hash once it's all in; a failed download leaves nothing
+    with files.temporary(os.path.join(CACHE_DIR, 'objects', 'incoming')) as (f, tmp):
+        for block in chunks:
+            sha.update(block)
+            f.write(block)
+            size += len(block)
+        f.close()
+
+        digest = sha.hexdigest()
+        path = object_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp, path)
+    return digest, size
+
+def open_object(digest: str) -> BinaryIO:
+    return open(object_path(digest), 'rb')
+
+def save(job: Dict, response, digest: str, version: int, applied: bool,
+         record: Optional[Dict] = None):
+    """
+    Record a fetch of `job`: its validators, the payload hash and the data
+    version it leaves the series at. `applied` payloads join the replay log.
+    """
+    history = list(record['history']) if record else []
+    if applied and (not history or history[-1] != digest):
+        history.append(digest)
+    _write_json(_record_path(job['source'], job['country'], job['metric']), {
+        'source': job['source'], 'country': job['country'], 'metric': job['metric'],
+        'url': job['url'], 'params': job['params'] or {},
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'digest': digest,
+        'version': version,
+        'fetched_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'history': history,
+    })
+
+def replay_log(record: Dict) -> Iterator[str]:
+    # payloads of a series in the order they were applied, skipping any lost
+    for digest in record['history']:
+        if os.path.exists(object_path(digest)):
+            yield digest
+
+def set_version(record: Dict, version: int):
+    # the series was rebuilt from the log: the record holds for it again
+    _write_json(_record_path(record['source'], record['country'], record['metric']),
+                dict(record, version=version))
+
+def prune(keep: Optional[int] = None, stale_seconds: float = STALE_SECONDS) -> Dict[str, int]:
+    """
+    Remove every payload no record refers to, and leftover temporary files.
+    With `keep`, each replay log is first cut to its last `keep` payloads:
+    replay() then rebuilds a series only from those, so keep enough to
+    cover its history (a full-range payload covers everything before it).
+    Run it while nothing is collecting: a payload just downloaded has no
+    record yet. Returns what was removed.
+    """
+    removed = {'history': 0, 'objects': 0, 'bytes': 0,
+               'tmp': files.remove_stale(CACHE_DIR, stale_seconds)}
+    referenced = set()
+    for record in records():
+        history = record['history']
+        if keep is not None and len(history) > keep:
+            history = history[-keep:] if keep else []
+            removed['history'] += len(record['history']) - len(history)
+            _write_json(_record_path(record['source'], record['country'], record['metric']),
+                        dict(record, history=history))
+        referenced.update(history)
+        referenced.add(record['digest'])
+
+    for path in glob.glob(os.path.join(CACHE_DIR, 'objects', '*', '*')):
+        if os.path.basename(path) in referenced or path.endswith(files.TMP_SUFFIX):
+            continue
+        size = os.path.getsize(path)
+        if files.remove(path):
+            removed['objects'] += 1
+            removed['bytes'] += size
+    return removed
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Maintain the raw response cache.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    prune_parser = commands.add_parser('prune', help='remove payloads no record refers to')
+    prune_parser.add_argument('--keep', type=int, default=None,
+                              help='payloads to keep in each replay log (default: all)')
+    args = parser.parse_args()
+
+    print(f'----- Pruning: {prune(args.keep)} -----')
@@ -1,8 +1,15 @@
+import sys
+import argparse
 import src.database  
 import src.collection
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Create the database and collect every series.')
+    parser.add_argument('--offline', action='store_true',
+                        help='replay cached responses (src.response_cache) instead of fetching')
+    args = parser.parse_args(sys.argv[1:])
+
     # Create database
     src.database.run()
     # Run data collection
-    src.collection.run()
+    src.collection.run(offline=args.offline)
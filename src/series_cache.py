@@ -0,0 +1,83 @@
+import os
+import glob
+import threading
+import numpy as np
+from typing import Optional, Tuple
+
+import src.files as files
+
+# On-disk columnar copies of series, one pair of .npy files per series:
+#   <metric>_<country>_v<version>.dates.npy   datetime64[ns]
+#   <metric>_<country>_v<version>.values.npy  float64
+# Files are memory-mapped on read, so a hit does no parsing at all.
+# The data version in the name goes stale as soon as insert_data bumps it;
+# stale files are replaced on the next read. Least recently used files are
+# evicted once the directory grows past MAX_BYTES.
+
+CACHE_DIR = 'series_cache'
+MAX_BYTES = 256 * 1024 * 1024
+
+_lock = threading.Lock()
+
+def _prefix(metric_id, country_id) -> str:
+    country = 'global' if country_id is None else country_id
+    return os.path.join(CACHE_DIR, f'{metric_id}_{country}')
+
+def _paths(metric_id, country_id, version):
+    base = f'{_prefix(metric_id, country_id)}_v{version}'
+    return base + '.dates.npy', base + '.values.npy'
+
+def load_arrays(metric_id, country_id, version: int) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    dates_path, values_path = _paths(metric_id, country_id, version)
+    try:
+        dates = np.load(dates_path, mmap_mode='r')
+        values = np.load(values_path, mmap_mode='r')
+    except (FileNotFoundError, ValueError):
+        return None
+
+    # mtime is the LRU clock
+    for path in (dates_path, values_path):
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+    return dates, values
+
+def store(metric_id, country_id, version: int, dates: np.ndarray, values: np.ndarray):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    dates_path, values_path = _paths(metric_id, country_id, version)
+
+    with _lock:
+        # drop older versions of this series
+        for path in glob.glob(f'{_prefix(metric_id, country_id)}_v*.npy'):
+            if path not in (dates_path, values_path):
+                files.remove(path)
+
+        for path, array in ((dates_path, dates), (values_path, values)):
+            with files.atomic_write(path) as f:
+                np.save(f, array)
+
+        evict()
+
+def evict(max_bytes: int = MAX_BYTES):
+    found = []
+    for path in glob.glob(os.path.join(CACHE_DIR, '*.npy')):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        found.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in found)
+    for _, size, path in sorted(found):
+        if total <= max_bytes:
+            break
+        files.remove(path)
+        total -= size
+
+def clear():
+    with _lock:
+        for path in glob.glob(os.path.join(CACHE_DIR, '*.npy')):
+            files.remove(path)
+
@@ -0,0 +1,492 @@
+import os
+import abc
+import shutil
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import src.files as files
+
+# Where data points and rollups live. src.database keeps countries,
+# metrics, sources, watermarks and data versions in SQLite, and reads and
+# writes series through one of these stores (database.BACKEND):
+#   'sqlite'  - the data_points and rollups tables of finance_data.db
+#   'parquet' - one directory per series, partitioned hive style:
+#               <root>/metric=<id>/country=<id|global>/points.parquet
+#                                                   /rollup_<freq>.parquet
+#               read whole and sliced with numpy, so range scans and
+#               multi-series pivots are vectorized.
+#
+# Writes happen inside the SQLite write transaction database opens (BEGIN
+# IMMEDIATE, within Store.transaction), which serializes writers for both
+# stores. SQLite writes commit or roll back with it. Parquet writes are
+# staged in memory (and read back from there) until the SQLite commit, then
+# published, each file replaced atomically, so readers see the old file or
+# the new one and a failed transaction leaves the files as they were. The
+# Parquet files are not transactional in themselves: a process killed
+# between the commit and the last file written leaves the series behind
+# its data version (re-ingest or migrate it to repair).
+#
+# Copy every series from one store into the other:
+#   python -m src.storage sqlite parquet
+
+BACKENDS = ('sqlite', 'parquet')
+
+# (metric_id, country_id) of a series
+Key = Tuple[int, Optional[int]]
+Rows = List[Tuple[str, float]]
+
+def _conflict_target(country_id, *keys: str) -> str:
+    # upsert target: the table UNIQUE constraint, or the partial index for global series
+    columns = ', '.join(('metric_id',) + keys)
+    if country_id is None:
+        return f'({columns}) WHERE country_id IS NULL'
+    return f'(country_id, {columns})'
+
+def _to_datetimes(dates) -> np.ndarray:
+    # 'YYYY-MM-DD' strings -> datetime64[ns]
+    return np.array(dates, dtype='datetime64[D]').astype('datetime64[ns]')
+
+class Store(abc.ABC):
+    """
+    Interface of a series store. Dates are 'YYYY-MM-DD' strings in rows,
+    datetime64[ns] in arrays; every read is in date order.
+    """
+    name = ''
+
+    @abc.abstractmethod
+    def upsert(self, metric_id, country_id, dates: np.ndarray, values: np.ndarray) -> Tuple[int, int, int, Optional[str]]:
+        """
+        Insert or revise points (later duplicates of a date win). Returns
+        (staged, existing, unchanged, first changed date).
+        """
+
+    @abc.abstractmethod
+    def rows(self, metric_id, country_id, start: Optional[str] = None, end: Optional[str] = None,
+             after: Optional[str] = None, limit: Optional[int] = None, offset: int = 0) -> Rows:
+        """Points between start and end (inclusive), strictly after `after`."""
+
+    @abc.abstractmethod
+    def latest(self, metric_id, country_id) -> Rows:
+        """The last point, as a one-row list (empty if there are none)."""
+
+    @abc.abstractmethod
+    def before(self, metric_id, country_id, date: str) -> Optional[str]:
+        """Date of the last point before `date`."""
+
+    @abc.abstractmethod
+    def arrays(self, metric_id, country_id) -> Tuple[np.ndarray, np.ndarray]:
+        """(dates, values) of every point."""
+
+    @abc.abstractmethod
+    def frame(self, keys: List[Key], freq: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Long form of several series (or their `freq` rollups):
+        (position in `keys`, dates, values).
+        """
+
+    @abc.abstractmethod
+    def rollup(self, metric_id, country_id, freq: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(periods, values) of the `freq` rollup."""
+
+    @abc.abstractmethod
+    def write_rollup(self, metric_id, country_id, freq: str, start: str,
+                     periods: List[str], values: List[float]):
+        """Replace the `freq` rollup from period `start` ('' for all) onwards."""
+
+    @abc.abstractmethod
+    def series(self) -> List[Key]:
+        """Keys of every stored series."""
+
+    @abc.abstractmethod
+    def delete(self, metric_id, country_id):
+        """Drop a series' points and rollups."""
+
+    def clear(self):
+        """
+        Drop everything (the database is being recreated). Stores inside the
+        database file go with it.
+        """
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """
+        Wraps database's write transactions: writes in the block belong to
+        it. Stores writing through the SQLite connection need nothing more.
+        """
+        yield
+
+# SQLite #
+class SQLiteStore(Store):
+    name = 'sqlite'
+
+    def __init__(self, connect: Callable):
+        # database.connect: the thread's connection, so writes join its transaction
+        self.connect = connect
+
+    def upsert(self, metric_id, country_id, dates, values):
+        cur = self.connect().cursor()
+        cur.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS staging_points (
+                date DATE PRIMARY KEY,
+                value FLOAT NOT NULL
+            )
+        ''')
+        cur.execute('DELETE FROM staging_points')
+        # later duplicates of a date win, as in the source file
+        cur.executemany('''
+            INSERT OR REPLACE INTO staging_points (date, value)
+            VALUES (?, ?)
+        ''', zip(dates.tolist(), values.tolist()))
+
+        cur.execute('''
+            SELECT
+                COUNT(*),
+                COUNT(dp.value),
+                COALESCE(SUM(dp.value = s.value), 0),
+                MIN(CASE WHEN dp.value IS NULL OR dp.value != s.value THEN s.date END)
+            FROM staging_points s
+            LEFT JOIN data_points dp
+                ON dp.country_id IS ? AND dp.metric_id = ? AND dp.date = s.date
+        ''', (country_id, metric_id))
+        counts = cur.fetchone()
+
+        cur.execute(f'''
+            INSERT INTO data_points (country_id, metric_id, date, value)
+            SELECT ?, ?, date, value FROM staging_points WHERE true
+            ON CONFLICT{_conflict_target(country_id, 'date')}
+            DO UPDATE SET value = excluded.value
+            WHERE data_points.value != excluded.value
+        ''', (country_id, metric_id))
+        cur.execute('DELETE FROM staging_points')
+        return counts
+
+    RANGE_QUERY = '''
+        SELECT date, value FROM data_points
+        WHERE metric_id = ? AND country_id IS ?
+        AND date >= ? AND date <= ? AND date > ?
+        ORDER BY date
+    '''
+
+    def rows(self, metric_id, country_id, start=None, end=None, after=None, limit=None, offset=0):
+        cur = self.connect().cursor()
+        if start is None and end is None and after is None and limit is None:
+            cur.execute('''
+            SELECT date, value FROM data_points
+            WHERE metric_id = ? AND country_id IS ?
+            ORDER BY date
+            ''', (metric_id, country_id))
+            return cur.fetchall()
+
+        # unset bounds become open string ranges, so one indexed query fits all
+        cur.execute(self.RANGE_QUERY + 'LIMIT ? OFFSET ?',
+                    (metric_id, country_id, start or '', end or '9999-12-31', after or '',
+                     -1 if limit is None else limit, offset))
+        return cur.fetchall()
+
+    def latest(self, metric_id, country_id):
+        cur = self.connect().cursor()
+        cur.execute('''
+        SELECT date, value FROM  data_points
+        WHERE metric_id = ? AND country_id IS ?
+        ORDER BY date DESC LIMIT 1
+        ''', (metric_id, country_id))
+        return cur.fetchall()
+
+    def before(self, metric_id, country_id, date):
+        cur = self.connect().cursor()
+        cur.execute('''
+            SELECT MAX(date) FROM data_points
+            WHERE metric_id = ? AND country_id IS ? AND date < ?
+        ''', (metric_id, country_id, date))
+        return cur.fetchone()[0]
+
+    def arrays(self, metric_id, country_id):
+        data = self.rows(metric_id, country_id)
+        dates = np.array([date for date, value in data], dtype='datetime64[ns]')
+        values = np.array([value for date, value in data], dtype='float64')
+        return dates, values
+
+    def frame(self, keys, freq=None):
+        cur = self.connect().cursor()
+        params = [v for pos, (metric_id, country_id) in enumerate(keys)
+                  for v in (pos, metric_id, country_id)]
+        wanted = ', '.join(['(?, ?, ?)'] * len(keys))
+        if freq is None:
+            cur.execute(f'''
+            WITH wanted (pos, metric_id, country_id) AS (VALUES {wanted})
+            SELECT wanted.pos, dp.date, dp.value
+            FROM wanted CROSS JOIN data_points dp
+            WHERE dp.metric_id = wanted.metric_id AND dp.country_id IS wanted.country_id
+            ''', params)
+        else:
+            cur.execute(f'''
+            WITH wanted (pos, metric_id, country_id) AS (VALUES {wanted})
+            SELECT wanted.pos, r.period, r.value
+            FROM wanted CROSS JOIN rollups r
+            WHERE r.metric_id = wanted.metric_id AND r.country_id IS wanted.country_id
+            AND r.freq = ?
+            ''', params + [freq])
+        data = cur.fetchall()
+        return (np.array([pos for pos, date, value in data], dtype='int64'),
+                _to_datetimes([date for pos, date, value in data]),
+                np.array([value for pos, date, value in data], dtype='float64'))
+
+    def rollup(self, metric_id, country_id, freq):
+        cur = self.connect().cursor()
+        cur.execute('''
+        SELECT period, value FROM rollups
+        WHERE metric_id = ? AND country_id IS ? AND freq = ?
+        ORDER BY period
+        ''', (metric_id, country_id, freq))
+        data = cur.fetchall()
+        return (_to_datetimes([period for period, value in data]),
+                np.array([value for period, value in data], dtype='float64'))
+
+    def write_rollup(self, metric_id, country_id, freq, start, periods, values):
+        cur = self.connect().cursor()
+        cur.execute('''
+            DELETE FROM rollups
+            WHERE metric_id = ? AND country_id IS ? AND freq = ? AND period >= ?
+        ''', (metric_id, country_id, freq, start))
+        cur.executemany('''
+            INSERT INTO rollups (country_id, metric_id, freq, period, value)
+            VALUES (?, ?, ?, ?, ?)
+        ''', zip([country_id] * len(periods), [metric_id] * len(periods), [freq] * len(periods),
+                 periods, values))
+
+    def series(self):
+        cur = self.connect().cursor()
+        cur.execute('SELECT DISTINCT metric_id, country_id FROM data_points')
+        return cur.fetchall()
+
+    def delete(self, metric_id, country_id):
+        cur = self.connect().cursor()
+        for table in ('data_points', 'rollups'):
+            cur.execute(f'DELETE FROM {table} WHERE metric_id = ? AND country_id IS ?',
+                        (metric_id, country_id))
+
+# Parquet #
+class _Staged(threading.local):
+    # the writing thread's transaction: path -> (dates, values) to write,
+    # and series directories to remove first; None outside a transaction
+    writes: Optional[dict] = None
+    deleted: Optional[set] = None
+
+class ParquetStore(Store):
+    name = 'parquet'
+    # decoded series kept in memory, keyed on path and file stat
+    CACHED_FILES = 256
+    # one transaction at a time (across instances: migrate opens its own),
+    # from staging until its files are written
+    _write_lock = threading.Lock()
+
+    def __init__(self, root: str):
+        self.root = root
+        self._files: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._staged = _Staged()
+
+    def _dir(self, metric_id, country_id) -> str:
+        country = 'global' if country_id is None else country_id
+        return os.path.join(self.root, f'metric={metric_id}', f'country={country}')
+
+    def _path(self, metric_id, country_id, freq: Optional[str] = None) -> str:
+        return os.path.join(self._dir(metric_id, country_id),
+                            'points.parquet' if freq is None else f'rollup_{freq}.parquet')
+
+    def _read(self, path: str) -> Tuple[np.ndarray, np.ndarray]:
+        # (datetime64[D] dates, float64 values), empty if there's no file
+        if self._staged.writes is not None:
+            if path in self._staged.writes:
+                return self._staged.writes[path]
+            if os.path.dirname(path) in self._staged.deleted:
+                return np.array([], dtype='datetime64[D]'), np.array([], dtype='float64')
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return np.array([], dtype='datetime64[D]'), np.array([], dtype='float64')
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == signature:
+                self._files.move_to_end(path)
+                return cached[1], cached[2]
+
+        import pyarrow.parquet as pq
+        table = pq.read_table(path, memory_map=True)
+        dates = table.column('date').to_numpy().astype('datetime64[D]')
+        values = table.column('value').to_numpy()
+        # read-only: callers get the cached arrays themselves
+        dates.flags.writeable = False
+        values.flags.writeable = False
+        with self._lock:
+            self._files[path] = (signature, dates, values)
+            while len(self._files) > self.CACHED_FILES:
+                self._files.popitem(last=False)
+        return dates, values
+
+    def _write(self, path: str, dates: np.ndarray, values: np.ndarray):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table({'date': pa.array(dates.astype('datetime64[D]'), type=pa.date32()),
+                          'value': pa.array(values, type=pa.float64())})
+        with files.atomic_write(path) as f:
+            pq.write_table(table, f)
+
+    def _stage(self, path: str, dates: np.ndarray, values: np.ndarray):
+        if self._staged.writes is None:
+            self._write(path, dates, values)
+        else:
+            self._staged.writes[path] = (dates, values)
+
+    @contextmanager
+    def transaction(self):
+        # nothing reaches the files unless the block (and the SQLite commit
+        # in it) succeeds
+        with self._write_lock:
+            self._staged.writes, self._staged.deleted = {}, set()
+            try:
+                yield
+                writes, deleted = self._staged.writes, self._staged.deleted
+            finally:
+                self._staged.writes = self._staged.deleted = None
+            for directory in deleted:
+                shutil.rmtree(directory, ignore_errors=True)
+            for path, (dates, values) in writes.items():
+                self._write(path, dates, values)
+
+    @staticmethod
+    def _rows(dates: np.ndarray, values: np.ndarray) -> Rows:
+        return list(zip(np.datetime_as_string(dates, unit='D').tolist(), values.tolist()))
+
+    def upsert(self, metric_id, country_id, dates, values):
+        path = self._path(metric_id, country_id)
+        new_dates = np.asarray(dates).astype('datetime64[D]')
+        # later duplicates of a date win: first of each date in reverse
+        new_dates, first = np.unique(new_dates[::-1], return_index=True)
+        new_values = np.asarray(values, dtype='float64')[::-1][first]
+
+        old_dates, old_values = self._read(path)
+        pos = np.minimum(np.searchsorted(old_dates, new_dates), max(len(old_dates) - 1, 0))
+        found = (old_dates[pos] == new_dates) if len(old_dates) else np.zeros(len(new_dates), bool)
+        same = found & (old_values[pos] == new_values) if len(old_dates) else found
+        staged, existing, unchanged = len(new_dates), int(found.sum()), int(same.sum())
+
+        first_changed = None
+        if unchanged < staged:
+            first_changed = str(new_dates[~same][0])
+            keep = ~np.isin(old_dates, new_dates)
+            dates = np.concatenate([old_dates[keep], new_dates])
+            values = np.concatenate([old_values[keep], new_values])
+            order = np.argsort(dates, kind='stable')
+            self._stage(path, dates[order], values[order])
+        return staged, existing, unchanged, first_changed
+
+    def _slice(self, dates, start, end, after) -> Tuple[int, int]:
+        lo = np.searchsorted(dates, np.datetime64(start, 'D'), 'left') if start else 0
+        if after:
+            lo = max(lo, np.searchsorted(dates, np.datetime64(after, 'D'), 'right'))
+        hi = np.searchsorted(dates, np.datetime64(end, 'D'), 'right') if end else len(dates)
+        return lo, max(hi, lo)
+
+    def rows(self, metric_id, country_id, start=None, end=None, after=None, limit=None, offset=0):
+        dates, values = self._read(self._path(metric_id, country_id))
+        lo, hi = self._slice(dates, start, end, after)
+        lo = min(lo + offset, hi)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return self._rows(dates[lo:hi], values[lo:hi])
+
+    def latest(self, metric_id, country_id):
+        dates, values = self._read(self._path(metric_id, country_id))
+        return self._rows(dates[-1:], values[-1:])
+
+    def before(self, metric_id, country_id, date):
+        dates, values = self._read(self._path(metric_id, country_id))
+        i = np.searchsorted(dates, np.datetime64(date, 'D'), 'left')
+        return str(dates[i - 1]) if i else None
+
+    def arrays(self, metric_id, country_id):
+        dates, values = self._read(self._path(metric_id, country_id))
+        return dates.astype('datetime64[ns]'), values.copy()
+
+    def frame(self, keys, freq=None):
+        # files decode in parallel (pyarrow releases the GIL)
+        with ThreadPoolExecutor(max_workers=min(8, len(keys) or 1)) as pool:
+            parts = list(pool.map(lambda key: self._read(self._path(*key, freq)), keys))
+        return (np.repeat(np.arange(len(keys)), [len(dates) for dates, values in parts]),
+                np.concatenate([dates for dates, values in parts] or [np.array([], 'datetime64[D]')]).astype('datetime64[ns]'),
+                np.concatenate([values for dates, values in parts] or [np.array([], 'float64')]))
+
+    def rollup(self, metric_id, country_id, freq):
+        dates, values = self._read(self._path(metric_id, country_id, freq))
+        return dates.astype('datetime64[ns]'), values.copy()
+
+    def write_rollup(self, metric_id, country_id, freq, start, periods, values):
+        path = self._path(metric_id, country_id, freq)
+        old_dates, old_values = self._read(path)
+        keep = old_dates < np.datetime64(start, 'D') if start else np.zeros(len(old_dates), bool)
+        self._stage(path, np.concatenate([old_dates[keep], np.array(periods, dtype='datetime64[D]')]),
+                    np.concatenate([old_values[keep], np.array(values, dtype='float64')]))
+
+    def _exists(self, path: str) -> bool:
+        if self._staged.writes is not None:
+            if path in self._staged.writes:
+                return True
+            if os.path.dirname(path) in self._staged.deleted:
+                return False
+        return os.path.exists(path)
+
+    def series(self):
+        directories = set()
+        if os.path.isdir(self.root):
+            for metric in os.listdir(self.root):
+                directories.update(os.path.join(self.root, metric, country)
+                                   for country in os.listdir(os.path.join(self.root, metric)))
+        if self._staged.writes is not None:
+            directories.update(os.path.dirname(path) for path in self._staged.writes)
+        keys = []
+        for directory in sorted(directories):
+            if self._exists(os.path.join(directory, 'points.parquet')):
+                metric, country = directory.split(os.sep)[-2:]
+                country_id = country.split('=', 1)[1]
+                keys.append((int(metric.split('=', 1)[1]),
+                             None if country_id == 'global' else int(country_id)))
+        return keys
+
+    def delete(self, metric_id, country_id):
+        directory = self._dir(metric_id, country_id)
+        if self._staged.writes is None:
+            shutil.rmtree(directory, ignore_errors=True)
+            return
+        self._staged.deleted.add(directory)
+        for path in [path for path in self._staged.writes if os.path.dirname(path) == directory]:
+            del self._staged.writes[path]
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        with self._lock:
+            self._files.clear()
+
+def open_store(backend: str, connect: Callable, root: str) -> Store:
+    if backend == 'sqlite':
+        return SQLiteStore(connect)
+    if backend == 'parquet':
+        return ParquetStore(root)
+    raise ValueError(f'unknown storage backend {backend!r}, use one of {list(BACKENDS)}')
+
+
+if __name__ == '__main__':
+    import sys
+    import src.database as db
+
+    if len(sys.argv) != 3 or sys.argv[1] not in BACKENDS or sys.argv[2] not in BACKENDS:
+        sys.exit(f'usage: python -m src.storage <from> <to>  (one of {", ".join(BACKENDS)})')
+    counts = db.migrate(sys.argv[1], sys.argv[2])
+    print(f'----- Migrated {counts["series"]} series, {counts["points"]:,} points '
+          f'from {sys.argv[1]} to {sys.argv[2]} -----')
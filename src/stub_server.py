@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import threading
+import zlib
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from typing import Optional
+
+# Local stand-in for the FRED and BoE endpoints used by src.collection.
+#
+# Recorded payloads are served from `payload_dir`:
+#   fred/<series id>.csv   (FRED graph CSV)
+#   boe/<series code>.html (BoE results table)
+# and trimmed to the requested window. Series without a recording get a
+# synthetic random walk so the pipeline can be benchmarked offline.
+#
+#   python -m src.stub_server [port] [payload_dir]
+#   FRED_URL=... BOE_URL=... python -m src.collection
+
+FRED_PATH = '/graph/fredgraph.csv'
+BOE_PATH = '/boeapps/database/fromshowcolumns.asp'
+
+ORIGIN = '1950-01-01' # first date of every synthetic series
+FREQUENCIES = {'Daily, 7-Day': 'D', 'Daily': 'D', 'Monthly': 'MS', 'Quarterly': 'QS'}
+
+def synthetic_series(key: str, start, end, freq: str) -> pd.Series:
+    # the walk always starts at ORIGIN, seeded by series, and the requested
+    # window is cut from it, so overlapping requests agree on every date
+    dates = pd.date_range(ORIGIN, end, freq=freq)
+    rng = np.random.default_rng(zlib.crc32(key.encode()))
+    values = 100 + np.cumsum(rng.normal(0, 1, len(dates)))
+    s = pd.Series(np.round(values, 2), index=dates)
+    return s[s.index >= pd.Timestamp(start)]
+
+def fred_payload(payload_dir: Optional[str], query: dict) -> str:
+    series_id = query.get('id', ['DFF'])[0]
+    start = query.get('cosd', ['2000-01-01'])[0]
+    end = query.get('coed', [datetime.now().strftime('%Y-%m-%d')])[0]
+
+    path = os.path.join(payload_dir or '', 'fred', f'{series_id}.csv')
+    if payload_dir and os.path.exists(path):
+        lines = open(path).read().splitlines()
+        # ISO dates compare correctly as strings
+        rows = [line for line in lines[1:] if start <= line[:10] <= end]
+        return '\n'.join([lines[0]] + rows) + '\n'
+
+    freq = FREQUENCIES.get(query.get('fq', ['Daily'])[0], 'D')
+    s = synthetic_series(series_id, start, end, freq)
+    rows = [f'{d:%Y-%m-%d},{v}' for d, v in s.items()]
+    return '\n'.join([f'observation_date,{series_id}'] + rows) + '\n'
+
+def boe_payload(payload_dir: Optional[str], query: dict) -> str:
+    code = query.get('SeriesCodes', ['IUDBEDR'])[0]
+    start = datetime.strptime(
+        '{} {} {}'.format(*(query.get(k, [d])[0] for k, d in
+                            [('FD', '1'), ('FM', 'Jan'), ('FY', '2000')])), '%d %b %Y')
+    today = datetime.now()
+    end = datetime.strptime(
+        '{} {} {}'.format(*(query.get(k, [d])[0] for k, d in
+                            [('TD', today.strftime('%d')), ('TM', today.strftime('%b')),
+                             ('TY', today.strftime('%Y'))])), '%d %b %Y')
+
+    path = os.path.join(payload_dir or '', 'boe', f'{code}.html')
+    if payload_dir and os.path.exists(path):
+        # recorded tables are served as-is
+        return open(path).read()
+
+    s = synthetic_series(code, start, end, 'D')
+    rows = ''.join(f'<tr><td>{d:%d %b %y}</td><td>{v}</td></tr>' for d, v in s.items())
+    return f'<html><body><table><tbody>{rows}</tbody></table></body></html>'
+
+def make_handler(payload_dir: Optional[str], delay: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == FRED_PATH:
+                body, content_type = fred_payload(payload_dir, query), 'text/csv'
+            elif url.path == BOE_PATH:
+                body, content_type = boe_payload(payload_dir, query), 'text/html'
+            else:
+                self.send_error(404)
+                return
+
+            # simulated network latency
+            if delay:
+                time.sleep(delay)
+
+            data = body.encode()
+            # strong validator, so collectors can ask If-None-Match
+            etag = f'"{zlib.crc32(data):08x}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def serve(port: int = 0, payload_dir: Optional[str] = None, delay: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Start the stub server on a background thread and return it.
+    Call `server.shutdown()` to stop it.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(payload_dir, delay))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def urls(server: ThreadingHTTPServer):
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}{FRED_PATH}', f'http://{host}:{port}{BOE_PATH}'
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8008
+    payload_dir = sys.argv[2] if len(sys.argv) > 2 else None
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(payload_dir, 0.0))
+    fred_url, boe_url = urls(server)
+    print(f'FRED_URL={fred_url}')
+    print(f'BOE_URL={boe_url}')
+    server.serve_forever()
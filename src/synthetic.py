@@ -0,0 +1,164 @@
+import sys
+import time
+import argparse
+import itertools
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import Dict, List
+
+import src.database as db
+import src.series_cache as series_cache
+
+# Synthetic finance_data.db at benchmark scale. The real countries, metrics
+# and sources from database.run() come first, so the analysis code runs
+# unchanged against it; generated ones follow:
+#   countries 'AA', 'AB', ... ('Country AA', currency 'CAA')
+#   metrics   'synthetic metric 000', ... cycling through daily (business
+#             day), monthly and quarterly series, a share of them global
+# Every series is a seeded random walk from `start` to `end`.
+#
+#   python -m src.synthetic synthetic.db --scale large
+
+# (countries, metrics), see generate()
+SCALES = {
+    'small': (10, 8),
+    'medium': (50, 16),
+    'large': (200, 36),
+}
+FREQS = ['B', 'MS', 'QS']
+# real series: (country code, metric name, freq)
+REAL_SERIES = [
+    ('US', 'policy interest rate', 'B'),
+    ('UK', 'policy interest rate', 'B'),
+    ('NULL', 'global energy index', 'MS'),
+    ('NULL', 'global all commodities index', 'QS'),
+    ('NULL', 'global food index', 'MS'),
+]
+SOURCE = 'Synthetic'
+BATCH_ROWS = 1_000_000 # rows per transaction
+
+def _codes(n: int, skip=('UK', 'US')) -> List[str]:
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    codes = (a + b for a, b in itertools.product(letters, repeat=2))
+    return list(itertools.islice((code for code in codes if code not in skip), n))
+
+def random_walk(rng: np.random.Generator, size: int) -> np.ndarray:
+    return np.round(100 + np.cumsum(rng.normal(0, 1, size)), 4)
+
+def generate(path: str = 'synthetic.db', countries: int = 10, metrics: int = 8,
+             start: str = '1990-01-01', end: str = '2025-01-01',
+             global_share: float = 0.25, seed: int = 0,
+             rollups: bool = True, verbose: bool = True) -> Dict[str, int]:
+    """
+    Build a fresh database at `path` with `countries` generated countries and
+    `metrics` generated metrics (every `1 / global_share`-th of them global,
+    the rest stored for every country), and point src.database at it.
+    Rollups are built unless `rollups` is False. Points are written straight
+    into SQLite, then copied into db.BACKEND if that's another store.
+    Returns row counts.
+    """
+    started = time.perf_counter()
+    db.DB_PATH = path
+    backend, db.BACKEND = db.BACKEND, 'sqlite'
+    try:
+        counts = _generate(countries, metrics, start, end, global_share, seed, rollups, verbose)
+        if backend != 'sqlite':
+            db.migrate('sqlite', backend)
+    finally:
+        db.BACKEND = backend
+
+    counts['seconds'] = round(time.perf_counter() - started, 2)
+    if verbose:
+        print(f'----- Generating: Done {counts} -----')
+    return counts
+
+def _generate(countries: int, metrics: int, start: str, end: str, global_share: float,
+              seed: int, rollups: bool, verbose: bool) -> Dict[str, int]:
+    db.run()
+    conn = db.connect()
+    cur = conn.cursor()
+
+    codes = _codes(countries)
+    cur.executemany('''
+        INSERT INTO countries (country_code, country_name, currency_code) VALUES (?, ?, ?)
+    ''', [(code, f'Country {code}', f'C{code}') for code in codes])
+    names = [f'synthetic metric {i:03d}' for i in range(metrics)]
+    cur.executemany('INSERT INTO metrics (metric_name, unit) VALUES (?, ?)',
+                    [(name, '') for name in names])
+    conn.commit()
+    db.invalidate_cache()
+
+    every = max(1, round(1 / global_share)) if global_share else 0
+    series = list(REAL_SERIES)
+    for i, name in enumerate(names):
+        freq = FREQS[i % len(FREQS)]
+        if every and i % every == every - 1:
+            series.append(('NULL', name, freq))
+        else:
+            series += [(code, name, freq) for code in ['US', 'UK'] + codes]
+
+    cur.executemany('''
+        INSERT OR IGNORE INTO sources (country_id, metric_id, source_name, source_url)
+        VALUES (?, ?, ?, NULL)
+    ''', [(db.get_country_id(code), db.get_metric_id(name), SOURCE)
+          for code, name, freq in series[len(REAL_SERIES):]])
+    conn.commit()
+
+    dates = {freq: np.datetime_as_string(pd.date_range(start, end, freq=freq).to_numpy(), unit='D')
+             for freq in FREQS}
+    rng = np.random.default_rng(seed)
+    rows = 0
+    pending = 0
+    # written in index order, so the covering index only ever appends
+    for code, name, freq in sorted(series, key=lambda s: (db.get_metric_id(s[1]), db.get_country_id(s[0]) or 0)):
+        country_id = db.get_country_id(code)
+        metric_id = db.get_metric_id(name)
+        values = random_walk(rng, len(dates[freq]))
+        cur.executemany('''
+            INSERT INTO data_points (country_id, metric_id, date, value) VALUES (?, ?, ?, ?)
+        ''', zip(itertools.repeat(country_id), itertools.repeat(metric_id),
+                 dates[freq].tolist(), values.tolist()))
+        rows += len(values)
+        pending += len(values)
+        if pending >= BATCH_ROWS:
+            conn.commit()
+            pending = 0
+            if verbose:
+                print(f'----- Generating: {rows:,} rows -----', end='\r')
+
+    cur.execute('''
+        INSERT INTO data_versions (country_id, metric_id, version, updated_at)
+        SELECT DISTINCT country_id, metric_id, 1, ? FROM data_points
+    ''', (datetime.now(timezone.utc).isoformat(sep=' '),))
+    conn.commit()
+
+    if rollups:
+        if verbose:
+            print(f'----- Generating: {rows:,} rows, building rollups -----', end='\r')
+        db.rebuild_rollups()
+    series_cache.clear()
+
+    return {
+        'countries': countries + 2,
+        'metrics': metrics + len({name for code, name, freq in REAL_SERIES}),
+        'series': len(series),
+        'data_points': rows,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic finance_data.db.')
+    parser.add_argument('path', nargs='?', default='synthetic.db')
+    parser.add_argument('--scale', choices=list(SCALES), default='small')
+    parser.add_argument('--countries', type=int, default=None)
+    parser.add_argument('--metrics', type=int, default=None)
+    parser.add_argument('--start', default='1990-01-01')
+    parser.add_argument('--end', default='2025-01-01')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-rollups', action='store_true')
+    args = parser.parse_args(sys.argv[1:])
+
+    countries, metrics = SCALES[args.scale]
+    generate(args.path, args.countries or countries, args.metrics or metrics,
+             args.start, args.end, seed=args.seed, rollups=not args.no_rollups)
@@ -0,0 +1,50 @@
+import pytest
+
+import src.database as db
+import src.synthetic as synthetic
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # caches (series_cache/, bootstrap_cache/, response_cache/, the parquet
+    # store) live in the working directory
+    monkeypatch.chdir(tmp_path)
+    yield tmp_path
+    db.close_connections()
+    db.invalidate_cache()
+
+@pytest.fixture
+def database(workdir, monkeypatch):
+    # a small synthetic database: the real series plus 3 countries x 4 metrics
+    monkeypatch.setattr(db, 'BACKEND', 'sqlite')
+    monkeypatch.setattr(db, 'DB_PATH', str(workdir / 'test.db'))
+    synthetic.generate(db.DB_PATH, countries=3, metrics=4, start='2000-01-01', end='2010-01-01',
+                       verbose=False)
+    return db.DB_PATH
+
+@pytest.fixture
+def frame():
+    # monthly random walks with gaps: two rates and three indices
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(0)
+    index = pd.date_range('2000-01-01', periods=240, freq='MS')
+    values = np.cumsum(rng.normal(0, 1, (240, 5)), axis=0)
+    values[rng.random(values.shape) < 0.05] = np.nan
+    values[:30, 4] = np.nan # an index that starts late
+    return pd.DataFrame(values, index=index, columns=['US', 'UK', 'Food', 'Energy', 'All Commodities'])
+
+@pytest.fixture
+def client(database):
+    import warnings
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore') # starlette's httpx deprecation
+        from fastapi.testclient import TestClient
+    import src.api as api
+
+    api._responses.clear()
+    api._responses_bytes = 0
+    with TestClient(api.app) as client:
+        yield client
+    api._responses.clear()
+    api._responses_bytes = 0
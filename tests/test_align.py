@@ -0,0 +1,31 @@
+import numpy as np
+import pandas as pd
+
+import src.analysis as analysis
+
+def test_matches_per_series_resampling():
+    rng = np.random.default_rng(1)
+    days = pd.bdate_range('2000-01-03', '2010-12-31')
+    days = days[rng.random(len(days)) > 0.1] # missing days
+    rate = pd.Series(np.round(np.cumsum(rng.normal(0, 0.05, len(days))), 2), index=days)
+    short = rate.loc[:'2008-06-30'] + 1 # ends before the others
+    quarters = pd.date_range('2000-01-01', '2010-10-01', freq='QS')
+    index = pd.Series(np.cumsum(rng.normal(0, 1, len(quarters))), index=quarters)
+    frame = pd.concat({'US': rate, 'UK': short, 'All Commodities': index}, axis=1, sort=True)
+
+    aligned = analysis.align(frame, {'US': 'mean', 'UK': 'mean', 'All Commodities': 'ffill'})
+
+    # one series at a time, as analysis() used to
+    for col, s in (('US', rate), ('UK', short)):
+        expected = s.resample('D').ffill().resample('MS').mean()
+        pd.testing.assert_series_equal(aligned[col].dropna(), expected, check_names=False, check_freq=False)
+    expected = index.resample('MS').ffill()
+    pd.testing.assert_series_equal(aligned['All Commodities'].dropna(), expected,
+                                   check_names=False, check_freq=False)
+    # forward filling stops at a series' last observation
+    assert aligned['UK'].loc['2008-07-01':].isna().all()
+
+def test_last_rule():
+    s = pd.Series([1.0, 2.0, 3.0], index=pd.to_datetime(['2020-01-05', '2020-01-20', '2020-03-02']))
+    aligned = analysis.align(s.to_frame('x'), {'x': 'last'}, 'MS')
+    pd.testing.assert_series_equal(aligned['x'], s.resample('MS').last(), check_names=False)
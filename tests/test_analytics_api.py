@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.analysis as analysis
+import src.database as db
+
+CORR = '/analytics/rolling-corr?rate=US&index=Energy&window=24'
+ALIGNED = '/analytics/aligned?series=US,UK,Energy'
+
+@pytest.fixture
+def no_compute(monkeypatch):
+    # from here on aligning series fails
+    def fail(*args, **kwargs):
+        raise AssertionError('computed')
+    return lambda: monkeypatch.setattr(analysis, 'get_aligned_datas', fail)
+
+def test_rolling_corr(client):
+    response = client.get(CORR)
+    assert response.status_code == 200
+    rows = response.json()
+    datas = analysis.get_aligned_datas(analysis.resolve_series(['US', 'Energy']), 'MS')
+    expected = datas['US'].rolling(24).corr(datas['Energy']).dropna()
+    assert [date for date, value in rows] == expected.index.strftime('%Y-%m-%d').tolist()
+    np.testing.assert_allclose([value for date, value in rows], expected.to_numpy(), atol=1e-9)
+
+@pytest.mark.parametrize('freq', ['QS', 'YE'])
+def test_freq(client, freq):
+    rows = client.get(f'/analytics/rolling-corr?rate=US&index=Energy&window=4&freq={freq}').json()
+    dates = pd.DatetimeIndex([date for date, value in rows])
+    assert len(dates)
+    pd.testing.assert_index_equal(dates, pd.date_range(dates[0], dates[-1], freq=freq), exact=False)
+
+@pytest.mark.parametrize('url', [CORR, ALIGNED])
+@pytest.mark.parametrize('freq', ['M', '2MS', 'MS;', 'bogus'])
+def test_unknown_freq(client, url, freq):
+    assert client.get(f'{url}&freq={freq}').status_code == 422
+
+@pytest.mark.parametrize('url', [CORR, ALIGNED])
+def test_not_modified_computes_nothing(client, no_compute, url):
+    first = client.get(url)
+    etag = first.headers['ETag']
+    no_compute()
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+    # and the body comes from the cache
+    assert client.get(url).content == first.content
+
+@pytest.mark.parametrize('url', [CORR, ALIGNED])
+def test_etag_follows_inputs(client, url):
+    first = client.get(url)
+    assert client.get(url + '&freq=QS').headers['ETag'] != first.headers['ETag']
+    # new data for an input series
+    db.insert_data('US', 'policy interest rate', [{'date': '2010-06-01', 'value': 9.5}])
+    response = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != first.headers['ETag']
+
+def test_aligned(client):
+    body = client.get(ALIGNED).json()
+    assert body['columns'] == ['US', 'UK', 'Energy']
+    assert len(body['index']) == len(body['data']) and all(len(row) == 3 for row in body['data'])
+    csv = client.get(ALIGNED + '&format=csv')
+    lines = csv.text.splitlines()
+    assert lines[0] == 'date,US,UK,Energy'
+    assert [line.split(',')[0] for line in lines[1:]] == body['index']
+    assert csv.headers['ETag'] != client.get(ALIGNED).headers['ETag']
+
+def test_aligned_formats(client):
+    assert client.get(ALIGNED, headers={'Accept': 'application/vnd.apache.arrow.stream'}).status_code == 406
+
+def test_unknown_series(client):
+    assert client.get('/analytics/rolling-corr?rate=US&index=nothing').status_code == 404
@@ -0,0 +1,49 @@
+import pytest
+
+import src.database as db
+
+PAGE = '/data/US/policy interest rate?start=2005-01-01&limit=10'
+
+@pytest.fixture
+def no_reads(monkeypatch):
+    # from here on any read of the stored points fails
+    def fail(*args, **kwargs):
+        raise AssertionError('store read')
+    def arm():
+        monkeypatch.setattr(db, 'get_store', fail)
+        monkeypatch.setattr(db, 'get_next_cursor', fail)
+    return arm
+
+def test_page_has_next_cursor(client):
+    response = client.get(PAGE)
+    assert response.status_code == 200
+    rows = response.json()
+    assert len(rows) == 10 and rows[0][0] >= '2005-01-01'
+    assert response.headers['X-Next-Cursor'] == rows[-1][0]
+    assert 'rel="next"' in response.headers['Link']
+
+def test_not_modified_page_reads_nothing(client, no_reads):
+    first = client.get(PAGE)
+    no_reads()
+    response = client.get(PAGE, headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 304
+
+def test_cached_page_keeps_its_cursor(client, no_reads):
+    first = client.get(PAGE)
+    no_reads()
+    response = client.get(PAGE)
+    assert response.status_code == 200
+    assert response.content == first.content
+    assert response.headers['X-Next-Cursor'] == first.headers['X-Next-Cursor']
+
+def test_points_preview(client):
+    full = client.get('/data/US/policy interest rate').json()
+    preview = client.get('/data/US/policy interest rate?points=50')
+    assert preview.status_code == 200
+    rows = preview.json()
+    assert 3 <= len(rows) <= 50 < len(full)
+    assert rows[0] == full[0] and rows[-1] == full[-1]
+    # decimated, not resampled: every row is a stored point
+    assert all(row in full for row in rows)
+    assert preview.headers['ETag'] != client.get('/data/US/policy interest rate').headers['ETag']
+    assert client.get('/data/US/policy interest rate?points=2').status_code == 422
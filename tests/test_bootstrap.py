@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+import src.bootstrap as bootstrap
+
+RATES = ('US', 'UK')
+IDXS = ('Food', 'Energy', 'All Commodities')
+
+def test_bands_do_not_depend_on_workers(frame):
+    bands = [bootstrap.block_bootstrap_bands(frame, RATES, IDXS, (24, 36), resamples=200, min_periods=18, seed=7,
+                                             workers=workers)
+             for workers in (1, 3)]
+    pd.testing.assert_frame_equal(bands[0], bands[1])
+    assert bands[0].columns.nlevels == 4
+    assert bands[0][('lower', 36, 'US', 'Food')].notna().any()
+
+def test_bands_enclose_rolling_corr(frame):
+    bands = bootstrap.block_bootstrap_bands(frame, ['US'], ['Food'], [36], resamples=200,
+                                            min_periods=24)
+    corr = frame['US'].rolling(36, min_periods=24).corr(frame['Food'])
+    lower, upper = bands[('lower', 36, 'US', 'Food')], bands[('upper', 36, 'US', 'Food')]
+    assert np.all(lower.dropna() <= upper.dropna())
+    assert lower[:35].isna().all()
+    # the point estimate sits inside its band nearly everywhere
+    inside = ((lower <= corr) & (corr <= upper))[corr.notna() & lower.notna()]
+    assert inside.mean() > 0.9
@@ -0,0 +1,84 @@
+import pytest
+
+import src.collection as collection
+import src.database as db
+import src.instrument as instrument
+import src.response_cache as response_cache
+import src.stub_server as stub_server
+
+@pytest.fixture
+def server():
+    server = stub_server.serve()
+    yield server
+    server.shutdown()
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(instrument, 'ENABLED', True)
+    instrument.reset()
+    yield instrument._counters
+    instrument.reset()
+
+def fred_job(server, start: str = '2020-01-01') -> dict:
+    fred_url, boe_url = stub_server.urls(server)
+    return {'country': 'US', 'metric': 'policy interest rate', 'source': collection.FRED,
+            'url': fred_url, 'params': {'id': 'DFF', 'cosd': start, 'coed': '2020-12-31'},
+            'parse': collection.PARSERS[collection.FRED]}
+
+def counter(metrics, name: str) -> float:
+    return metrics.get((name, (('source', collection.FRED),)), 0)
+
+def watermark():
+    return db.get_watermark('US', 'policy interest rate', collection.FRED)
+
+def backdate_watermark():
+    conn = db.connect()
+    conn.execute("UPDATE watermarks SET last_fetched = '2000-01-01T00:00:00'")
+    conn.commit()
+
+def test_not_modified_refreshes_watermark(database, server, metrics):
+    session = collection.make_session(1)
+    collection.collect_job(session, fred_job(server))
+    assert watermark()['last_date'] == '2020-12-31'
+    version = db.get_data_version(db.get_metric_id('policy interest rate'), db.get_country_id('US'))
+
+    backdate_watermark()
+    collection.collect_job(session, fred_job(server))
+    assert counter(metrics, 'collection_not_modified_total') == 1
+    assert watermark()['last_date'] == '2020-12-31'
+    assert watermark()['last_fetched'] > '2000-01-01T00:00:00'
+    # the series was left alone
+    assert db.get_data_version(db.get_metric_id('policy interest rate'), db.get_country_id('US')) == version
+
+def test_unchanged_payload_refreshes_watermark(database, server, metrics):
+    session = collection.make_session(1)
+    collection.collect_job(session, fred_job(server))
+    # validators lost, same body: downloaded again but not parsed
+    record = response_cache.load(fred_job(server))
+    response_cache.save(fred_job(server), type('Response', (), {'headers': {}}), record['digest'],
+                        record['version'], applied=False, record=record)
+
+    backdate_watermark()
+    collection.collect_job(session, fred_job(server))
+    assert counter(metrics, 'collection_unchanged_total') == 1
+    assert watermark()['last_fetched'] > '2000-01-01T00:00:00'
+
+def test_overlapping_windows_agree(database, server):
+    # a later window restates nothing: the stub's walk has a fixed origin
+    session = collection.make_session(1)
+    collection.collect_job(session, fred_job(server, '2020-01-01'))
+    before = db.get_series('policy interest rate', 'US')
+    collection.collect_job(session, fred_job(server, '2020-06-01'))
+    after = db.get_series('policy interest rate', 'US')
+    assert after.equals(before)
+
+def test_validators_survive_a_new_day(database, server, metrics):
+    # only the end-of-window params moved: still a conditional request
+    session = collection.make_session(1)
+    job = dict(fred_job(server), moving=collection.FRED_MOVING)
+    collection.collect_job(session, dict(job, params=dict(job['params'], vintage_date='2021-01-01')))
+    collection.collect_job(session, dict(job, params=dict(job['params'], vintage_date='2021-01-02')))
+    assert counter(metrics, 'collection_not_modified_total') == 1
+    # a different start is a different request
+    collection.collect_job(session, fred_job(server, '2020-02-01'))
+    assert counter(metrics, 'collection_not_modified_total') == 1
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+
+import src.analysis as analysis
+
+RATES = ['US', 'UK']
+IDXS = ['Food', 'All Commodities']
+
+def test_matches_shift_and_correlate(frame):
+    max_lag = 24
+    corrs = analysis.cross_corrs(frame, RATES, IDXS, max_lag)
+    assert list(corrs.index) == list(range(-max_lag, max_lag + 1))
+    for rate in RATES:
+        for idx in IDXS:
+            # corr(rate[t], index[t + lag])
+            expected = [frame[rate].corr(frame[idx].shift(-lag), min_periods=3)
+                        for lag in corrs.index]
+            np.testing.assert_allclose(corrs[(rate, idx)], expected, atol=1e-9)
+
+def test_best_lags(frame):
+    corrs = analysis.cross_corrs(frame, RATES, IDXS, 12)
+    best = analysis.best_lags(frame, RATES, IDXS, 12)
+    for pair in corrs.columns:
+        lag = corrs[pair].abs().idxmax()
+        assert best.loc[pair, 'lag'] == lag
+        assert best.loc[pair, 'corr'] == corrs.loc[lag, pair]
+
+def test_rolling_best_lag_uses_trailing_pairs(frame):
+    window, max_lag = 48, 6
+    best = analysis.rolling_best_lag(frame, ['US'], ['Food'], window, max_lag, min_periods=30)
+    rate, idx = frame['US'], frame['Food']
+    for date in frame.index[[100, 180, -1]]:
+        corr = {}
+        for lag in range(-max_lag, max_lag + 1):
+            # pairs dated by their later observation, the last `window` of them
+            pairs = (pd.concat([rate.shift(lag), idx], axis=1) if lag >= 0 else
+                     pd.concat([rate, idx.shift(-lag)], axis=1))
+            pairs = pairs.loc[:date].iloc[-window:]
+            corr[lag] = pairs.iloc[:, 0].corr(pairs.iloc[:, 1], min_periods=30)
+        lag = max(corr, key=lambda lag: abs(corr[lag]))
+        assert best.loc[date, ('lag', 'US', 'Food')] == lag
+        assert np.isclose(best.loc[date, ('corr', 'US', 'Food')], corr[lag])
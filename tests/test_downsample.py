@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.downsample import downsample, downsample_series, lttb_indices, minmax_indices
+
+@pytest.fixture
+def walk():
+    rng = np.random.default_rng(1)
+    x = np.arange('2000-01-01', '2003-01-01', dtype='datetime64[D]')
+    return x, np.cumsum(rng.normal(0, 1, len(x)))
+
+def test_lttb_keeps_first_and_last(walk):
+    x, y = walk
+    picked = lttb_indices(x, y, 100)
+    assert len(picked) == 100
+    assert picked[0] == 0 and picked[-1] == len(y) - 1
+    assert np.all(np.diff(picked) > 0)
+
+def test_lttb_keeps_a_spike(walk):
+    x, y = walk
+    y = y.copy()
+    y[500] = y.max() + 100
+    assert 500 in lttb_indices(x, y, 50)
+
+def test_minmax_keeps_extremes(walk):
+    x, y = walk
+    picked = minmax_indices(y, 100)
+    assert len(picked) <= 100
+    assert picked[0] == 0 and picked[-1] == len(y) - 1
+    for n in (3, 4, 5):
+        assert len(minmax_indices(y, n)) <= n
+    assert np.argmin(y) in picked and np.argmax(y) in picked
+    # the min and max of every bucket
+    starts = np.linspace(0, len(y), 50).astype(np.int64)
+    for lo, hi in zip(starts[:-1], starts[1:]):
+        assert lo + np.argmin(y[lo:hi]) in picked and lo + np.argmax(y[lo:hi]) in picked
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_short_series_unchanged(walk, method):
+    x, y = walk
+    for n in (len(y), len(y) + 10):
+        dx, dy = downsample(x, y, n, method)
+        np.testing.assert_array_equal(dx, x)
+        np.testing.assert_array_equal(dy, y)
+    np.testing.assert_array_equal(lttb_indices(x, y, len(y)), np.arange(len(y)))
+    np.testing.assert_array_equal(minmax_indices(y, len(y)), np.arange(len(y)))
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_nans_dropped(walk, method):
+    x, y = walk
+    y = y.copy()
+    y[[0, 1, 200, 201, 202, -1]] = np.nan
+    dx, dy = downsample(x, y, 60, method)
+    assert len(dy) <= 60 and not np.isnan(dy).any()
+    # first and last of the points that are there
+    assert dx[0] == x[2] and dx[-1] == x[-2]
+    # every point picked is a point of the series
+    np.testing.assert_array_equal(dy, y[np.searchsorted(x, dx)])
+
+def test_series_keeps_dates_and_name(walk):
+    x, y = walk
+    s = pd.Series(y, index=pd.DatetimeIndex(x, name='date'), name='US')
+    out = downsample_series(s, 40, 'minmax')
+    assert out.name == 'US' and out.index.name == 'date'
+    assert isinstance(out.index, pd.DatetimeIndex)
+    pd.testing.assert_series_equal(out, s.loc[out.index], check_freq=False)
+    assert downsample_series(s, len(s)) is s
+
+def test_unknown_method(walk):
+    with pytest.raises(ValueError):
+        downsample(*walk, 10, 'mean')
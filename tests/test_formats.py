@@ -0,0 +1,76 @@
+import io
+
+import numpy as np
+import pytest
+
+import src.formats as formats
+
+SERIES = '/data/US/policy interest rate'
+
+@pytest.fixture
+def stored(client):
+    # the series as JSON: [[date, value], ...]
+    rows = client.get(SERIES).json()
+    return (np.array([date for date, value in rows], dtype='datetime64[D]'),
+            np.array([value for date, value in rows], dtype='float64'))
+
+def assert_same(dates, values, stored):
+    np.testing.assert_array_equal(np.asarray(dates).astype('datetime64[D]'), stored[0])
+    np.testing.assert_array_equal(values, stored[1])
+
+def test_negotiate():
+    assert formats.negotiate(None) == formats.JSON
+    assert formats.negotiate('text/csv;q=0.5, application/vnd.apache.arrow.stream') == formats.ARROW
+    assert formats.negotiate('application/x-parquet') == formats.PARQUET
+    assert formats.negotiate('text/csv;q=0, text/html') == formats.JSON
+    assert formats.negotiate('text/csv', format='msgpack') == formats.MSGPACK
+    with pytest.raises(formats.NotAcceptable):
+        formats.negotiate(None, format='xml')
+
+def test_csv_round_trips_float64():
+    values = np.array([0.1, 1 / 3, 2 ** 0.5, 1e-300, 123456789.123456789, -0.0, np.nan])
+    dates = np.arange('2000-01-01', '2000-01-08', dtype='datetime64[D]')
+    lines = formats.encode(formats.CSV, dates, values).decode().splitlines()
+    assert lines[0] == 'date,value'
+    np.testing.assert_array_equal([float(line.split(',')[1]) for line in lines[1:]], values)
+
+def test_arrow(client, stored):
+    pa = pytest.importorskip('pyarrow')
+    response = client.get(SERIES, headers={'Accept': formats.ARROW})
+    assert response.headers['content-type'] == formats.ARROW
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert_same(table.column('date').to_numpy(), table.column('value').to_numpy(), stored)
+
+def test_parquet(client, stored):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    response = client.get(SERIES + '?format=parquet')
+    assert response.headers['content-type'] == formats.PARQUET
+    table = pq.read_table(io.BytesIO(response.content))
+    assert_same(table.column('date').to_numpy(), table.column('value').to_numpy(), stored)
+
+def test_csv(client, stored):
+    response = client.get(SERIES, headers={'Accept': 'text/csv'})
+    assert response.headers['content-type'].startswith(formats.CSV)
+    lines = response.text.splitlines()
+    assert lines[0] == 'date,value'
+    assert_same([line.split(',')[0] for line in lines[1:]],
+                [float(line.split(',')[1]) for line in lines[1:]], stored)
+
+def test_msgpack(client, stored):
+    msgpack = pytest.importorskip('msgpack')
+    response = client.get(SERIES, headers={'Accept': 'application/x-msgpack'})
+    assert response.headers['content-type'] == formats.MSGPACK
+    body = msgpack.unpackb(response.content)
+    assert body['length'] == len(stored[0])
+    assert_same(np.frombuffer(body['date'], '<i8').astype('datetime64[D]'),
+                np.frombuffer(body['value'], '<f8'), stored)
+
+def test_formats_have_their_own_etag(client):
+    etags = {client.get(SERIES + f'?format={format}').headers['ETag'] for format in formats.FORMATS}
+    assert len(etags) == len(formats.FORMATS)
+
+def test_unsupported_format(client):
+    response = client.get(SERIES + '?format=xml')
+    assert response.status_code == 406
+    assert 'xml' in response.json()['detail']
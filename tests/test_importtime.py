@@ -0,0 +1,16 @@
+import pytest
+
+import src.importtime as importtime
+
+@pytest.mark.parametrize('module', list(importtime.CHECKS))
+def test_no_heavy_imports(module):
+    forbidden, budget = importtime.CHECKS[module]
+    total, imported = importtime.measure(module)
+    assert module in imported
+    assert [name for name in forbidden if name in imported] == []
+
+def test_check_reports_forbidden_import():
+    # the import time budgets are left to `python -m src.importtime`, they
+    # depend on the machine
+    failures = importtime.check({'src.downsample': (['numpy'], 10_000)}, repeat=1)
+    assert failures == ['src.downsample imports numpy']
@@ -0,0 +1,24 @@
+import pytest
+
+import src.database as db
+
+def test_lookups_use_indexes(database):
+    plans = db.check_query_plans()
+
+    statements = [' '.join(statement.split()) for statement in plans]
+    for table in ('data_points', 'rollups', 'data_versions', 'watermarks'):
+        assert any(table in statement for statement in statements), table
+    for statement, plan in plans.items():
+        if 'FROM data_points' in statement:
+            assert any('USING COVERING INDEX idx_data_points_series' in step for step in plan), statement
+
+def test_check_leaves_no_watermark(database):
+    db.check_query_plans()
+    assert db.connect().execute('SELECT COUNT(*) FROM watermarks').fetchone()[0] == 0
+
+def test_full_scan_is_reported(database, monkeypatch):
+    def by_value(metric_id):
+        return db.connect().execute('SELECT date FROM data_points WHERE value > 100').fetchall()
+    monkeypatch.setattr(db, 'get_data_global_metric', by_value)
+    with pytest.raises(AssertionError, match='SCAN data_points'):
+        db.check_query_plans()
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+
+import src.analysis as analysis
+
+RATES = ['US', 'UK']
+IDXS = ['Food', 'All Commodities']
+REGIMES = [
+    ('2001-03-01', '2001-11-30', 'recession'),
+    ('2000-01-01', '2005-06-30', 'early'), # overlaps, and starts before the late index
+    ('2004-02-15', '2012-12-31', 'middle'),
+    ('2018-01-01', '2030-01-01', 'runs past the data'),
+    ('2010-05-02', '2010-05-20', 'no dates'),
+]
+
+def expected_stats(frame: pd.DataFrame, rate: str, idx: str, start, end, window: int = 36) -> dict:
+    # the same statistics from .loc slices of the regime
+    sub = frame.loc[start:end]
+    pairs = sub[[rate, idx]].dropna()
+    rolling = frame[rate].rolling(window).corr(frame[idx]).loc[start:end]
+    corr = pairs[rate].corr(pairs[idx], min_periods=3)
+    return {
+        'n': len(pairs),
+        'corr': corr,
+        'beta': pairs[rate].cov(pairs[idx]) / pairs[rate].var() if not np.isnan(corr) else np.nan,
+        'rate_vol': sub[rate].diff().std(),
+        'index_vol': sub[idx].diff().std(),
+        'mean_rolling_corr': rolling.mean(),
+    }
+
+def test_matches_loc_slices(frame):
+    stats = analysis.regime_stats(frame, RATES, IDXS, REGIMES)
+    assert len(stats) == len(REGIMES) * len(RATES) * len(IDXS)
+    for start, end, label in REGIMES:
+        for rate in RATES:
+            for idx in IDXS:
+                row = stats.loc[(label, rate, idx)]
+                expected = expected_stats(frame, rate, idx, start, end)
+                assert row['n'] == expected['n']
+                for stat in analysis.REGIME_STATS[1:]:
+                    np.testing.assert_allclose(row[stat], expected[stat], atol=1e-9, err_msg=f'{label} {stat}')
+
+def test_accepts_interval_frame(frame):
+    table = pd.DataFrame(REGIMES, columns=['start', 'end', 'label'])
+    pd.testing.assert_frame_equal(analysis.regime_stats(frame, RATES, IDXS, table),
+                                  analysis.regime_stats(frame, RATES, IDXS, REGIMES))
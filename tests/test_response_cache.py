@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+import src.files as files
+import src.response_cache as response_cache
+
+class Response:
+    headers = {'ETag': '"1"'}
+
+def job(metric: str) -> dict:
+    return {'source': 'test', 'country': 'US', 'metric': metric, 'url': 'http://test', 'params': None}
+
+def store(body: bytes) -> str:
+    return response_cache.store_body([body[:3], body[3:]])[0]
+
+def tmp_files(directory) -> list:
+    return [name for root, dirs, names in os.walk(directory) for name in names
+            if name.endswith(files.TMP_SUFFIX)]
+
+def test_atomic_write_keeps_old_file_on_failure(workdir):
+    path = str(workdir / 'a' / 'b.json')
+    with files.atomic_write(path, 'w') as f:
+        f.write('old')
+    with pytest.raises(RuntimeError):
+        with files.atomic_write(path, 'w') as f:
+            f.write('partial')
+            raise RuntimeError
+    assert open(path).read() == 'old'
+    assert tmp_files(workdir) == []
+
+def test_store_body(workdir):
+    digest, size = response_cache.store_body([b'date,', b'value\n'])
+    assert size == 11
+    assert response_cache.open_object(digest).read() == b'date,value\n'
+    # identical bodies share the object
+    assert response_cache.store_body([b'date,value\n'])[0] == digest
+    assert tmp_files(workdir) == []
+
+def test_failed_download_leaves_nothing(workdir):
+    def chunks():
+        yield b'date,value\n'
+        raise ConnectionError
+    with pytest.raises(ConnectionError):
+        response_cache.store_body(chunks())
+    assert tmp_files(workdir) == []
+    assert response_cache.records() == []
+
+def test_prune(workdir):
+    first, second, third = store(b'first'), store(b'second'), store(b'third')
+    orphan = store(b'orphan')
+    response_cache.save(job('a'), Response, first, 1, applied=True)
+    record = response_cache.load(job('a'))
+    response_cache.save(job('a'), Response, second, 2, applied=True, record=record)
+    response_cache.save(job('b'), Response, third, 1, applied=False)
+
+    stale = os.path.join(response_cache.CACHE_DIR, 'objects', 'incoming.1.1' + files.TMP_SUFFIX)
+    open(stale, 'w').close()
+    os.utime(stale, (0, 0))
+
+    removed = response_cache.prune()
+    assert (removed['objects'], removed['tmp'], removed['history']) == (1, 1, 0)
+    assert not os.path.exists(response_cache.object_path(orphan))
+    for digest in (first, second, third):
+        assert os.path.exists(response_cache.object_path(digest))
+
+    removed = response_cache.prune(keep=1)
+    assert (removed['objects'], removed['history']) == (1, 1)
+    assert response_cache.load(job('a'))['history'] == [second]
+    assert not os.path.exists(response_cache.object_path(first))
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+import src.analysis as analysis
+
+RATES = ['US', 'UK']
+IDXS = ['Food', 'Energy', 'All Commodities']
+
+def test_matches_pandas_rolling_corr(frame):
+    windows = [12, 36]
+    corrs = analysis.rolling_corrs(frame, RATES, IDXS, windows)
+    for window in windows:
+        for rate in RATES:
+            for idx in IDXS:
+                expected = frame[rate].rolling(window).corr(frame[idx])
+                pd.testing.assert_series_equal(corrs[(window, rate, idx)], expected,
+                                               check_names=False, atol=1e-9)
+
+def test_min_periods(frame):
+    corrs = analysis.rolling_corrs(frame, ['US'], ['Food'], [24], min_periods=12)
+    expected = frame['US'].rolling(24, min_periods=12).corr(frame['Food'])
+    pd.testing.assert_series_equal(corrs[(24, 'US', 'Food')], expected, check_names=False, atol=1e-9)
+
+def test_streaming_matches_batch(frame):
+    x = frame[RATES].to_numpy()
+    y = frame[IDXS].to_numpy()
+    windows = [12, 36]
+    history = 100
+    batch = analysis.rolling_corr_array(x, y, windows)
+
+    # same centring as the batch, so the sums agree
+    stream = analysis.RollingCorr(windows, np.nanmean(x, axis=0), np.nanmean(y, axis=0))
+    for t in range(history):
+        stream.append(x[t], y[t])
+    for t in range(history, len(x)):
+        np.testing.assert_allclose(stream.append(x[t], y[t]), batch[:, t], atol=1e-9)
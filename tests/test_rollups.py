@@ -0,0 +1,39 @@
+import pandas as pd
+
+import src.analysis as analysis
+import src.database as db
+
+SERIES = [('policy interest rate', 'US'), ('global energy index', None), ('global all commodities index', None)]
+
+def assert_rollups_match(metric, country):
+    metric_id = db.get_metric_id(metric)
+    country_id = db.get_country_id(country or 'NULL')
+    raw = db.get_series_by_id(metric_id, country_id)
+    for freq in db.ROLLUPS:
+        pd.testing.assert_series_equal(db.get_rollup(metric_id, country_id, freq), db._rollup(raw, freq),
+                                       check_freq=False, check_names=False, obj=f'{metric} {freq}')
+
+def test_rollups_match_resampling(database):
+    for metric, country in SERIES:
+        assert_rollups_match(metric, country)
+
+def test_incremental_update_matches_rebuild(database):
+    # restate a point in the middle, then extend past the end
+    db.insert_data('US', 'policy interest rate', [
+        {'date': '2005-06-15', 'value': 42.0},
+        {'date': '2010-02-01', 'value': 1.0},
+        {'date': '2010-05-17', 'value': 2.0},
+    ])
+    db.insert_data('NULL', 'global energy index', [{'date': '2003-07-01', 'value': -5.0}])
+    for metric, country in SERIES:
+        assert_rollups_match(metric, country)
+
+def test_aligned_from_rollups_matches_raw(database):
+    # columns with a 'mean' rule are read from the MS rollups
+    series = analysis.ANALYSIS_SERIES
+    aligned = analysis.get_aligned_datas(series, 'MS')
+    raw = db.get_frame([(metric, country) for metric, country, rule in series.values()])
+    raw.columns = list(series)
+    expected = analysis.align(raw, {label: rule for label, (metric, country, rule) in series.items()}, 'MS')
+    expected = expected.reindex(aligned.index)
+    pd.testing.assert_frame_equal(aligned, expected, check_freq=False)
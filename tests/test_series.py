@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+import src.database as db
+
+@pytest.mark.parametrize('backend', ['sqlite', 'parquet'])
+def test_series_are_writable(database, monkeypatch, backend):
+    if backend == 'parquet':
+        pytest.importorskip('pyarrow')
+        db.migrate('sqlite', 'parquet')
+    monkeypatch.setattr(db, 'BACKEND', backend)
+    for _ in range(2): # the second read comes from the series cache
+        s = db.get_series('global energy index')
+        s.iloc[0] = 5
+        s[s > 100] = 100
+        assert s.iloc[0] == 5 and s.max() <= 100
+    # callers' edits don't reach the cache
+    assert db.get_series('global energy index').iloc[0] != 5
+
+    rollup = db.get_series('global energy index', freq='MS')
+    rollup.iloc[0] = 5
+    frame = db.get_frame([('global energy index', None), ('policy interest rate', 'US')])
+    frame.iloc[0, 0] = 5
+
+def test_arrays_stay_zero_copy(database):
+    metric_id = db.get_metric_id('policy interest rate')
+    db.get_series_arrays(metric_id, db.get_country_id('US'))
+    dates, values = db.get_series_arrays(metric_id, db.get_country_id('US'))
+    assert isinstance(values, np.memmap) and not values.flags.writeable
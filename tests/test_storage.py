@@ -0,0 +1,65 @@
+import os
+import numpy as np
+import pytest
+
+import src.database as db
+import src.storage as storage
+
+pytest.importorskip('pyarrow')
+
+@pytest.fixture
+def stores(database, monkeypatch):
+    db.migrate('sqlite', 'parquet')
+    monkeypatch.setattr(db, 'BACKEND', 'parquet')
+    return storage.SQLiteStore(db.connect), storage.ParquetStore(db.PARQUET_DIR)
+
+def assert_same(sqlite, parquet, metric_id, country_id):
+    for a, b in zip(sqlite.arrays(metric_id, country_id), parquet.arrays(metric_id, country_id)):
+        np.testing.assert_array_equal(a, b)
+    for freq in db.ROLLUPS:
+        for a, b in zip(sqlite.rollup(metric_id, country_id, freq), parquet.rollup(metric_id, country_id, freq)):
+            np.testing.assert_array_equal(a, b)
+    assert sqlite.latest(metric_id, country_id) == parquet.latest(metric_id, country_id)
+    assert sqlite.rows(metric_id, country_id, start='2004-01-01', limit=5, offset=2) == \
+        parquet.rows(metric_id, country_id, start='2004-01-01', limit=5, offset=2)
+    assert sqlite.before(metric_id, country_id, '2005-01-01') == parquet.before(metric_id, country_id, '2005-01-01')
+
+def test_migrate_copies_every_series(stores):
+    sqlite, parquet = stores
+    assert sorted(sqlite.series(), key=str) == sorted(parquet.series(), key=str)
+    for metric_id, country_id in sqlite.series():
+        assert_same(sqlite, parquet, metric_id, country_id)
+
+def test_frame(stores):
+    sqlite, parquet = stores
+    keys = sqlite.series()[:4]
+    for freq in (None, 'MS'):
+        for a, b in zip(sqlite.frame(keys, freq), parquet.frame(keys, freq)):
+            np.testing.assert_array_equal(a, b)
+
+def test_ingest_and_watermark_on_parquet(stores):
+    sqlite, parquet = stores
+    db.insert_data('US', 'policy interest rate', [{'date': '2011-03-01', 'value': 3.5}])
+    metric_id, country_id = db.get_metric_id('policy interest rate'), db.get_country_id('US')
+    assert parquet.latest(metric_id, country_id) == [('2011-03-01', 3.5)]
+    # nothing written to data_points: the watermark comes from the store
+    db.update_watermark('US', 'policy interest rate', 'test')
+    assert db.get_watermark('US', 'policy interest rate', 'test')['last_date'] == '2011-03-01'
+
+def test_failed_write_leaves_parquet_files(stores, monkeypatch):
+    sqlite, parquet = stores
+    metric_id, country_id = db.get_metric_id('policy interest rate'), db.get_country_id('US')
+    points = parquet._path(metric_id, country_id)
+    before = open(points, 'rb').read()
+    latest = parquet.latest(metric_id, country_id)
+
+    def fail(*args):
+        raise RuntimeError('version update failed')
+    monkeypatch.setattr(db, '_bump_data_version', fail)
+    with pytest.raises(RuntimeError):
+        db.insert_data('US', 'policy interest rate', [{'date': '2011-03-01', 'value': 3.5}])
+    with pytest.raises(RuntimeError):
+        db.delete_data('US', 'policy interest rate')
+    assert open(points, 'rb').read() == before
+    assert parquet.latest(metric_id, country_id) == latest
+    assert not [name for name in os.listdir(os.path.dirname(points)) if name.endswith('.tmp')]
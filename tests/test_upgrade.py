@@ -0,0 +1,92 @@
+import sqlite3
+
+import pytest
+
+import src.database as db
+
+# the schema and rows the first version of database.py wrote: global series
+# under the string 'NULL', metric names in sources.metric_id
+BASELINE_DDL = [
+    '''CREATE TABLE countries (
+        country_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        country_code TEXT NOT NULL,
+        country_name TEXT NOT NULL,
+        currency_code TEXT NOT NULL
+    )''',
+    '''CREATE TABLE metrics (
+        metric_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        metric_name TEXT NOT NULL,
+        unit TEXT
+    )''',
+    '''CREATE TABLE sources (
+        source_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        country_id INTEGER NOT NULL,
+        metric_id INTEGER NOT NULL,
+        source_name TEXT NOT NULL,
+        source_url TEXT,
+        FOREIGN KEY(country_id) REFERENCES countries(country_id)
+        FOREIGN KEY(metric_id) REFERENCES metrics(metric_id)
+        UNIQUE(country_id, metric_id)
+    )''',
+    '''CREATE TABLE data_points (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        country_id INTEGER,
+        metric_id INTEGER NOT NULL,
+        date DATE NOT NULL,
+        value FLOAT NOT NULL,
+        FOREIGN KEY(country_id) REFERENCES countries(country_id)
+        FOREIGN KEY(metric_id) REFERENCES metrics(metric_id)
+        UNIQUE(country_id, metric_id, date)
+    )''',
+]
+
+@pytest.fixture
+def baseline(workdir, monkeypatch):
+    path = str(workdir / 'baseline.db')
+    conn = sqlite3.connect(path)
+    for ddl in BASELINE_DDL:
+        conn.execute(ddl)
+    conn.executemany('INSERT INTO countries (country_code, country_name, currency_code) VALUES (?, ?, ?)',
+                     [('UK', 'United Kingdom', 'GBP'), ('US', 'United States', 'USD')])
+    conn.executemany('INSERT INTO metrics (metric_name, unit) VALUES (?, ?)',
+                     [('policy interest rate', '%'), ('global energy index', 'Index')])
+    conn.executemany('INSERT INTO sources (country_id, metric_id, source_name, source_url) VALUES (?, ?, ?, ?)',
+                     [(2, 'policy interest rate', 'FRED', None), ('NULL', 'global energy index', 'FRED', None)])
+    dates = [f'2020-{month:02d}-{day:02d}' for month in range(1, 7) for day in (1, 15)]
+    conn.executemany('INSERT INTO data_points (country_id, metric_id, date, value) VALUES (?, ?, ?, ?)',
+                     [(2, 1, date, 1.0 + i / 10) for i, date in enumerate(dates)] +
+                     [('NULL', 2, date, 100.0 + i) for i, date in enumerate(dates)])
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db, 'BACKEND', 'sqlite')
+    monkeypatch.setattr(db, 'DB_PATH', path)
+    db.upgrade()
+    return path
+
+def test_converts_global_series_and_sources(baseline):
+    conn = db.connect()
+    assert conn.execute('SELECT country_id, metric_id FROM sources ORDER BY source_id').fetchall() == \
+        [(2, 1), (None, 2)]
+    assert conn.execute("SELECT COUNT(*) FROM data_points WHERE country_id IS NULL").fetchone()[0] == 12
+    assert conn.execute("SELECT COUNT(*) FROM data_points WHERE typeof(country_id) = 'text'").fetchone()[0] == 0
+    # the new schema: sources.country_id may be NULL
+    not_null = {row[1]: row[3] for row in conn.execute('PRAGMA table_info(sources)')}
+    assert not_null['country_id'] == 0
+
+def test_backfills_versions_and_rollups(baseline):
+    energy = db.get_metric_id('global energy index')
+    assert db.get_data_version(energy, None) == 1
+    assert db.get_data_version(db.get_metric_id('policy interest rate'), db.get_country_id('US')) == 1
+    rollup = db.get_rollup(energy, None, 'MS')
+    assert rollup.index[0].strftime('%Y-%m-%d') == '2020-01-01' and len(rollup) == 6
+
+def test_upgraded_database_works(baseline):
+    # global upserts hit the new unique index rather than adding rows
+    db.insert_data('NULL', 'global energy index', [{'date': '2020-01-01', 'value': 5.0}])
+    s = db.get_series('global energy index')
+    assert len(s) == 12 and s.iloc[0] == 5.0
+    db.check_query_plans()
+    # a second upgrade changes nothing
+    db.upgrade()
+    assert db.get_data_version(db.get_metric_id('global energy index'), None) == 2
@@ -0,0 +1,45 @@
+import sqlite3
+import threading
+
+import src.database as db
+
+def energy():
+    return db.get_metric_id('global energy index'), None
+
+def test_unchanged_versions_are_not_reread(database):
+    db.get_data_versions()
+    statements = []
+    db.connect().set_trace_callback(statements.append)
+    try:
+        db.get_data_versions()
+        db.get_data_versions()
+    finally:
+        db.connect().set_trace_callback(None)
+    assert not any('FROM data_versions' in statement for statement in statements)
+
+def test_commit_that_leaves_the_files_alike(database, monkeypatch):
+    # a commit the files' mtime and size don't show (coarse clocks, a WAL
+    # rewritten in place): stat the database files as they were before it
+    stat = db.os.stat
+    frozen = {path: stat(path) for path in (database, database + '-wal')}
+    monkeypatch.setattr(db.os, 'stat', lambda path, *args, **kwargs:
+                        frozen.get(path) or stat(path, *args, **kwargs))
+    before = db.get_data_versions()[energy()]
+
+    other = sqlite3.connect(database)
+    other.execute('UPDATE data_versions SET version = version + 1 WHERE metric_id = ? AND country_id IS NULL',
+                  (energy()[0],))
+    other.commit()
+    other.close()
+    assert db.get_data_versions()[energy()][0] == before[0] + 1
+
+def test_commit_from_this_and_other_threads(database):
+    version = db.get_data_versions()[energy()][0]
+    db.insert_data('NULL', 'global energy index', [{'date': '2030-01-01', 'value': 1.0}])
+    assert db.get_data_versions()[energy()][0] == version + 1
+
+    thread = threading.Thread(target=db.insert_data,
+                              args=('NULL', 'global energy index', [{'date': '2030-02-01', 'value': 1.0}]))
+    thread.start()
+    thread.join()
+    assert db.get_data_versions()[energy()][0] == version + 2